@@ -0,0 +1,496 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python
+"""
+<Program Name>
+  artifact_table.py
+
+<Started>
+  October 16, 2026
+
+<Copyright>
+  See LICENSE for licensing information.
+
+<Purpose>
+  A compact, read-only mapping of artifact paths to hash dictionaries, used
+  in place of the `materials` and `products` dictionaries of a link.
+
+  A link stores its artifacts as `{<path>: {<algorithm>: <hex digest>}}`,
+  i.e. one string per path, one small dictionary and one hex string per
+  digest, and the same paths again for every table and every link. An
+  `ArtifactTable` instead stores:
+
+    - paths as integer ids, interned in a `PathPool`, which can be shared by
+      the tables of one or more links (e.g. all links of a layout). The pool
+      keeps the UTF-8 encoded paths in one buffer and indexes them with an
+      open addressing hash table of integer arrays.
+    - digests as fixed-size binary rows in one buffer, e.g. 32 bytes per
+      sha256 digest, since all artifacts of a link are usually hashed with
+      the same algorithm(s). The algorithm names are stored once per table.
+      Artifacts that don't fit that pattern are stored as they are.
+
+  Rows are kept sorted by path id, which allows to diff two tables of the
+  same pool in a single merge pass over their path ids, comparing the binary
+  digests (c.f. `ArtifactTable.diff`), i.e. without creating any path or
+  hash dictionary objects.
+
+  The table implements the read-only `Mapping` interface and can be used
+  wherever a link's `materials` or `products` dictionary is expected, e.g. in
+  `create_layout`.
+
+"""
+import re
+import array
+import bisect
+
+from collections.abc import Mapping
+
+import securesystemslib.exceptions
+
+# c.f. `securesystemslib.formats.HASHDICT_SCHEMA`
+_HEX_DIGEST = re.compile(r"[a-fA-F0-9]+\Z")
+# Digests that can be stored as bytes and restored without loss
+_PACKABLE_DIGEST = re.compile(r"(?:[a-f0-9]{2})+\Z")
+
+# Path ids and path hashes are stored as 32 bit integers, i.e. a pool holds
+# up to 2**31 paths
+_ID_TYPE = "i"
+_HASH_TYPE = "I"
+_HASH_MASK = 0xffffffff
+
+# Marks an empty slot in the hash table of a path pool
+_EMPTY = -1
+
+
+class PathPool(object):
+  """Interns artifact paths, i.e. assigns a stable integer id to each distinct
+  path. Paths are stored UTF-8 encoded in a single buffer. """
+  __slots__ = ("_blob", "_offsets", "_hashes", "_slots", "_mask")
+
+  def __init__(self):
+    # Encoded paths, the path with id i is at _blob[_offsets[i]:_offsets[i+1]]
+    self._blob = bytearray()
+    self._offsets = array.array("q", [0])
+    # Truncated hash of each path, to reject most non-matching slots without
+    # decoding
+    self._hashes = array.array(_HASH_TYPE)
+    # Open addressing hash table (linear probing) of path ids
+    self._mask = 1023
+    self._slots = array.array(_ID_TYPE, [_EMPTY]) * (self._mask + 1)
+
+
+  def __len__(self):
+    return len(self._hashes)
+
+
+  def _find(self, path):
+    """Returns a tuple of the hash of the path, the encoded path, and the slot
+    that holds the id of the path or the empty slot where it belongs. """
+    path_hash = hash(path) & _HASH_MASK
+    encoded = path.encode("utf-8", "surrogatepass")
+    slots, hashes, offsets, blob = (self._slots, self._hashes, self._offsets,
+        self._blob)
+    slot = path_hash & self._mask
+    while True:
+      path_id = slots[slot]
+      if path_id == _EMPTY or (hashes[path_id] == path_hash and
+          blob[offsets[path_id]:offsets[path_id + 1]] == encoded):
+        return path_hash, encoded, slot
+      slot = (slot + 1) & self._mask
+
+
+  def lookup(self, path):
+    """Returns the id of passed path or None if it was never interned. """
+    path_id = self._slots[self._find(path)[2]]
+    return None if path_id == _EMPTY else path_id
+
+
+  def intern(self, path):
+    """Returns the id of passed path, assigning a new id if necessary. """
+    path_hash, encoded, slot = self._find(path)
+    path_id = self._slots[slot]
+    if path_id != _EMPTY:
+      return path_id
+
+    path_id = len(self._hashes)
+    self._blob.extend(encoded)
+    self._offsets.append(len(self._blob))
+    self._hashes.append(path_hash)
+    self._slots[slot] = path_id
+
+    # Keep the load factor below 1/2
+    if 2 * len(self._hashes) > self._mask:
+      self._grow()
+
+    return path_id
+
+
+  def _grow(self):
+    """Doubles the size of the hash table and re-inserts all ids. """
+    self._mask = 2 * self._mask + 1
+    slots = array.array(_ID_TYPE, [_EMPTY]) * (self._mask + 1)
+    for path_id, path_hash in enumerate(self._hashes):
+      slot = path_hash & self._mask
+      while slots[slot] != _EMPTY:
+        slot = (slot + 1) & self._mask
+      slots[slot] = path_id
+    self._slots = slots
+
+
+  def path(self, path_id):
+    """Returns the path with passed id. """
+    return self._blob[self._offsets[path_id]:
+        self._offsets[path_id + 1]].decode("utf-8", "surrogatepass")
+
+
+  def __reduce__(self):
+    # Pickle the encoded paths only, the hash table is rebuilt when unpickled,
+    # because string hashes differ between processes
+    return (_unpickle_path_pool, (bytes(self._blob), self._offsets.tobytes()))
+
+
+  def nbytes(self):
+    """Returns the number of bytes used by the buffers of the pool. """
+    return (len(self._blob) + self._offsets.itemsize * len(self._offsets) +
+        self._hashes.itemsize * len(self._hashes) +
+        self._slots.itemsize * len(self._slots))
+
+
+class ArtifactTable(Mapping):
+  """Read-only mapping of artifact paths to hash dictionaries, which is
+  populated with `add`. """
+  __slots__ = ("pool", "_algorithms", "_sizes", "_width", "_ids", "_digests",
+      "_irregular", "_is_sorted")
+
+  def __init__(self, pool=None):
+    # Pass the same pool to tables that are diffed or otherwise compared
+    self.pool = pool if pool is not None else PathPool()
+    # Sorted hash algorithm names, byte size of their digests, and total
+    # byte size of a digest row, determined by the first added artifact
+    self._algorithms = None
+    self._sizes = None
+    self._width = 0
+    # Path id and binary digests of each artifact (row)
+    self._ids = array.array(_ID_TYPE)
+    self._digests = bytearray()
+    # Path ids mapped to the hash dictionaries of artifacts that don't fit
+    # into a row, their row is zero-filled
+    self._irregular = {}
+    self._is_sorted = True
+
+
+  def _pack(self, hash_dict):
+    """Returns the binary digest row for passed hash dict, or None if the
+    hash dict does not fit into a row of this table. """
+    algorithms = tuple(sorted(hash_dict))
+    packable = all(_PACKABLE_DIGEST.match(hash_dict[algorithm])
+        for algorithm in algorithms)
+
+    if self._algorithms is None:
+      if packable:
+        self._algorithms = algorithms
+        self._sizes = tuple(len(hash_dict[algorithm]) // 2
+            for algorithm in algorithms)
+      else:
+        # Rows are empty and all artifacts are irregular
+        self._algorithms = ()
+        self._sizes = ()
+      self._width = sum(self._sizes)
+
+    if not packable or algorithms != self._algorithms:
+      return None
+
+    row = bytearray()
+    for algorithm, size in zip(algorithms, self._sizes):
+      digest = hash_dict[algorithm]
+      if len(digest) != 2 * size:
+        return None
+      row.extend(bytes.fromhex(digest))
+
+    return row
+
+
+  def add(self, path, hash_dict):
+    """Adds or replaces an artifact in the table.
+
+    Args:
+      path: the artifact path
+      hash_dict: a dictionary of hash algorithm names and hex digests
+
+    Raises:
+      securesystemslib.exceptions.FormatError: the passed artifact is invalid
+          (c.f. `securesystemslib.formats.HASHDICT_SCHEMA`)
+    """
+    if not isinstance(path, str):
+      raise securesystemslib.exceptions.FormatError(
+          "Invalid artifact path: {!r}".format(path))
+
+    if not isinstance(hash_dict, dict):
+      raise securesystemslib.exceptions.FormatError(
+          "Invalid hash dict for artifact '{}': {!r}".format(path, hash_dict))
+
+    for algorithm, digest in hash_dict.items():
+      if not (isinstance(algorithm, str) and isinstance(digest, str) and
+          _HEX_DIGEST.match(digest)):
+        raise securesystemslib.exceptions.FormatError(
+            "Invalid hash dict for artifact '{}': {!r}".format(path,
+            hash_dict))
+
+    path_id = self.pool.intern(path)
+    if self._ids and path_id <= self._ids[-1]:
+      self._is_sorted = False
+
+    row = self._pack(hash_dict)
+    if row is None:
+      row = bytes(self._width)
+      self._irregular[path_id] = dict(hash_dict)
+
+    elif path_id in self._irregular:
+      # The artifact was added before (duplicate key) with another hash dict
+      del self._irregular[path_id]
+
+    self._ids.append(path_id)
+    self._digests.extend(row)
+
+
+  def _sort(self):
+    """Sorts the rows by path id, keeping only the last added row of a path,
+    if a path was added more than once. """
+    if self._is_sorted:
+      return
+
+    ids, digests, width = self._ids, self._digests, self._width
+    # NOTE: sorted is stable, i.e. the last row of a path is the last one
+    # among the rows with the same id
+    order = sorted(range(len(ids)), key=ids.__getitem__)
+    sorted_ids = array.array(_ID_TYPE)
+    sorted_digests = bytearray()
+    for position, row in enumerate(order):
+      if position + 1 < len(order) and ids[order[position + 1]] == ids[row]:
+        continue
+      sorted_ids.append(ids[row])
+      sorted_digests.extend(digests[row * width:(row + 1) * width])
+
+    self._ids = sorted_ids
+    self._digests = sorted_digests
+    self._is_sorted = True
+
+
+  def _row(self, path):
+    """Returns the row of the artifact at passed path or None. """
+    path_id = self.pool.lookup(path)
+    if path_id is None:
+      return None
+
+    self._sort()
+    row = bisect.bisect_left(self._ids, path_id)
+    if row < len(self._ids) and self._ids[row] == path_id:
+      return row
+    return None
+
+
+  def _hash_dict(self, row):
+    """Returns the hash dictionary of passed row. """
+    path_id = self._ids[row]
+    if path_id in self._irregular:
+      return dict(self._irregular[path_id])
+
+    hash_dict = {}
+    offset = row * self._width
+    for algorithm, size in zip(self._algorithms, self._sizes):
+      hash_dict[algorithm] = self._digests[offset:offset + size].hex()
+      offset += size
+    return hash_dict
+
+
+  def _digest_key(self, row):
+    """Returns a hashable representation of the hash dict of passed row. """
+    path_id = self._ids[row]
+    if path_id in self._irregular:
+      return hash_dict_key(self._irregular[path_id])
+
+    key = []
+    offset = row * self._width
+    for algorithm, size in zip(self._algorithms, self._sizes):
+      key.append((algorithm, bytes(self._digests[offset:offset + size])))
+      offset += size
+    return tuple(key)
+
+
+  def digest_key(self, path):
+    """Returns a hashable representation of the hash dict of the artifact at
+    passed path, which can be compared with the `digest_key` of another
+    table. """
+    row = self._row(path)
+    if row is None:
+      raise KeyError(path)
+    return self._digest_key(row)
+
+
+  def iter_items(self):
+    """Yields (path, hash dict) tuples of all artifacts sorted by path id,
+    i.e. without looking up each path like `items`. """
+    self._sort()
+    pool = self.pool
+    for row, path_id in enumerate(self._ids):
+      yield pool.path(path_id), self._hash_dict(row)
+
+
+  def iter_digest_keys(self):
+    """Yields (path id, digest key) tuples of all artifacts sorted by path id
+    (c.f. `digest_key`). """
+    self._sort()
+    for row, path_id in enumerate(self._ids):
+      yield path_id, self._digest_key(row)
+
+
+  def ids(self):
+    """Returns the sorted path ids of all artifacts (c.f. `pool`). """
+    self._sort()
+    return self._ids
+
+
+  def diff(self, other):
+    """Returns the ids of the paths of the artifacts that are in both tables
+    with equal hash dicts (unchanged) or with different hash dicts (modified),
+    only in the other table (added) or only in this table (removed), as
+    a tuple of arrays of ids (c.f. `create_layout.changes_between_snapshots`)
+    Both tables must share the same pool. """
+    if other.pool is not self.pool:
+      raise ValueError("Can't diff artifact tables with different path pools")
+
+    self._sort()
+    other._sort()
+    unchanged, modified, added, removed = (array.array(_ID_TYPE)
+        for _ in range(4))
+    ids, other_ids = self._ids, other._ids
+    count, other_count = len(ids), len(other_ids)
+
+    # Digest rows can be compared as bytes, if both tables have the same
+    # row layout and the artifact is regular in both tables
+    same_layout = (self._algorithms == other._algorithms and
+        self._sizes == other._sizes)
+    irregular = self._irregular or other._irregular
+    digests, other_digests, width = self._digests, other._digests, self._width
+
+    row = other_row = 0
+    while row < count and other_row < other_count:
+      path_id = ids[row]
+      other_path_id = other_ids[other_row]
+      if path_id == other_path_id:
+        if same_layout and not (irregular and (path_id in self._irregular or
+            path_id in other._irregular)):
+          same = (digests[row * width:(row + 1) * width] ==
+              other_digests[other_row * width:(other_row + 1) * width])
+        else:
+          same = self._hash_dict(row) == other._hash_dict(other_row)
+
+        (unchanged if same else modified).append(path_id)
+        row += 1
+        other_row += 1
+
+      elif path_id < other_path_id:
+        removed.append(path_id)
+        row += 1
+
+      else:
+        added.append(other_path_id)
+        other_row += 1
+
+    removed.extend(ids[row:])
+    added.extend(other_ids[other_row:])
+
+    return unchanged, modified, added, removed
+
+
+  def sorted_items(self):
+    """Yields (path, hash dict) tuples of all artifacts sorted by path. """
+    self._sort()
+    pool, ids = self.pool, self._ids
+    for row in sorted(range(len(ids)), key=lambda row: pool.path(ids[row])):
+      yield pool.path(ids[row]), self._hash_dict(row)
+
+
+  def nbytes(self):
+    """Returns the number of bytes used by the buffers of the table, not
+    counting the (shared) pool and irregular artifacts. """
+    return self._ids.itemsize * len(self._ids) + len(self._digests)
+
+
+  def __getitem__(self, path):
+    row = self._row(path)
+    if row is None:
+      raise KeyError(path)
+    return self._hash_dict(row)
+
+
+  def __contains__(self, path):
+    return self._row(path) is not None
+
+
+  def __iter__(self):
+    pool = self.pool
+    for path_id in self.ids():
+      yield pool.path(path_id)
+
+
+  def __len__(self):
+    return len(self.ids())
+
+
+  def __reduce__(self):
+    # Pickle the pool by reference, i.e. tables that share a pool, e.g. the
+    # materials and products of the links sent to a worker process in one
+    # task, are unpickled with one shared pool, and can still be diffed by
+    # path id (c.f. `diff`). The pool is pickled once per pickle.
+    self._sort()
+    return (_unpickle_artifact_table, (self.pool, self._algorithms,
+        self._sizes, self._ids.tobytes(), bytes(self._digests),
+        self._irregular))
+
+
+  def __repr__(self):
+    return "<ArtifactTable of {} artifacts>".format(len(self))
+
+
+def _digest_bytes(digest):
+  """Returns passed hex digest as bytes, if it can be restored without loss,
+  or else as it is (c.f. `hash_dict_key`). """
+  if _PACKABLE_DIGEST.match(digest):
+    return bytes.fromhex(digest)
+  return digest
+
+
+def hash_dict_key(hash_dict):
+  """Returns a hashable representation of passed hash dict, which is equal to
+  the `ArtifactTable.digest_key` of an artifact with an equal hash dict. """
+  return tuple((algorithm, _digest_bytes(digest)) for algorithm, digest
+      in sorted(hash_dict.items()))
+
+
+def _unpickle_path_pool(blob, offsets):
+  """Restores a pool pickled with `PathPool.__reduce__`. """
+  pool = PathPool()
+  pool._blob = bytearray(blob)
+  pool._offsets = array.array("q")
+  pool._offsets.frombytes(offsets)
+  pool._hashes = array.array(_HASH_TYPE, (hash(pool.path(path_id)) &
+      _HASH_MASK for path_id in range(len(pool._offsets) - 1)))
+  while 2 * len(pool._hashes) > pool._mask:
+    pool._mask = 2 * pool._mask + 1
+  # Re-inserts all ids into a hash table of the final size
+  pool._mask = (pool._mask - 1) // 2
+  pool._grow()
+  return pool
+
+
+def _unpickle_artifact_table(pool, algorithms, sizes, ids, digests,
+    irregular):
+  """Restores a table pickled with `ArtifactTable.__reduce__`. """
+  table = ArtifactTable(pool)
+  table._algorithms = algorithms
+  table._sizes = sizes
+  table._width = sum(sizes) if sizes else 0
+  table._ids.frombytes(ids)
+  table._digests = bytearray(digests)
+  table._irregular = dict(irregular)
+  return table
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+<Program Name>
+  bench_artifact_table.py
+
+<Started>
+  October 16, 2026
+
+<Copyright>
+  See LICENSE for licensing information.
+
+<Purpose>
+  Compares the memory retained by the materials and products of a large link,
+  if they are loaded as dictionaries (`json.loads`, as done by `Link.read`),
+  and if they are loaded as artifact tables (c.f. `link_stream.read_link` and
+  `artifact_table.ArtifactTable`), and the time it takes to diff them (c.f.
+  `create_layout.changes_between_snapshots`).
+
+  <Usage>
+
+    ```
+    python benchmarks/bench_artifact_table.py --artifacts 1000000
+    ```
+
+"""
+import io
+import os
+import gc
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import create_layout
+import link_stream
+
+
+def _create_link_json(artifact_count):
+  """Returns the JSON of a link, whose products are its materials with a
+  sixth each modified, removed and added. """
+  materials = {}
+  products = {}
+  for idx in range(artifact_count):
+    path = "src/module{}/file{}.py".format(idx % 1000, idx)
+    digest = {"sha256": "{:064x}".format(idx)}
+    materials[path] = digest
+
+    kind = idx % 6
+    if kind < 3:
+      products[path] = digest
+    elif kind == 3:
+      products[path] = {"sha256": "{:064x}".format(idx + artifact_count)}
+    elif kind == 4:
+      products["build/file{}.o".format(idx)] = digest
+
+  return json.dumps({"_type": "link", "name": "step",
+      "materials": materials, "products": products})
+
+
+def _load_dicts(link_json):
+  link_dict = json.loads(link_json)
+  return link_dict["materials"], link_dict["products"]
+
+
+def _load_tables(link_json):
+  link = link_stream.read_link(io.StringIO(link_json))
+  return link.materials, link.products
+
+
+def _measure(load, link_json):
+  """Returns the artifacts loaded with passed function, the bytes they retain
+  and the time it takes to diff them. """
+  gc.collect()
+  tracemalloc.start()
+  artifacts = load(link_json)
+  retained = tracemalloc.get_traced_memory()[0]
+  tracemalloc.stop()
+
+  start = time.perf_counter()
+  create_layout.changes_between_snapshots(*artifacts)
+  return artifacts, retained, time.perf_counter() - start
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__,
+      formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--artifacts", type=int, default=1000000,
+      help="number of materials of the benchmarked link")
+  args = parser.parse_args()
+
+  link_json = _create_link_json(args.artifacts)
+
+  # Measure one variant at a time, i.e. drop the loaded artifacts in between
+  dicts_bytes, dicts_diff = _measure(_load_dicts, link_json)[1:]
+  tables_bytes, tables_diff = _measure(_load_tables, link_json)[1:]
+
+  print("artifacts: {}".format(args.artifacts))
+  print("dicts:  {:8.1f} MiB, diff {:.3f}s".format(dicts_bytes / 2**20,
+      dicts_diff))
+  print("tables: {:8.1f} MiB, diff {:.3f}s".format(tables_bytes / 2**20,
+      tables_diff))
+  print("memory reduction: {:.1f}x".format(dicts_bytes / tables_bytes))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+"""
+<Program Name>
+  bench_link_order.py
+
+<Started>
+  October 16, 2026
+
+<Copyright>
+  See LICENSE for licensing information.
+
+<Purpose>
+  Compares ordering the links stored by the wizard by the steps of the
+  software supply chain with a nested loop over steps and links, and by
+  grouping the links by step name in one pass (c.f.
+  `create_layout.order_link_items`), and measures creating the layout from
+  the ordered links, where each link is parsed exactly once (c.f.
+  `create_layout.create_layout_incrementally`).
+
+  <Usage>
+
+    ```
+    python benchmarks/bench_link_order.py --steps 100 --links 500
+    ```
+
+"""
+import io
+import os
+import sys
+import time
+import hashlib
+import argparse
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import in_toto.models.link
+
+import create_layout
+import link_stream
+
+
+def _create_link_items(step_count, link_count, artifact_count):
+  """Returns the step names and link items (c.f. wizard `ajax_upload_link`)
+  of a supply chain, whose links are distributed round robin over the steps
+  and stored in reverse step order, and the stored links by digest. """
+  step_names = ["step{}".format(idx) for idx in range(step_count)]
+  link_items = []
+  link_strs = {}
+  for idx in reversed(range(link_count)):
+    step_name = step_names[idx % step_count]
+    link_str = repr(in_toto.models.link.Link(name=step_name, products={
+        "{}/file{}".format(step_name, artifact_idx): {
+        "sha256": "{:064x}".format(idx * artifact_count + artifact_idx)}
+        for artifact_idx in range(artifact_count)}))
+    link_digest = hashlib.sha256(link_str.encode("utf-8")).hexdigest()
+    link_strs[link_digest] = link_str
+    link_items.append({"step_name": step_name,
+        "file_name": "{}.{}.link".format(step_name, idx),
+        "link_digest": link_digest})
+
+  return step_names, link_items, link_strs
+
+
+def _order_link_items_nested(step_names, link_items):
+  """Orders the link items like the wizard did before links were grouped by
+  step name. """
+  ordered_items = []
+  for step_name in step_names:
+    for link_item in link_items:
+      if link_item["step_name"] == step_name:
+        ordered_items.append(link_item)
+  return ordered_items
+
+
+def _time(func, *args, repeat=20):
+  """Returns the result and the best time of passed function. """
+  best = None
+  for _ in range(repeat):
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    best = elapsed if best is None else min(best, elapsed)
+  return result, best
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__,
+      formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--steps", type=int, default=100,
+      help="number of steps of the supply chain")
+  parser.add_argument("--links", type=int, default=500,
+      help="number of stored links")
+  parser.add_argument("--artifacts", type=int, default=20,
+      help="number of products per link")
+  args = parser.parse_args()
+
+  step_names, link_items, link_strs = _create_link_items(args.steps,
+      args.links, args.artifacts)
+
+  nested_items, nested_time = _time(_order_link_items_nested, step_names,
+      link_items)
+  grouped_items, grouped_time = _time(create_layout.order_link_items,
+      step_names, link_items)
+  assert nested_items == grouped_items
+
+  parsed_keys = []
+  def _load_link(link_key):
+    parsed_keys.append(link_key)
+    return link_stream.read_link(io.StringIO(link_strs[link_key]))
+
+  link_keys = [link_item["link_digest"] for link_item in grouped_items]
+  start = time.perf_counter()
+  with warnings.catch_warnings():
+    warnings.simplefilter("ignore")
+    layout = create_layout.create_layout_incrementally(link_keys, _load_link,
+        {})
+  layout_time = time.perf_counter() - start
+  assert sorted(parsed_keys) == sorted(set(link_keys))
+
+  print("steps: {}, links: {}".format(args.steps, args.links))
+  print("order nested:  {:8.3f}ms".format(nested_time * 1000))
+  print("order grouped: {:8.3f}ms ({:.0f}x)".format(grouped_time * 1000,
+      nested_time / grouped_time))
+  print("layout: {} steps, {} links parsed, {:.3f}s".format(
+      len(layout.steps), len(parsed_keys), layout_time))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+"""
+<Program Name>
+  bench_session_store.py
+
+<Started>
+  October 16, 2026
+
+<Copyright>
+  See LICENSE for licensing information.
+
+<Purpose>
+  Compares the latency of the wizard pages with the MongoDB, in-memory and
+  SQLite session stores (c.f. session_store.py).
+
+  For each store, `--sessions` sessions walk through the wizard with the
+  Flask test client, i.e. post the vcs, building, qa, package, software
+  supply chain and authorizing pages, and view each page, including the
+  pages that read several subdocuments (software supply chain, authorizing,
+  chaining and wrap up). The reported latency is the median and the 95th
+  percentile per page view or post, in the request thread, i.e. without
+  network and WSGI server overhead.
+
+  The MongoDB store is skipped if there is no `mongod` at `--mongo-uri`.
+
+  <Usage>
+
+    ```
+    python benchmarks/bench_session_store.py --sessions 200
+    python benchmarks/bench_session_store.py --stores memory,sqlite
+    ```
+
+"""
+import os
+import sys
+import time
+import tempfile
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import pymongo
+import pymongo.errors
+
+import wizard
+import session_store
+
+STORES = ["mongo", "memory", "sqlite"]
+
+# (method, path, form data) of the requests of one session, in order
+_REQUESTS = [
+  ("post", "/vcs", {"vcs_cmd[]": ["git clone"], "comment": ""}),
+  ("get", "/vcs", None),
+  ("post", "/building", {"build_cmd[]": ["make"], "comment": ""}),
+  ("get", "/building", None),
+  ("post", "/quality", {"cmd[]": ["make test"], "retval_include[]": ["true"],
+      "retval_operator[]": ["is"], "retval_value[]": ["0"],
+      "stdout_include[]": ["false"], "stdout_operator[]": ["empty"],
+      "stdout_value[]": [""], "stderr_include[]": ["false"],
+      "stderr_operator[]": ["empty"], "stderr_value[]": [""],
+      "comment": ""}),
+  ("get", "/quality", None),
+  ("post", "/packaging", {"cmd[]": ["tar czf"], "comment": ""}),
+  ("get", "/packaging", None),
+  ("get", "/software-supply-chain", None),
+  ("post", "/software-supply-chain", {"step_name[]": ["clone", "build"],
+      "step_cmd[]": ["git clone", "make"], "step_modifies[]": ["true", "true"],
+      "inspection_name[]": [], "inspection_cmd[]": [],
+      "inspection_step_name[]": [], "comment": ""}),
+  ("get", "/software-supply-chain", None),
+  ("get", "/functionaries", None),
+  ("post", "/authorizing", {"step_name[]": ["clone", "build"],
+      "threshold[]": ["1", "1"], "functionary_name_clone[]": ["alice"],
+      "functionary_name_build[]": ["bob"], "comment": ""}),
+  ("get", "/authorizing", None),
+  ("post", "/chaining", {"comment": ""}),
+  ("get", "/chaining", None),
+  ("get", "/wrap-up", None),
+]
+
+
+def _create_store(name, args, tmp_dir):
+  """Returns the session store with passed name, or None if it is not
+  available. """
+  if name == "memory":
+    return session_store.MemorySessionStore(max_sessions=args.sessions)
+
+  if name == "sqlite":
+    return session_store.SQLiteSessionStore(os.path.join(tmp_dir,
+        "sessions.db"))
+
+  client = pymongo.MongoClient(args.mongo_uri, serverSelectionTimeoutMS=2000)
+  try:
+    client.admin.command("ping")
+
+  except pymongo.errors.PyMongoError as e:
+    print("{}: skipped, no mongod at '{}' ({})".format(name, args.mongo_uri,
+        e.__class__.__name__))
+    return None
+
+  collection = client.get_default_database("wizard")["bench_session_store"]
+  collection.drop()
+  return session_store.MongoSessionStore(collection)
+
+
+def _walk(client):
+  """Sends the requests of one session and returns their latencies. """
+  latencies = []
+  for method, path, data in _REQUESTS:
+    start = time.perf_counter()
+    response = getattr(client, method)(path, data=data)
+    latencies.append(time.perf_counter() - start)
+    assert response.status_code in (200, 302), (path, response.status_code)
+
+  return latencies
+
+
+def _percentile(values, percent):
+  values = sorted(values)
+  return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__,
+      formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--sessions", type=int, default=100,
+      help="number of sessions that walk through the wizard per store")
+  parser.add_argument("--stores", default=",".join(STORES),
+      help="comma separated session stores, of: " + ", ".join(STORES))
+  parser.add_argument("--mongo-uri", default=wizard.app.config["MONGO_URI"],
+      help="MongoDB to benchmark the mongo store with")
+  args = parser.parse_args()
+
+  wizard.app.config.update(TESTING=True, DEBUG=False, WTF_CSRF_ENABLED=False)
+
+  print("{} sessions, {} requests per session".format(args.sessions,
+      len(_REQUESTS)))
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    for name in args.stores.split(","):
+      store = _create_store(name, args, tmp_dir)
+      if store is None:
+        continue
+
+      wizard.stored_sessions = store
+      latencies = []
+      start = time.perf_counter()
+      for _ in range(args.sessions):
+        with wizard.app.test_client() as client:
+          latencies.extend(_walk(client))
+      elapsed = time.perf_counter() - start
+
+      print("{:7}  median {:7.3f}ms  p95 {:7.3f}ms  total {:6.2f}s".format(
+          name, _percentile(latencies, 50) * 1000,
+          _percentile(latencies, 95) * 1000, elapsed))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+<Program Name>
+  bench_snapshot_diff.py
+
+<Started>
+  October 16, 2026
+
+<Copyright>
+  See LICENSE for licensing information.
+
+<Purpose>
+  Compares the time it takes to create the material and product rules of a
+  large link, if each rule builder computes the snapshot diff of the link
+  itself, and if the diff is computed once and shared by both builders (c.f.
+  `create_layout.SnapshotDiff`).
+
+  <Usage>
+
+    ```
+    python benchmarks/bench_snapshot_diff.py --artifacts 500000
+    ```
+
+"""
+import os
+import sys
+import time
+import argparse
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import in_toto.models.link
+import create_layout
+
+
+def _create_links(artifact_count):
+  """Returns two consecutive links, where the second step leaves half of its
+  materials unchanged, and modifies, removes and adds a sixth each. """
+  materials = {}
+  products = {}
+  for idx in range(artifact_count):
+    path = "src/module{}/file{}.py".format(idx % 1000, idx)
+    digest = {"sha256": "{:064x}".format(idx)}
+    materials[path] = digest
+
+    kind = idx % 6
+    if kind < 3:
+      products[path] = digest
+    elif kind == 3:
+      products[path] = {"sha256": "{:064x}".format(idx + artifact_count)}
+    elif kind == 4:
+      products["build/file{}.o".format(idx)] = digest
+
+  previous_link = in_toto.models.link.Link(name="previous",
+      products=materials)
+  current_link = in_toto.models.link.Link(name="current",
+      materials=materials, products=products)
+  return previous_link, current_link
+
+
+def _separate_diffs(previous_link, current_link):
+  create_layout.create_material_rules(previous_link, current_link)
+  create_layout.create_product_rules(current_link)
+
+
+def _shared_diff(previous_link, current_link):
+  diff = create_layout.SnapshotDiff.from_link(current_link)
+  create_layout.create_material_rules(previous_link, current_link, diff)
+  create_layout.create_product_rules(current_link, diff)
+
+
+def _best_of(func, args, repeat):
+  timings = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    func(*args)
+    timings.append(time.perf_counter() - start)
+  return min(timings)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__,
+      formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--artifacts", type=int, default=500000,
+      help="number of materials of the benchmarked link")
+  parser.add_argument("--repeat", type=int, default=3,
+      help="number of runs per variant, the best run is reported")
+  args = parser.parse_args()
+
+  links = _create_links(args.artifacts)
+  warnings.simplefilter("ignore")
+
+  separate = _best_of(_separate_diffs, links, args.repeat)
+  shared = _best_of(_shared_diff, links, args.repeat)
+
+  print("artifacts: {}".format(args.artifacts))
+  print("diff per rule builder: {:.3f}s".format(separate))
+  print("shared diff:           {:.3f}s".format(shared))
+  print("speedup:               {:.2f}x".format(separate / shared))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+"""
+<Program Name>
+  bench_suite.py
+
+<Started>
+  October 16, 2026
+
+<Copyright>
+  See LICENSE for licensing information.
+
+<Purpose>
+  Measures wall time and peak RSS of creating, validating and serializing
+  layouts from synthetic link chains of different sizes.
+
+  Each link chain is generated from a seed, i.e. the same for every run. The
+  first link of a chain produces `--artifacts` artifacts at a path depth of
+  `--depth`, each following link consumes the products of its predecessor
+  and leaves them unchanged, modifies, adds or removes them according to the
+  `--churn` ratios.
+
+  Every case, i.e. one operation on one chain, is run in a fresh subprocess,
+  so that the peak RSS of a case is not inflated by earlier cases. The
+  reported peak RSS includes the generated links, which is reported
+  separately as setup RSS. The reported time is the best of `--repeat` runs.
+  Cases are:
+
+    diff              `changes_between_snapshots` of the last link
+    material_rules    `create_material_rules` of the last link
+    product_rules     `create_product_rules` of the last link
+    layout            `create_layout_from_ordered_links`
+    validate          `Layout.validate` of the created layout
+    serialize         `repr` of the created layout wrapped in a Metablock
+    stream            the same as serialize, in chunks with `layout_stream`
+    download          the download path of the wizard, i.e. reading the
+                      stored links with `link_stream`, creating the layout
+                      with `create_layout_incrementally` and streaming it
+    preflight         `preflight.preflight_layout` of the created layout
+
+  Results are written as JSON. Pass the results of an earlier run with
+  `--compare` to print the change per case and fail (exit code 1) if a case
+  got slower or bigger by more than `--threshold`.
+
+  <Usage>
+
+    ```
+    python benchmarks/bench_suite.py --output before.json
+    # ... change create_layout ...
+    python benchmarks/bench_suite.py --output after.json --compare before.json
+
+    # Only some sizes and cases
+    python benchmarks/bench_suite.py --artifacts 1000,10000 --cases diff,layout
+    ```
+
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import resource
+import warnings
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import in_toto.models.link
+import in_toto.models.metadata
+
+import create_layout
+import link_stream
+import layout_stream
+import preflight
+from artifact_table import PathPool
+
+CASES = ["diff", "material_rules", "product_rules", "layout", "validate",
+    "serialize", "stream", "download", "preflight"]
+
+# Files per directory at the deepest level of the generated paths
+_FILES_PER_DIRECTORY = 20
+
+_EXTENSIONS = [".py", ".c", ".h", ".json", ".txt", ".o"]
+
+# Cases that take less time are never reported as time regression
+_MIN_COMPARED_SECONDS = 0.01
+
+
+def _digest(rng):
+  return {"sha256": "{:064x}".format(rng.getrandbits(256))}
+
+
+def _path(index, depth):
+  """Returns a path of `depth` directories for the artifact with passed index,
+  where the directories of each level have up to 10 subdirectories. """
+  directory = index // _FILES_PER_DIRECTORY
+  parts = []
+  for _ in range(depth):
+    parts.append("dir{}".format(directory % 10))
+    directory //= 10
+  parts.append("file{}{}".format(index, _EXTENSIONS[index % len(
+      _EXTENSIONS)]))
+  return "/".join(parts)
+
+
+def generate_links(artifact_count, chain_length, depth, churn, seed):
+  """Returns a list of `chain_length` links, where the first link produces
+  `artifact_count` artifacts and each following link consumes the products
+  of its predecessor, which it leaves unchanged, modifies, or removes, and
+  adds new products, in passed `churn` ratios (unchanged, modified, added,
+  removed), relative to the number of materials. """
+  rng = random.Random(seed)
+  unchanged_ratio, modified_ratio, added_ratio, _ = churn
+  next_index = 0
+  products = {}
+  for _ in range(artifact_count):
+    products[_path(next_index, depth)] = _digest(rng)
+    next_index += 1
+
+  links = [in_toto.models.link.Link(name="step0", command=["generate"],
+      products=products)]
+  for position in range(1, chain_length):
+    materials = products
+    products = {}
+    for path, hash_dict in materials.items():
+      choice = rng.random()
+      if choice < unchanged_ratio:
+        products[path] = hash_dict
+      elif choice < unchanged_ratio + modified_ratio:
+        products[path] = _digest(rng)
+      # else: removed
+
+    for _ in range(int(len(materials) * added_ratio)):
+      products[_path(next_index, depth)] = _digest(rng)
+      next_index += 1
+
+    links.append(in_toto.models.link.Link(name="step{}".format(position),
+        command=["build", str(position)], materials=materials,
+        products=products))
+
+  return links
+
+
+def _max_rss_kb():
+  """Returns the peak RSS of this process in KiB. """
+  max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # ru_maxrss is in bytes on macOS and in KiB elsewhere
+  if sys.platform == "darwin":
+    max_rss //= 1024
+  return max_rss
+
+
+def _prepare(case, links):
+  """Returns a function that runs passed case on passed links, doing all
+  work that is not measured beforehand. """
+  previous_link, link = links[-2], links[-1]
+
+  if case == "diff":
+    return lambda: create_layout.changes_between_snapshots(link.materials,
+        link.products)
+
+  if case == "material_rules":
+    return lambda: create_layout.create_material_rules(previous_link, link)
+
+  if case == "product_rules":
+    return lambda: create_layout.create_product_rules(link)
+
+  if case == "layout":
+    return lambda: create_layout.create_layout_from_ordered_links(links)
+
+  layout = create_layout.create_layout_from_ordered_links(links)
+  if case == "validate":
+    return layout.validate
+
+  # NOTE: Creating a Metablock validates the layout (c.f. validate)
+  metablock = in_toto.models.metadata.Metablock(signed=layout)
+  if case == "serialize":
+    return lambda: repr(metablock)
+
+  if case == "stream":
+    def _stream():
+      for _ in layout_stream.iter_metablock_json(metablock):
+        pass
+    return _stream
+
+  if case == "preflight":
+    links_by_name = {link.name: link for link in links}
+    return lambda: preflight.preflight_layout(layout, links_by_name)
+
+  if case == "download":
+    link_strs = [repr(link) for link in links]
+    del links[:], layout
+    def _download():
+      pool = PathPool()
+      layout = create_layout.create_layout_incrementally(
+          list(range(len(link_strs))), lambda key: link_stream.read_link(
+          io.StringIO(link_strs[key]), pool=pool), {})
+      for _ in layout_stream.iter_metablock_json(
+          in_toto.models.metadata.Metablock(signed=layout)):
+        pass
+    return _download
+
+  raise ValueError("Unknown case '{}'".format(case))
+
+
+def run_case(params):
+  """Runs one case in this process and returns its measurements. """
+  links = generate_links(params["artifacts"], params["chain_length"],
+      params["depth"], params["churn"], params["seed"])
+  warnings.simplefilter("ignore")
+
+  func = _prepare(params["case"], links)
+  del links
+  setup_rss = _max_rss_kb()
+
+  timings = []
+  for _ in range(params["repeat"]):
+    start = time.perf_counter()
+    func()
+    timings.append(time.perf_counter() - start)
+
+  return dict(params, seconds=min(timings), setup_rss_kb=setup_rss,
+      peak_rss_kb=_max_rss_kb())
+
+
+def _case_id(result):
+  return "{case}/{artifacts}x{chain_length}".format(**result)
+
+
+def compare(results, previous_results, threshold):
+  """Prints the change of time and peak RSS per case, compared to previous
+  results, and returns the ids of the cases that regressed by more than
+  passed threshold ratio. """
+  previous = {_case_id(result): result for result in previous_results}
+  regressions = []
+  print("\n{:<32} {:>10} {:>10}".format("case", "time", "peak rss"))
+  for result in results:
+    case_id = _case_id(result)
+    if case_id not in previous:
+      continue
+
+    time_ratio = result["seconds"] / max(previous[case_id]["seconds"], 1e-9)
+    rss_ratio = result["peak_rss_kb"] / float(previous[case_id]["peak_rss_kb"])
+    # Timings of very short cases are mostly noise
+    regressed = (time_ratio > threshold and
+        result["seconds"] >= _MIN_COMPARED_SECONDS) or rss_ratio > threshold
+    if regressed:
+      regressions.append(case_id)
+    print("{:<32} {:>9.2f}x {:>9.2f}x{}".format(case_id, time_ratio,
+        rss_ratio, "  REGRESSION" if regressed else ""))
+
+  return regressions
+
+
+def _int_list(value):
+  return [int(item) for item in value.split(",")]
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__,
+      formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--artifacts", type=_int_list,
+      default=[1000, 10000, 100000, 1000000],
+      help="comma separated numbers of artifacts of the first link")
+  parser.add_argument("--chain-lengths", type=_int_list, default=[2, 5],
+      help="comma separated numbers of links per chain")
+  parser.add_argument("--depth", type=int, default=4,
+      help="number of directories in the path of each artifact")
+  parser.add_argument("--churn", type=lambda value: [float(item)
+      for item in value.split(",")], default=[0.85, 0.1, 0.05, 0.05],
+      help="ratios of unchanged, modified, added and removed artifacts per"
+      " step, relative to the materials of the step")
+  parser.add_argument("--cases", type=lambda value: value.split(","),
+      default=CASES, help="comma separated cases, default: all")
+  parser.add_argument("--repeat", type=int, default=3,
+      help="number of runs per case, the best run is reported")
+  parser.add_argument("--seed", type=int, default=0)
+  parser.add_argument("--output", default="bench_results.json",
+      help="file to write the results to")
+  parser.add_argument("--compare", metavar="PREVIOUS",
+      help="results of an earlier run to compare with")
+  parser.add_argument("--threshold", type=float, default=1.2,
+      help="ratio of time or peak RSS that counts as regression")
+  parser.add_argument("--run-case", help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  # Worker mode, i.e. run a single case and report its result on stdout
+  if args.run_case:
+    json.dump(run_case(json.loads(args.run_case)), sys.stdout)
+    return 0
+
+  if len(args.churn) != 4 or abs(args.churn[0] + args.churn[1] +
+      args.churn[3] - 1) > 1e-6:
+    parser.error("--churn must be four ratios, where unchanged, modified and"
+        " removed add up to 1")
+  unknown_cases = set(args.cases).difference(CASES)
+  if unknown_cases:
+    parser.error("unknown cases: {}".format(", ".join(sorted(unknown_cases))))
+
+  results = []
+  for artifact_count in args.artifacts:
+    for chain_length in args.chain_lengths:
+      for case in args.cases:
+        params = {"case": case, "artifacts": artifact_count,
+            "chain_length": max(chain_length, 2), "depth": args.depth,
+            "churn": args.churn, "seed": args.seed, "repeat": args.repeat}
+        output = subprocess.run([sys.executable, os.path.abspath(__file__),
+            "--run-case", json.dumps(params)], stdout=subprocess.PIPE,
+            check=True).stdout
+        result = json.loads(output.decode("utf-8"))
+        results.append(result)
+        print("{:<32} {:>9.3f}s {:>9.1f} MiB (setup {:.1f} MiB)".format(
+            _case_id(result), result["seconds"],
+            result["peak_rss_kb"] / 1024., result["setup_rss_kb"] / 1024.))
+        sys.stdout.flush()
+
+  with open(args.output, "w") as output_file:
+    json.dump({
+      "python": platform.python_version(),
+      "platform": platform.platform(),
+      "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+      "results": results,
+    }, output_file, indent=1, sort_keys=True)
+
+  if args.compare:
+    with open(args.compare) as previous_file:
+      previous_results = json.load(previous_file)["results"]
+    if compare(results, previous_results, args.threshold):
+      return 1
+
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
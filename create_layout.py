@@ -51,6 +51,10 @@
       ELSE
         expected_materials: [["MATCH", "*", "WITH", "PRODUCTS", "FROM", <PREVIOUS STEP>]
 
+      Materials that were produced with the same digest by an earlier step
+      are MATCHed with the products of the last such step instead (c.f.
+      `ProducerIndex`).
+
 
     ** expected_products **
 
@@ -61,6 +65,14 @@
         expected_products: [["ALLOW", "*"]]
 
 
+  ** Rule compression (optional) **
+    Per-artifact rules of a directory, whose artifacts all have the same
+    sequence of rules, are collapsed into one `<dir>/*` rule per rule of the
+    sequence (c.f. `compress_rules`), e.g.:
+
+      [["ALLOW", "src/a.py"], ["ALLOW", "src/b.py"]] -> [["ALLOW", "src/*"]]
+
+
   ** Ideas for more complexity: **
     - explicitly, ALLOW or MATCH files by name instead of "*", e.g.:
       expected_materials = \
@@ -84,13 +96,77 @@
     layout = create_layout_from_ordered_links(links)
     layout.dump()
 
+
+    # Links with many artifacts can be read incrementally instead (c.f.
+    # link_stream.py)
+
+    links = []
+    for LINK_PATH in LINK_PATHS:
+      with open(LINK_PATH, "rb") as link_file:
+        links.append(link_stream.read_link_metadata(link_file))
+
+    layout = create_layout_from_ordered_links(links)
+
+    ```
+
+    Or use the command line to create one layout per project from link
+    directories or tar archives of link files, e.g. in CI:
+
+    ```
+    python -m create_layout --steps clone,build,package \
+        --output-dir layouts/ links/project-a/ links/project-b.tar.gz
+
     ```
 
 """
 import os
+import re
+import sys
+import time
+import heapq
+import logging
+import tarfile
+import argparse
 import warnings
+import collections
+import concurrent.futures
 import in_toto.models.link
 import in_toto.models.layout
+import in_toto.models.metadata
+
+import link_stream
+import layout_stream
+from artifact_table import ArtifactTable, PathPool, hash_dict_key
+
+LOG = logging.getLogger(__name__)
+
+# Rule types that `compress_rules` may collapse into directory patterns, i.e.
+# rules that consume the artifacts matched by their pattern one by one
+COMPRESSIBLE_RULE_TYPES = {"MATCH", "ALLOW", "MODIFY", "CREATE", "DELETE"}
+
+# Characters that have a special meaning in artifact rule patterns (c.f.
+# fnmatch), directories with such characters in their path are never collapsed
+_PATTERN_CHARS = re.compile(r"[*?\[\]]")
+
+# Minimum number of artifacts (materials and products) of the steps that are
+# sent to a worker process at once (c.f. `create_layout_from_ordered_links`).
+# Pickling artifacts to and rules from a worker is not much cheaper than
+# creating the rules, hence small steps are batched and small layouts are not
+# sent to workers at all.
+MIN_ARTIFACTS_PER_TASK = 50000
+
+# The parts of a link needed to create the rules of its step, and the parts
+# of the previous link needed to create MATCH rules.
+_StepLink = collections.namedtuple("_StepLink",
+    ["name", "command", "materials", "products"])
+_PreviousStepLink = collections.namedtuple("_PreviousStepLink",
+    ["name", "products"])
+
+# The parts of a link needed to resolve the producers of the materials of
+# its step and of the following steps (c.f. `create_layout_incrementally`),
+# i.e. its materials and products as artifact tables
+_LinkIndex = collections.namedtuple("_LinkIndex",
+    ["name", "materials", "products"])
 
 def changes_between_snapshots(before_dict, after_dict):
   """Given two 'snapshots' of an artifacts structure -- 'before' and 'after' --
@@ -99,6 +175,15 @@ def changes_between_snapshots(before_dict, after_dict):
   these dictionaries have artifact names as the keys and their hashes as the
   values."""
 
+  # Artifact tables of the same pool are diffed by path id and binary digest
+  # (c.f. artifact_table.py)
+  if (isinstance(before_dict, ArtifactTable) and
+      isinstance(after_dict, ArtifactTable) and
+      before_dict.pool is after_dict.pool):
+    pool = before_dict.pool
+    return tuple({pool.path(path_id) for path_id in path_ids}
+        for path_ids in before_dict.diff(after_dict))
+
   before_set = set(before_dict.keys())
   after_set = set(after_dict.keys())
 
@@ -116,11 +201,120 @@ def changes_between_snapshots(before_dict, after_dict):
   return (unchanged_artifacts, modified_artifacts, added_artifacts,
       removed_artifacts)
 
-def create_material_rules(previous_link, current_link):
+class SnapshotDiff(object):
+  """The changes between the materials and the products of a link, i.e. the
+  sets of unchanged, modified, added and removed artifacts (c.f.
+  `changes_between_snapshots`).
+
+  The diff of a link is needed by both the material and the product rule
+  builder. Computing it once and passing it to both halves the work per step.
+  Sorted artifact lists are computed on first use and memoized as well. """
+  __slots__ = ("unchanged", "modified", "added", "removed", "_sorted")
+
+  def __init__(self, before_dict, after_dict):
+    (self.unchanged, self.modified, self.added,
+        self.removed) = changes_between_snapshots(before_dict, after_dict)
+    self._sorted = {}
+
+
+  @classmethod
+  def from_link(cls, link):
+    """Returns the diff between the materials and products of passed link. """
+    return cls(link.materials, link.products)
+
+
+  def sorted(self, kind):
+    """Returns a sorted list of the artifacts of passed kind, i.e. one of
+    "unchanged", "modified", "added" or "removed". """
+    if kind not in self._sorted:
+      self._sorted[kind] = sorted(getattr(self, kind))
+    return self._sorted[kind]
+
+
+class ProducerIndex(object):
+  """Inverted index of the products of the links of a layout, which maps each
+  (path, digest) of a product to the name of the link that produced it last,
+  i.e. links must be added in the order of their steps.
+
+  The index allows to MATCH each material of a step with the products of the
+  step that actually produced it, including steps before the previous step,
+  with one lookup per material. Paths are stored as ids of a path pool (c.f.
+  artifact_table.py), i.e. the pool of the first added artifact table, which
+  is usually shared by all links of the layout. """
+  __slots__ = ("_pool", "_producers")
+
+  def __init__(self):
+    self._pool = None
+    self._producers = {}
+
+
+  def _iter_keys(self, artifacts, intern):
+    """Yields (path id, digest key) tuples of passed artifacts, where path ids
+    are ids of the pool of the index. Paths that are not in the pool are
+    interned if `intern` is True, or else skipped. """
+    if isinstance(artifacts, ArtifactTable):
+      if artifacts.pool is self._pool:
+        for item in artifacts.iter_digest_keys():
+          yield item
+        return
+
+      items = ((artifacts.pool.path(path_id), digest_key)
+          for path_id, digest_key in artifacts.iter_digest_keys())
+
+    else:
+      items = ((path, hash_dict_key(hash_dict))
+          for path, hash_dict in artifacts.items())
+
+    get_id = self._pool.intern if intern else self._pool.lookup
+    for path, digest_key in items:
+      path_id = get_id(path)
+      if path_id is not None:
+        yield path_id, digest_key
+
+
+  def add_products(self, link):
+    """Records passed link as the producer of its products. """
+    if self._pool is None:
+      self._pool = (link.products.pool
+          if isinstance(link.products, ArtifactTable) else PathPool())
+
+    for key in self._iter_keys(link.products, True):
+      self._producers[key] = link.name
+
+
+  def resolve(self, link):
+    """Returns a dictionary of the paths of the materials of passed link that
+    were produced with the same digest by an added link, and the name of the
+    last such link. """
+    producers = {}
+    if self._pool is None:
+      return producers
+
+    for key in self._iter_keys(link.materials, False):
+      name = self._producers.get(key)
+      if name is not None:
+        producers[self._pool.path(key[0])] = name
+
+    return producers
+
+
+def _resolve_producers(links):
+  """Yields the producers of the materials of each of passed ordered links
+  (c.f. `ProducerIndex.resolve`). """
+  index = ProducerIndex()
+  for link in links:
+    yield index.resolve(link)
+    index.add_products(link)
+
+
+def create_material_rules(previous_link, current_link, diff=None,
+    compress=False, producers=None):
   """Create generic material rules
 
-  - MATCH available materials with products from previous step (links must be
-      an ordered list) and
+  - MATCH available materials with products from the step that last produced
+      them with the same digest, if `producers` are passed, or else (and for
+      materials without such producer) with products from previous step
+      (links must be an ordered list) and
   - ALLOW available materials if it is the first step in the list
   - DELETE removed materials
 
@@ -129,44 +323,78 @@ def create_material_rules(previous_link, current_link):
         and products
     current link: a link of current step, including current step's materials
         and products
+    diff: (optional) the SnapshotDiff of the current link, if it was already
+        computed, e.g. for `create_product_rules`, or an ExternalSnapshotDiff
+        (c.f. external_diff.py)
+    compress: (optional) if True, collapse rules into directory rules where
+        possible (c.f. `compress_rules`)
+    producers: (optional) a dictionary of material paths and the names of
+        the steps that produced them (c.f. `ProducerIndex.resolve`)
 
   Returns:
     a list of material rules
   """
+  if diff is None:
+    diff = SnapshotDiff.from_link(current_link)
 
   expected_materials_rules = []
-  unchanged_artifacts, modified_artifacts, _, deleted_artifacts = \
-      changes_between_snapshots(current_link.materials, current_link.products)
-  previous_link_products = previous_link.products if previous_link else []
-
-  # If there was a previous step, add MATCH rules for all materials that were
-  # products in the previous step
-  for artifact in sorted(set(current_link.materials).intersection(
-      previous_link_products)):
-    expected_materials_rules.append(
-        ["MATCH", artifact, "WITH", "PRODUCTS", "FROM", previous_link.name])
+  previous_link_products = previous_link.products if previous_link else {}
+  if producers is None:
+    producers = {}
+
+  def _producer(artifact):
+    """Returns the name of the step to MATCH passed material with, i.e. the
+    step that produced it or else the previous step, or None. """
+    producer = producers.get(artifact)
+    if producer is None and artifact in previous_link_products:
+      producer = previous_link.name
+    return producer
+
+  # NOTE: The materials are the unchanged, modified and removed artifacts.
+  # They are consumed as sorted streams, which a diff on disk reads lazily
+  # (c.f. external_diff.py).
+
+  # Add MATCH rules for all materials that were produced by an earlier step,
+  # or else, if there was a previous step, that were products in the previous
+  # step
+  for artifact in heapq.merge(diff.sorted("unchanged"),
+      diff.sorted("modified"), diff.sorted("removed")):
+    producer = _producer(artifact)
+    if producer is not None:
+      expected_materials_rules.append(["MATCH", artifact, "WITH", "PRODUCTS",
+          "FROM", producer])
 
   # Add DELETE rules for all deleted artifacts
-  for artifact in sorted(deleted_artifacts):
+  moot_delete_rule = False
+  for artifact in diff.sorted("removed"):
     expected_materials_rules.append(["DELETE", artifact])
+    moot_delete_rule = moot_delete_rule or _producer(artifact) is not None
   # Warn for any delete rule that has no effect because of a previous match
   # rule
-  if deleted_artifacts.intersection(previous_link_products):
+  if moot_delete_rule:
     warnings.warn("DELETE rule is moot because of the previous MATCH rule."
         " Only the first rule for a given artifact has an effect")
 
   # Add ALLOW rules for all remaining materials
-  for artifact in sorted(set(current_link.materials).difference(
-      previous_link_products).difference(deleted_artifacts)):
-    expected_materials_rules.append(["ALLOW", artifact])
+  for artifact in heapq.merge(diff.sorted("unchanged"),
+      diff.sorted("modified")):
+    if _producer(artifact) is None:
+      expected_materials_rules.append(["ALLOW", artifact])
 
   # Add DISALLOW rules for all other artifacts
   expected_materials_rules.append(["DISALLOW", "*"])
 
+  if compress:
+    compressed_rules = compress_rules(expected_materials_rules)
+    LOG.info("Compressed %d material rules of step '%s' to %d",
+        len(expected_materials_rules), current_link.name,
+        len(compressed_rules))
+    expected_materials_rules = compressed_rules
+
   return expected_materials_rules
 
 
-def create_product_rules(current_link):
+def create_product_rules(current_link, diff=None, compress=False):
   """Create generic product rules
 
   - ALLOW available products
@@ -177,48 +405,545 @@ def create_product_rules(current_link):
   Args:
     current_link: a link of current step, including current step's materials
         and products
+    diff: (optional) the SnapshotDiff of the current link, if it was already
+        computed, e.g. for `create_material_rules`, or an ExternalSnapshotDiff
+        (c.f. external_diff.py)
+    compress: (optional) if True, collapse rules into directory rules where
+        possible (c.f. `compress_rules`)
 
   Returns:
     a list of product rules
   """
+  if diff is None:
+    diff = SnapshotDiff.from_link(current_link)
 
   expected_products_rules = []
   # Deleted artifacts won't show up in the product queue
-  unchanged_artifacts, modified_artifacts, added_artifacts, _ = \
-      changes_between_snapshots(current_link.materials, current_link.products)
-
-  for artifact in sorted(unchanged_artifacts):
+  for artifact in diff.sorted("unchanged"):
     # ALLOW unchanged artifacts
     expected_products_rules.append(["ALLOW", artifact])
-  for artifact in sorted(modified_artifacts):
+  for artifact in diff.sorted("modified"):
     # MODIFY modified artifacts
     expected_products_rules.append(["MODIFY", artifact])
-  for artifact in sorted(added_artifacts):
+  for artifact in diff.sorted("added"):
     # CREATE added artifacts
     expected_products_rules.append(["CREATE", artifact])
   # DISALLOW everything else
   expected_products_rules.append(["DISALLOW", "*"])
 
+  if compress:
+    compressed_rules = compress_rules(expected_products_rules)
+    LOG.info("Compressed %d product rules of step '%s' to %d",
+        len(expected_products_rules), current_link.name,
+        len(compressed_rules))
+    expected_products_rules = compressed_rules
+
   return expected_products_rules
 
 
-def create_layout_from_ordered_links(links):
+def compress_rules(rules):
+  """Collapses the per-artifact rules of a rule list into directory rules,
+  e.g. [["ALLOW", "src/a.py"], ["ALLOW", "src/b.py"]] into
+  [["ALLOW", "src/*"]], whenever this does not change which rule consumes
+  which artifact.
+
+  The passed rules must be as returned by the rule builders, i.e. there is a
+  rule for every material (or product) of the step, rules of the same kind
+  are adjacent, and all other artifacts are handled by the trailing rules,
+  e.g. ["DISALLOW", "*"]. Hence the artifacts named in the rules are all
+  artifacts the rules are verified against, and a directory whose artifacts
+  all have the same sequence of kinds of rules (e.g. MATCH ... FROM <same
+  step>, DELETE) can be replaced by one `<dir>/*` rule per kind.
+
+  NOTE: A later rule for an artifact is not moot, e.g. a MATCH rule does not
+  consume a removed material whose digest differs from the product of the
+  step it is matched with, which is then consumed by the DELETE rule. Hence
+  all rules of an artifact are kept.
+
+  NOTE: A directory rule also matches artifacts that are added to the
+  directory later on, i.e. compressed rules are less strict about artifacts
+  that were not recorded in the link.
+
+  Args:
+    rules: a list of material or product rules
+
+  Returns:
+    a new list of rules, grouped by kind of rule in the order of the passed
+    rules
+  """
+  # Kinds of rules, i.e. the rule without the pattern, in order of appearance
+  kinds = []
+  # Artifact paths mapped to the kinds of all rules for them, in order
+  artifact_kinds = collections.defaultdict(tuple)
+  trailing_rules = []
+  for rule in rules:
+    if rule[0] not in COMPRESSIBLE_RULE_TYPES:
+      trailing_rules.append(rule)
+      continue
+
+    kind = (rule[0],) + tuple(rule[2:])
+    if kind not in kinds:
+      kinds.append(kind)
+    artifact_kinds[rule[1]] += (kind,)
+
+  # Walk the directory tree of all artifacts and record for each directory
+  # the number of artifacts in it (recursively) and the sequence of kinds of
+  # rules for them, or None if they have different sequences
+  directories = {}
+  for path, sequence in artifact_kinds.items():
+    parts = path.split("/")
+    for depth in range(1, len(parts)):
+      directory = "/".join(parts[:depth])
+      count, directory_sequence = directories.get(directory, (0, sequence))
+      directories[directory] = (count + 1,
+          directory_sequence if directory_sequence == sequence else None)
+
+  # Replace each artifact with its outermost directory that only contains
+  # artifacts with the same sequence. Directories with a single artifact are
+  # kept as they are, because a pattern is not shorter than the artifact path.
+  patterns_by_kind = {kind: set() for kind in kinds}
+  for path, sequence in artifact_kinds.items():
+    pattern = path
+    parts = path.split("/")
+    for depth in range(1, len(parts)):
+      directory = "/".join(parts[:depth])
+      count, directory_sequence = directories[directory]
+      if (directory_sequence is not None and count > 1 and
+          not _PATTERN_CHARS.search(directory)):
+        pattern = directory + "/*"
+        break
+    for kind in sequence:
+      patterns_by_kind[kind].add(pattern)
+
+  compressed_rules = []
+  for kind in kinds:
+    for pattern in sorted(patterns_by_kind[kind]):
+      compressed_rules.append([kind[0], pattern] + list(kind[1:]))
+
+  return compressed_rules + trailing_rules
+
+
+def _create_steps_rules(previous_link, links, producers, compress):
+  """Returns a list of (expected_materials, expected_products) tuples for
+  passed consecutive links, where `previous_link` is the link preceding the
+  first of the passed links or None, and `producers` are the producers of the
+  materials of each link (c.f. `ProducerIndex.resolve`). Module level function
+  to be callable in a worker process. """
+  steps_rules = []
+  for link, link_producers in zip(links, producers):
+    # Compute the changes between materials and products only once per step
+    diff = SnapshotDiff.from_link(link)
+    steps_rules.append((
+        create_material_rules(previous_link, link, diff, compress,
+            link_producers),
+        create_product_rules(link, diff, compress)))
+    previous_link = link
+
+  return steps_rules
+
+
+def _split_steps(links, task_count):
+  """Splits passed links into batches of consecutive links with about the
+  same number of artifacts, aiming for `task_count` batches of at least
+  MIN_ARTIFACTS_PER_TASK artifacts each. Returns a list of
+  (previous_link, links, producers) tuples (c.f. `_create_steps_rules`),
+  where the previous link only carries the product paths needed for MATCH
+  rules. The producers of all materials are resolved here, i.e. in a single
+  pass over all links. """
+  sizes = [len(link.materials) + len(link.products) for link in links]
+  producers = _resolve_producers(links)
+  task_size = max(sum(sizes) / float(task_count), MIN_ARTIFACTS_PER_TASK)
+
+  tasks = []
+  start = 0
+  batch_size = 0
+  for index, size in enumerate(sizes):
+    batch_size += size
+    if batch_size >= task_size or index == len(links) - 1:
+      previous_link = None
+      if start:
+        previous_link = _PreviousStepLink(links[start - 1].name,
+            frozenset(links[start - 1].products))
+
+      tasks.append((previous_link, [_StepLink(link.name, link.command,
+          link.materials, link.products) for link in links[start:index + 1]],
+          [next(producers) for _ in range(start, index + 1)]))
+      start = index + 1
+      batch_size = 0
+
+  return tasks
+
+
+def create_layout_from_ordered_links(links, compress=False, executor=None):
   """Creates basic in-toto layout from an ordered list of in-toto link objects,
   inferring material and product rules from the materials and products of the
-  passed links. """
+  passed links. Instead of in-toto Link objects the list may also contain
+  links read with `link_stream`, whose materials and products are compact
+  artifact tables.
+
+  Materials are MATCHed with the products of the step that last produced
+  them with the same digest, as found in an inverted index of the products
+  of all steps (c.f. `ProducerIndex`), or else with the products of the
+  previous step.
+
+  If `compress` is True, per-artifact rules are collapsed into directory
+  rules where possible (c.f. `compress_rules`). The rule counts before and
+  after compression are logged (INFO) per step.
+
+  If an `executor` (e.g. a `concurrent.futures.ProcessPoolExecutor`) is
+  passed, the rules are created in batches of consecutive steps on the
+  executor. The steps are split into batches of similar artifact counts, but
+  not smaller than MIN_ARTIFACTS_PER_TASK artifacts, and only the product
+  paths of the link preceding a batch are sent along. If all steps fit into
+  one batch, the rules are created in the calling process. The producers of
+  the materials are always resolved in the calling process. The order of the
+  steps and rules is the same as without executor. """
   # Create an empty layout
   layout = in_toto.models.layout.Layout()
   layout.keys = {}
 
-  for index, link in enumerate(links):
-    step_name = link.name
-    previous_link = None if index == 0 else links[index-1]
-    current_link = link
-    step = in_toto.models.layout.Step(name=step_name,
-      expected_materials=create_material_rules(previous_link, current_link),
-      expected_products=create_product_rules(current_link),
+  tasks = None
+  if executor is not None and links:
+    tasks = _split_steps(links, 2 * (os.cpu_count() or 1))
+
+  if tasks and len(tasks) > 1:
+    previous_links, batches, producers = zip(*tasks)
+    steps_rules = []
+    for batch_rules in executor.map(_create_steps_rules, previous_links,
+        batches, producers, [compress] * len(tasks)):
+      steps_rules.extend(batch_rules)
+
+  else:
+    steps_rules = _create_steps_rules(None, links, _resolve_producers(links),
+        compress)
+
+  for link, (expected_materials, expected_products) in zip(links,
+      steps_rules):
+    step = in_toto.models.layout.Step(name=link.name,
+      expected_materials=expected_materials,
+      expected_products=expected_products,
       expected_command=link.command)
 
     layout.steps.append(step)
 
   return layout
+
+
+def order_link_items(step_names, link_items):
+  """Returns passed link items, i.e. dicts with a "step_name", e.g. as stored
+  by the wizard, in the order of passed step names. Items of the same step
+  keep their order, items of steps that are not listed are omitted.
+
+  The items are grouped by step name in one pass, i.e. ordering takes time
+  proportional to the number of steps plus items rather than to their
+  product. """
+  items_by_step = collections.defaultdict(list)
+  for link_item in link_items:
+    items_by_step[link_item["step_name"]].append(link_item)
+
+  ordered_items = []
+  for step_name in step_names:
+    ordered_items.extend(items_by_step.get(step_name, ()))
+
+  return ordered_items
+
+
+def _index_link(link, pool):
+  """Returns the `_LinkIndex` of passed link, whose artifact tables use
+  passed pool, i.e. the artifacts of the link are copied into tables of that
+  pool, unless they already are. """
+  def _table(artifacts):
+    if isinstance(artifacts, ArtifactTable):
+      if artifacts.pool is pool:
+        return artifacts
+      items = artifacts.iter_items()
+
+    else:
+      items = artifacts.items()
+
+    table = ArtifactTable(pool)
+    for path, hash_dict in items:
+      table.add(path, hash_dict)
+    return table
+
+  return _LinkIndex(link.name, _table(link.materials), _table(link.products))
+
+
+def create_layout_incrementally(link_keys, load_link, step_cache,
+    compress=False, progress=None):
+  """Creates the same layout as `create_layout_from_ordered_links`, but reuses
+  the rules of steps whose link and whose producers have not changed since a
+  previous call with the same `step_cache`.
+
+  The rules of a step depend on the link of the step, and on the links that
+  last produced its materials with the same digest, or else on the previous
+  link (MATCH rules, c.f. `ProducerIndex`). Hence each step is cached by the
+  key of its link and the keys of these links, which are resolved with an
+  index of the materials and products of each link, cached by link key as
+  well. The index of a link is a copy of its materials and products as
+  artifact tables (c.f. artifact_table.py) of one path pool per
+  `step_cache`. If one link changes, only its step and the steps that MATCH
+  materials with it are recreated, and only the changed link is loaded.
+
+  NOTE: The paths of links that are no longer part of the layout are kept in
+  the pool of the `step_cache`, until it is dropped.
+
+  Args:
+    link_keys: an ordered list of keys that identify the content of the link
+        of each step, e.g. a digest of the link
+    load_link: a function that takes a key from `link_keys` and returns the
+        link, called at most once per key
+    step_cache: a dictionary to remember the rules of each step and the index
+        of each link in, pass the same dictionary to subsequent calls. Entries
+        that are not used by this call are removed.
+    compress: (optional) c.f. `create_layout_from_ordered_links`
+    progress: (optional) a function that is called with the number of
+        created steps and the number of all steps after each step
+
+  Returns:
+    an in-toto Layout
+  """
+  loaded_links = {}
+  def _get_link(key):
+    if key not in loaded_links:
+      loaded_links[key] = load_link(key)
+    return loaded_links[key]
+
+  # The path pool of the artifact tables of all cached link indexes
+  pool = step_cache.setdefault(("pool",), PathPool())
+  used_cache_keys = {("pool",)}
+  def _get_link_index(key):
+    cache_key = ("link", key)
+    if cache_key not in step_cache:
+      step_cache[cache_key] = _index_link(_get_link(key), pool)
+    used_cache_keys.add(cache_key)
+    return step_cache[cache_key]
+
+  layout = in_toto.models.layout.Layout()
+  layout.keys = {}
+
+  # (path id, digest key) tuples of the products of the preceding links
+  # mapped to the position of the link that produced them last
+  producer_positions = {}
+  previous_index = None
+  previous_product_ids = frozenset()
+  for position, key in enumerate(link_keys):
+    link_index = _get_link_index(key)
+
+    # Resolve the producers of the materials (c.f. `ProducerIndex.resolve`)
+    # and the materials that are MATCHed with the previous step instead
+    producers = {}
+    previous_matched = False
+    for path_id, digest_key in link_index.materials.iter_digest_keys():
+      producer_position = producer_positions.get((path_id, digest_key))
+      if producer_position is not None:
+        producers[path_id] = producer_position
+      elif path_id in previous_product_ids:
+        previous_matched = True
+
+    cache_key = ("step", key, tuple(link_keys[producer_position]
+        for producer_position in sorted(set(producers.values()))),
+        link_keys[position - 1] if previous_matched else None, compress)
+    if cache_key not in step_cache:
+      link = _get_link(key)
+      previous_link = None
+      if previous_index is not None:
+        previous_link = _PreviousStepLink(previous_index.name,
+            previous_index.products)
+
+      diff = SnapshotDiff.from_link(link)
+      step_cache[cache_key] = (link.name, link.command,
+          create_material_rules(previous_link, link, diff, compress,
+              {pool.path(path_id):
+              step_cache[("link", link_keys[producer_position])].name
+              for path_id, producer_position in producers.items()}),
+          create_product_rules(link, diff, compress))
+
+    used_cache_keys.add(cache_key)
+    name, command, expected_materials, expected_products = \
+        step_cache[cache_key]
+    layout.steps.append(in_toto.models.layout.Step(name=name,
+        expected_materials=expected_materials,
+        expected_products=expected_products,
+        expected_command=command))
+
+    for product_key in link_index.products.iter_digest_keys():
+      producer_positions[product_key] = position
+    previous_index = link_index
+    previous_product_ids = frozenset(link_index.products.ids())
+
+    if progress is not None:
+      progress(position + 1, len(link_keys))
+
+  # Forget the rules of steps and the links that are no longer part of the
+  # layout
+  for cache_key in set(step_cache).difference(used_cache_keys):
+    del step_cache[cache_key]
+
+  return layout
+
+
+def step_cache_nbytes(step_cache):
+  """Returns the approximate number of bytes used by passed `step_cache` of
+  `create_layout_incrementally`, i.e. by the buffers of the artifact tables
+  and of the path pool of the link indexes, and by the rules of the steps. """
+  nbytes = 0
+  for cache_key, entry in step_cache.items():
+    if cache_key[0] == "pool":
+      nbytes += entry.nbytes()
+
+    elif cache_key[0] == "link":
+      nbytes += entry.materials.nbytes() + entry.products.nbytes()
+
+    else:
+      name, command, expected_materials, expected_products = entry
+      nbytes += sys.getsizeof(name)
+      for strings in [command] + expected_materials + expected_products:
+        nbytes += sys.getsizeof(strings) + sum(
+            sys.getsizeof(string) for string in strings)
+
+  return nbytes
+
+
+def _project_name(path):
+  """Returns the name of a project from the path of its link directory or
+  link archive, e.g. "foo" for "links/foo.tar.gz". """
+  name = os.path.basename(os.path.normpath(path))
+  for extension in [".tar.gz", ".tar.bz2", ".tar.xz", ".tgz", ".tar"]:
+    if name.endswith(extension):
+      return name[:-len(extension)]
+  return name
+
+
+def _read_project_links(path):
+  """Reads the link metadata files (*.link) of a project from passed link
+  directory or link archive with `link_stream`. Returns a list of
+  (file name, link) tuples sorted by file name. """
+  # All links of a project share a pool, i.e. each path is stored once
+  pool = PathPool()
+  links = []
+  if os.path.isdir(path):
+    for file_name in sorted(os.listdir(path)):
+      if file_name.endswith(".link"):
+        with open(os.path.join(path, file_name), "rb") as link_file:
+          links.append((file_name,
+              link_stream.read_link_metadata(link_file, pool=pool)))
+
+  else:
+    # Read archive members as they come (stream mode), so that only one file
+    # is extracted at a time
+    with tarfile.open(path, "r|*") as link_archive:
+      for tar_info in link_archive:
+        if tar_info.isfile() and tar_info.name.endswith(".link"):
+          links.append((tar_info.name, link_stream.read_link_metadata(
+              link_archive.extractfile(tar_info), pool=pool)))
+
+  return sorted(links, key=lambda item: item[0])
+
+
+def _order_links(links, step_names):
+  """Orders passed (file name, link) tuples by the position of their step in
+  `step_names`. Links of steps that are not listed are appended in file name
+  order. """
+  if not step_names:
+    return [link for _, link in links]
+
+  positions = {name: idx for idx, name in enumerate(step_names)}
+  links = sorted(links, key=lambda item: positions.get(item[1].name,
+      len(positions)))
+  return [link for _, link in links]
+
+
+def _create_project_layout(path, output_dir, step_names, compress):
+  """Creates and writes the layout of one project and returns a tuple of
+  statistics, i.e. (project name, layout path, link count, artifact count,
+  rule count, seconds). Module level function to be callable in a worker
+  process. """
+  start = time.time()
+  name = _project_name(path)
+  links = _order_links(_read_project_links(path), step_names)
+  if not links:
+    raise ValueError("No link files (*.link) found in '{}'".format(path))
+
+  artifact_count = sum(len(link.materials) + len(link.products)
+      for link in links)
+
+  layout = create_layout_from_ordered_links(links, compress=compress)
+  # Release the links before serializing the layout
+  del links
+
+  rule_count = sum(len(step.expected_materials) + len(step.expected_products)
+      for step in layout.steps)
+
+  layout_path = os.path.join(output_dir, name + ".layout")
+  layout_stream.dump_metablock(in_toto.models.metadata.Metablock(
+      signed=layout), layout_path)
+
+  return (name, layout_path, len(layout.steps), artifact_count, rule_count,
+      time.time() - start)
+
+
+def main(argv=None):
+  """Command line entry point to create one layout per passed project (link
+  directory or link archive) in parallel. Returns an exit code. """
+  parser = argparse.ArgumentParser(prog="python -m create_layout",
+      description="Create a basic in-toto layout for each passed project from"
+      " the link metadata files (*.link) in its directory or tar archive.")
+  parser.add_argument("projects", nargs="+", metavar="PATH",
+      help="link directory or (compressed) tar archive of link files")
+  parser.add_argument("-o", "--output-dir", default=".",
+      help="directory to write the '<project>.layout' files to"
+      " (default: current directory)")
+  parser.add_argument("-s", "--steps", default="",
+      help="comma separated step names in supply chain order (default: order"
+      " of link file names)")
+  parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+      help="number of projects processed in parallel (default: number of"
+      " CPUs)")
+  parser.add_argument("-c", "--compress", action="store_true",
+      help="collapse per-artifact rules into directory rules where possible")
+  args = parser.parse_args(argv)
+
+  step_names = [name for name in args.steps.split(",") if name]
+  if not os.path.isdir(args.output_dir):
+    os.makedirs(args.output_dir)
+
+  failed = False
+  projects = iter(args.projects)
+  with concurrent.futures.ProcessPoolExecutor(max(args.jobs, 1)) as executor:
+    # Keep at most one project per worker in flight, so that memory is
+    # bounded by the number of workers and not by the number of projects
+    pending = {}
+    while True:
+      while len(pending) < max(args.jobs, 1):
+        path = next(projects, None)
+        if path is None:
+          break
+        pending[executor.submit(_create_project_layout, path,
+            args.output_dir, step_names, args.compress)] = path
+
+      if not pending:
+        break
+
+      done, _ = concurrent.futures.wait(pending,
+          return_when=concurrent.futures.FIRST_COMPLETED)
+      for future in done:
+        path = pending.pop(future)
+        try:
+          (name, layout_path, step_count, artifact_count, rule_count,
+              seconds) = future.result()
+
+        except Exception as e:
+          failed = True
+          print("{}: failed: {}".format(path, e), file=sys.stderr)
+
+        else:
+          print("{}: {} steps, {} artifacts, {} rules, {:.2f}s -> {}".format(
+              name, step_count, artifact_count, rule_count, seconds,
+              layout_path))
+
+  return 1 if failed else 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python
+"""
+<Program Name>
+  external_diff.py
+
+<Started>
+  October 16, 2026
+
+<Copyright>
+  See LICENSE for licensing information.
+
+<Purpose>
+  Computes the changes between the materials and the products of a link on
+  disk, for links whose artifacts don't fit into memory as Python sets (c.f.
+  `create_layout.changes_between_snapshots`).
+
+  The (path, digest) pairs of each side are sorted in batches of RUN_SIZE
+  artifacts and written to run files. The runs of each side are merged into
+  one sorted stream, and the two streams are merge joined in a single pass,
+  which writes the paths of the unchanged, modified, added and removed
+  artifacts to one spill file each. The rule builders read the spill files
+  lazily (c.f. `ExternalSnapshotDiff.sorted`).
+
+  Memory is only bounded if the pairs are streamed straight from the link
+  file (c.f. `ExternalSnapshotDiff.from_link_file`), i.e. then at most
+  2 * RUN_SIZE artifacts are held in memory at a time. A diff of the
+  materials and products of a link that is already loaded (c.f.
+  `ExternalSnapshotDiff.from_link`) holds the artifacts in memory anyway, and
+  is several times slower than a diff in memory, i.e. it has no benefit over
+  `create_layout.SnapshotDiff`.
+
+  Paths are sorted by their UTF-8 encoding, which is the same order as that
+  of the path strings.
+
+  <Usage>
+
+    ```
+    with open(LINK_PATH, "rb") as link_file, \
+        ExternalSnapshotDiff.from_link_file(link_file, "/var/tmp") as diff:
+      for path in diff.sorted("removed"):
+        print(path)
+
+    ```
+
+"""
+import os
+import heapq
+import itertools
+import shutil
+import struct
+import tempfile
+
+import artifact_table
+import link_stream
+
+# Number of artifacts sorted in memory and written to one run file, i.e.
+# about 20 MB of records per side for paths of 50 characters and a sha256
+RUN_SIZE = 50000
+
+# Buffer size of run and spill files
+_BUFFER_SIZE = 1024 * 1024
+
+# Lengths of the fields of (path, digest) records and of path records
+_RUN_HEADER = struct.Struct("<II")
+_SPILL_HEADER = struct.Struct("<I")
+
+KINDS = ("unchanged", "modified", "added", "removed")
+
+
+def _encode_hash_dict(hash_dict):
+  """Returns passed hash dict as bytes, which are equal for equal hash dicts,
+  i.e. the length-prefixed algorithm names and the (hex) digests, sorted by
+  algorithm. """
+  if len(hash_dict) == 1:
+    ((algorithm, digest),) = hash_dict.items()
+    return "{}:{}{}".format(len(algorithm), algorithm, digest).encode(
+        "utf-8", "surrogatepass")
+
+  return ",".join("{}:{}{}".format(len(algorithm), algorithm, digest)
+      for algorithm, digest in sorted(hash_dict.items())).encode(
+      "utf-8", "surrogatepass")
+
+
+def _iter_hash_dicts(artifacts):
+  """Yields (path, hash dict) tuples of passed artifact table or dict. """
+  if isinstance(artifacts, artifact_table.ArtifactTable):
+    return artifacts.iter_items()
+  return iter(artifacts.items())
+
+
+def _write_records(record_file, header, fields):
+  """Writes a record, i.e. a tuple of byte strings, prefixed with the packed
+  lengths of the fields, to passed file. """
+  record_file.write(header.pack(*map(len, fields)) + b"".join(fields))
+
+
+def _iter_records(path, header):
+  """Yields the records written with `_write_records` to passed path. """
+  with open(path, "rb") as record_file:
+    data = b""
+    while True:
+      chunk = record_file.read(_BUFFER_SIZE)
+      data += chunk
+      pos = 0
+      end = len(data)
+      while pos + header.size <= end:
+        lengths = header.unpack_from(data, pos)
+        start = pos + header.size
+        record_end = start + sum(lengths)
+        if record_end > end:
+          break
+
+        fields = []
+        for length in lengths:
+          fields.append(data[start:start + length])
+          start += length
+        yield tuple(fields)
+        pos = record_end
+
+      data = data[pos:]
+      if not chunk:
+        return
+
+
+class _SortedRuns(object):
+  """(encoded path, encoded hash dict) records of one side of the diff,
+  sorted in run files. Artifacts are added one by one, and written to a run
+  file whenever `run_size` artifacts were added. """
+  __slots__ = ("_directory", "_name", "_run_size", "_batch", "_paths")
+
+  def __init__(self, directory, name, run_size):
+    self._directory = directory
+    self._name = name
+    self._run_size = run_size
+    self._batch = []
+    self._paths = []
+
+
+  def add(self, path, hash_dict):
+    self._batch.append((path.encode("utf-8", "surrogatepass"),
+        _encode_hash_dict(hash_dict)))
+    if len(self._batch) >= self._run_size:
+      self._write_run()
+
+
+  def _write_run(self):
+    self._batch.sort()
+    path = os.path.join(self._directory, "{}-{}.run".format(self._name,
+        len(self._paths)))
+    with open(path, "wb", _BUFFER_SIZE) as run_file:
+      for record in self._batch:
+        _write_records(run_file, _RUN_HEADER, record)
+    self._batch = []
+    self._paths.append(path)
+
+
+  def __iter__(self):
+    """Yields all records sorted by path. """
+    if self._batch:
+      self._write_run()
+    return heapq.merge(*[_iter_records(path, _RUN_HEADER)
+        for path in self._paths])
+
+
+def _merge_join(before, after):
+  """Yields (kind, encoded path) tuples for the sorted records of both sides.
+  """
+  before, after = iter(before), iter(after)
+  before_record = next(before, None)
+  after_record = next(after, None)
+  while before_record is not None and after_record is not None:
+    if before_record[0] == after_record[0]:
+      yield ("unchanged" if before_record[1] == after_record[1]
+          else "modified"), before_record[0]
+      before_record = next(before, None)
+      after_record = next(after, None)
+
+    elif before_record[0] < after_record[0]:
+      yield "removed", before_record[0]
+      before_record = next(before, None)
+
+    else:
+      yield "added", after_record[0]
+      after_record = next(after, None)
+
+  while before_record is not None:
+    yield "removed", before_record[0]
+    before_record = next(before, None)
+
+  while after_record is not None:
+    yield "added", after_record[0]
+    after_record = next(after, None)
+
+
+class ExternalSnapshotDiff(object):
+  """The changes between two snapshots of artifacts, computed and stored on
+  disk (c.f. `create_layout.SnapshotDiff`). Use as context manager or call
+  `close` to remove the spill files. """
+  __slots__ = ("_directory", "_counts")
+
+  def __init__(self, before_dict, after_dict, directory=None,
+      run_size=RUN_SIZE):
+    """
+    Args:
+      before_dict, after_dict: the artifacts before and after, i.e. artifact
+          tables or dicts of paths and hash dicts
+      directory: (optional) the directory to create a temporary directory for
+          run and spill files in, the default temporary directory is used if
+          not passed
+      run_size: (optional) number of artifacts sorted in memory at a time
+    """
+    self._diff(itertools.chain(
+        (("materials", path, hash_dict)
+        for path, hash_dict in _iter_hash_dicts(before_dict)),
+        (("products", path, hash_dict)
+        for path, hash_dict in _iter_hash_dicts(after_dict))),
+        directory, run_size)
+
+
+  def _diff(self, artifacts, directory, run_size):
+    """Computes the diff of passed ("materials" or "products", path, hash
+    dict) tuples, where materials are before and products after. """
+    self._directory = tempfile.mkdtemp(prefix="snapshot-diff-",
+        dir=directory)
+    self._counts = dict.fromkeys(KINDS, 0)
+    try:
+      before = _SortedRuns(self._directory, "before", run_size)
+      after = _SortedRuns(self._directory, "after", run_size)
+      runs = {"materials": before, "products": after}
+      for side, path, hash_dict in artifacts:
+        runs[side].add(path, hash_dict)
+
+      spill_files = {kind: open(self._spill_path(kind), "wb", _BUFFER_SIZE)
+          for kind in KINDS}
+      try:
+        for kind, path in _merge_join(before, after):
+          _write_records(spill_files[kind], _SPILL_HEADER, (path,))
+          self._counts[kind] += 1
+      finally:
+        for spill_file in spill_files.values():
+          spill_file.close()
+
+      # The runs are no longer needed
+      for name in os.listdir(self._directory):
+        if name.endswith(".run"):
+          os.remove(os.path.join(self._directory, name))
+
+    except BaseException:
+      self.close()
+      raise
+
+
+  @classmethod
+  def from_link(cls, link, directory=None, run_size=RUN_SIZE):
+    """Returns the diff between the materials and products of passed link. """
+    return cls(link.materials, link.products, directory, run_size)
+
+
+  @classmethod
+  def from_link_file(cls, fileobj, directory=None, run_size=RUN_SIZE):
+    """Returns the diff between the materials and products of the link or
+    link metadata in passed file object, whose artifacts are streamed into
+    the run files as they are parsed (c.f. `link_stream.iter_link_artifacts`),
+    i.e. without loading the link. """
+    diff = cls.__new__(cls)
+    diff._diff(link_stream.iter_link_artifacts(fileobj), directory, run_size)
+    return diff
+
+
+  def _spill_path(self, kind):
+    return os.path.join(self._directory, kind + ".spill")
+
+
+  def sorted(self, kind):
+    """Returns an iterator over the sorted paths of the artifacts of passed
+    kind, i.e. one of "unchanged", "modified", "added" or "removed", which
+    are read from disk as they are consumed. """
+    if kind not in self._counts:
+      raise ValueError("Unknown kind of change '{}'".format(kind))
+    return (record[0].decode("utf-8", "surrogatepass")
+        for record in _iter_records(self._spill_path(kind), _SPILL_HEADER))
+
+
+  def count(self, kind):
+    """Returns the number of artifacts of passed kind. """
+    return self._counts[kind]
+
+
+  def close(self):
+    """Removes the spill files. """
+    shutil.rmtree(self._directory, ignore_errors=True)
+
+
+  def __enter__(self):
+    return self
+
+
+  def __exit__(self, *exc_info):
+    self.close()
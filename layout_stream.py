@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python
+"""
+<Program Name>
+  layout_stream.py
+
+<Started>
+  October 16, 2026
+
+<Copyright>
+  See LICENSE for licensing information.
+
+<Purpose>
+  Writes in-toto metadata, e.g. a layout wrapped in a Metablock, as JSON in
+  chunks.
+
+  `repr(metablock)` first converts the metadata into nested dictionaries
+  (`attr.asdict`) and then formats them into one string, which is usually
+  encoded and copied once more to be written or served. For a layout with
+  many artifact rules all of these are held in memory at the same time. The
+  writer in this module walks the metadata objects directly and yields the
+  JSON text in chunks of about CHUNK_SIZE characters, e.g. to write it to a
+  file or to stream it in an HTTP response. Only a single rule is formatted
+  at a time.
+
+  The joined chunks are equal to `repr(metablock)`, i.e. the JSON text is
+  indented (or compact, c.f. `Metablock.compact_json`) with sorted keys.
+
+  <Usage>
+
+    ```
+    metablock = in_toto.models.metadata.Metablock(signed=layout)
+    with open(LAYOUT_PATH, "w") as layout_file:
+      for chunk in iter_metablock_json(metablock):
+        layout_file.write(chunk)
+
+    ```
+
+"""
+import json
+
+import attr
+
+# Approximate number of characters per yielded chunk
+CHUNK_SIZE = 64 * 1024
+
+_CONTAINER_TYPES = (dict, list, tuple)
+
+# The encoder used by `json.dumps` for strings (ensure_ascii=True)
+_encode_string = json.encoder.encode_basestring_ascii
+
+
+class _Format(object):
+  """The separators and indentation of the written JSON text, c.f.
+  `json.dumps`. """
+  __slots__ = ("item_separator", "key_separator", "newline", "indent")
+
+  def __init__(self, compact):
+    if compact:
+      self.item_separator, self.key_separator = ",", ":"
+      self.newline, self.indent = "", ""
+    else:
+      self.item_separator, self.key_separator = ",", ": "
+      self.newline, self.indent = "\n", " "
+
+
+def _item_key(item):
+  return item[0]
+
+
+def _dumps_scalar(value):
+  """Returns the JSON representation of a string, number, bool or None. """
+  # NOTE: `json.dumps` with indentation uses the (slow) pure Python encoder,
+  # hence strings, e.g. of artifact rules, are encoded directly
+  if isinstance(value, str):
+    return _encode_string(value)
+  return json.dumps(value)
+
+
+def _iter_json(value, level, json_format):
+  """Yields the JSON representation of passed value, nested at passed level,
+  in small pieces. Lists of scalars, e.g. a single artifact rule, are
+  formatted at once. """
+  if attr.has(type(value)):
+    # Same keys as `attr.asdict`
+    items = sorted(((field.name, getattr(value, field.name))
+        for field in attr.fields(type(value))), key=_item_key)
+
+  elif isinstance(value, dict):
+    items = sorted(value.items(), key=_item_key)
+
+  elif isinstance(value, (list, tuple)):
+    items = None
+
+  else:
+    yield _dumps_scalar(value)
+    return
+
+  opening, closing = ("{", "}") if items is not None else ("[", "]")
+  if not (value if items is None else items):
+    yield opening + closing
+    return
+
+  indent = json_format.newline + json_format.indent * (level + 1)
+  closing = json_format.newline + json_format.indent * level + closing
+  if items is None:
+    if not any(isinstance(item, _CONTAINER_TYPES) or attr.has(type(item))
+        for item in value):
+      yield opening + indent + (json_format.item_separator + indent).join(
+          _dumps_scalar(item) for item in value) + closing
+      return
+
+    yield opening
+    for idx, item in enumerate(value):
+      yield indent if idx == 0 else json_format.item_separator + indent
+      for chunk in _iter_json(item, level + 1, json_format):
+        yield chunk
+
+  else:
+    yield opening
+    for idx, (key, item) in enumerate(items):
+      yield indent if idx == 0 else json_format.item_separator + indent
+      yield _encode_string(key)
+      yield json_format.key_separator
+      for chunk in _iter_json(item, level + 1, json_format):
+        yield chunk
+
+  yield closing
+
+
+def _iter_chunks(pieces, chunk_size):
+  """Joins passed pieces of text into chunks of at least `chunk_size`
+  characters (except for the last chunk). """
+  buffered = []
+  buffered_size = 0
+  for piece in pieces:
+    buffered.append(piece)
+    buffered_size += len(piece)
+    if buffered_size >= chunk_size:
+      yield "".join(buffered)
+      buffered = []
+      buffered_size = 0
+
+  if buffered:
+    yield "".join(buffered)
+
+
+def iter_metablock_json(metablock, chunk_size=CHUNK_SIZE):
+  """Yields the JSON representation of passed Metablock in chunks, which
+  joined are equal to `repr(metablock)`.
+
+  Args:
+    metablock: an in-toto Metablock, e.g. wrapping a layout
+    chunk_size: (optional) approximate number of characters per chunk
+
+  Returns:
+    a generator of strings
+  """
+  json_format = _Format(getattr(metablock, "compact_json", False))
+  return _iter_chunks(_iter_json({"signatures": metablock.signatures,
+      "signed": metablock.signed}, 0, json_format), chunk_size)
+
+
+def dump_metablock(metablock, path):
+  """Writes passed Metablock to a file at passed path, like
+  `Metablock.dump`, in chunks. """
+  with open(path, "wb") as layout_file:
+    for chunk in iter_metablock_json(metablock):
+      layout_file.write(chunk.encode("utf-8"))
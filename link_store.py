@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python
+"""
+<Program Name>
+  link_store.py
+
+<Started>
+  October 16, 2026
+
+<Copyright>
+  See LICENSE for licensing information.
+
+<Purpose>
+  Content-addressed stores for uploaded link metadata.
+
+  The wizard used to store each uploaded link as JSON string in the session
+  document, which is transferred with every read of the session and counts
+  towards MongoDB's maximum document size (16 MB). The stores in this module
+  keep the link JSON as a blob identified by its SHA-256 hex digest (c.f.
+  `wizard._link_digest`), so that the session document only needs to hold
+  the digest. The same link uploaded in different sessions or for different
+  steps is stored only once.
+
+  There are two stores with the same interface:
+    GridFSLinkStore: stores links in MongoDB using GridFS
+    FileLinkStore: stores links as files in a local directory, e.g. for
+        development or single host deployments
+
+  <Usage>
+
+    ```
+    store = FileLinkStore("/var/lib/wizard/links")
+    store.put(link_digest, link_str.encode("utf-8"))
+
+    with open(LINK_PATH, "rb") as link_file:
+      store.put_file(link_digest, link_file)
+
+    with store.open(link_digest) as link_file:
+      link = link_stream.read_link(link_file)
+
+    ```
+
+"""
+import io
+import os
+import re
+import shutil
+import tempfile
+
+import gridfs
+import gridfs.errors
+
+_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+
+
+def _check_digest(digest):
+  """Raises ValueError if passed digest is not a SHA-256 hex digest, i.e.
+  can't be used as file name. """
+  if not _DIGEST.match(digest):
+    raise ValueError("Invalid link digest '{}'".format(digest))
+
+
+class GridFSLinkStore(object):
+  """Stores links in GridFS, with their digest as file id. """
+  __slots__ = ("_fs",)
+
+  def __init__(self, database, collection="links"):
+    """
+    Args:
+      database: a pymongo Database
+      collection: (optional) the name of the GridFS root collection
+    """
+    self._fs = gridfs.GridFS(database, collection)
+
+
+  def put(self, digest, data):
+    """Stores passed link data (bytes) with passed digest, unless a link with
+    that digest is already stored. Returns whether the link was added. """
+    return self.put_file(digest, io.BytesIO(data))
+
+
+  def put_file(self, digest, fileobj):
+    """Same as `put` for link data read from passed (binary) file object,
+    which GridFS reads and writes in chunks. """
+    _check_digest(digest)
+    if self._fs.exists(digest):
+      return False
+
+    try:
+      self._fs.put(fileobj, _id=digest)
+
+    # The same link was stored concurrently
+    except gridfs.errors.FileExists:
+      return False
+
+    return True
+
+
+  def open(self, digest):
+    """Returns a (binary) file object to read the link with passed digest.
+    Raises KeyError if there is no such link. """
+    _check_digest(digest)
+    try:
+      return self._fs.get(digest)
+
+    except gridfs.errors.NoFile:
+      raise KeyError(digest)
+
+
+  def __contains__(self, digest):
+    _check_digest(digest)
+    return self._fs.exists(digest)
+
+
+class FileLinkStore(object):
+  """Stores links as files in a directory, with their digest as file name.
+  Links are sharded into subdirectories by the first two digest characters.
+  """
+  __slots__ = ("_directory",)
+
+  def __init__(self, directory):
+    self._directory = directory
+
+
+  def _path(self, digest):
+    _check_digest(digest)
+    return os.path.join(self._directory, digest[:2], digest)
+
+
+  def put(self, digest, data):
+    """Stores passed link data (bytes) with passed digest, unless a link with
+    that digest is already stored. Returns whether the link was added. """
+    return self.put_file(digest, io.BytesIO(data))
+
+
+  def put_file(self, digest, fileobj):
+    """Same as `put` for link data read from passed (binary) file object,
+    which is copied in chunks. """
+    path = self._path(digest)
+    if os.path.exists(path):
+      return False
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # Write to a temporary file first, so that a link is never read partially
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+        prefix=".tmp-")
+    try:
+      with os.fdopen(fd, "wb") as link_file:
+        shutil.copyfileobj(fileobj, link_file)
+      os.replace(tmp_path, path)
+
+    except BaseException:
+      os.remove(tmp_path)
+      raise
+
+    return True
+
+
+  def open(self, digest):
+    """Returns a (binary) file object to read the link with passed digest.
+    Raises KeyError if there is no such link. """
+    try:
+      return open(self._path(digest), "rb")
+
+    except FileNotFoundError:
+      raise KeyError(digest)
+
+
+  def __contains__(self, digest):
+    return os.path.exists(self._path(digest))
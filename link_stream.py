@@ -0,0 +1,458 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python
+"""
+<Program Name>
+  link_stream.py
+
+<Started>
+  October 16, 2026
+
+<Copyright>
+  See LICENSE for licensing information.
+
+<Purpose>
+  Reads in-toto link metadata incrementally from a file object.
+
+  Loading a link with `json.loads` and `Link.read` keeps the raw JSON text,
+  the parsed dictionary and the Link object in memory at the same time, which
+  does not scale to links with millions of materials and products. The
+  reader in this module pulls the JSON text in chunks and parses the
+  `materials` and `products` maps entry by entry into `ArtifactTable`s
+  (c.f. artifact_table.py), so that peak memory is proportional to the
+  artifact tables rather than to the JSON text. All other (small) link fields
+  are parsed as a whole.
+
+  The returned `StreamedLink` objects provide the attributes of an in-toto
+  Link that are needed by `create_layout`, and can be passed to
+  `create_layout.create_layout_from_ordered_links` directly. The materials
+  and products of a link share a path pool, pass the same pool to all links
+  of a layout to store each path only once.
+
+  <Usage>
+
+    ```
+    with open(LINK_PATH, "rb") as link_file:
+      link = read_link_metadata(link_file)
+
+    print(link.name, len(link.materials), len(link.products))
+
+    ```
+
+"""
+import codecs
+import hashlib
+import io
+import json
+import os
+import re
+import tempfile
+
+import securesystemslib.exceptions
+
+from artifact_table import ArtifactTable, PathPool
+
+# Number of bytes (or characters) read from the file object at a time
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+# The fields of a link, and the type of their values (c.f. Link._validate_*)
+_LINK_FIELD_TYPES = {
+  "byproducts": dict,
+  "command": list,
+  "environment": dict,
+}
+
+
+class StreamedLink(object):
+  """A link read by `read_link` or `read_link_metadata`, whose materials and
+  products are `ArtifactTable`s. """
+  __slots__ = ("name", "command", "materials", "products", "byproducts",
+      "environment")
+
+  def __init__(self, name=None, command=None, materials=None, products=None,
+      byproducts=None, environment=None):
+    # Materials and products must share a pool to be diffed efficiently
+    if materials is None:
+      materials = ArtifactTable(products.pool if products is not None
+          else None)
+    if products is None:
+      products = ArtifactTable(materials.pool)
+
+    self.name = name
+    self.command = command if command is not None else []
+    self.materials = materials
+    self.products = products
+    self.byproducts = byproducts if byproducts is not None else {}
+    self.environment = environment if environment is not None else {}
+
+
+  def iter_json(self):
+    """Yields the JSON representation of the link in chunks. The joined
+    chunks are equal to the representation of an in-toto Link with the same
+    fields (c.f. `Signable.__repr__`). """
+    fields = {
+      "_type": "link",
+      "byproducts": self.byproducts,
+      "command": self.command,
+      "environment": self.environment,
+      "materials": self.materials,
+      "name": self.name,
+      "products": self.products,
+    }
+    yield "{"
+    for idx, key in enumerate(sorted(fields)):
+      yield "\n " if idx == 0 else ",\n "
+      yield json.dumps(key)
+      yield ": "
+      value = fields[key]
+      if isinstance(value, ArtifactTable):
+        for chunk in _iter_artifacts_json(value, 1):
+          yield chunk
+      else:
+        yield _dumps_at(value, 1)
+    yield "\n}"
+
+
+  def __repr__(self):
+    return "".join(self.iter_json())
+
+
+def _dumps_at(value, level):
+  """Returns the indented JSON representation of passed value as if it was
+  nested at passed level of a document dumped with `indent=1`. """
+  # NOTE: JSON strings can't contain raw newlines, hence every newline in the
+  # dump is a line break that needs indentation
+  return json.dumps(value, indent=1, separators=(",", ": "),
+      sort_keys=True).replace("\n", "\n" + " " * level)
+
+
+def _iter_artifacts_json(artifacts, level):
+  """Yields the indented JSON representation of an artifact table (c.f.
+  `_dumps_at`) entry by entry. """
+  if not len(artifacts):
+    yield "{}"
+    return
+
+  indent = "\n" + " " * (level + 1)
+  yield "{"
+  for idx, (path, hash_dict) in enumerate(artifacts.sorted_items()):
+    yield indent if idx == 0 else "," + indent
+    yield json.dumps(path)
+    yield ": "
+    yield _dumps_at(hash_dict, level + 1)
+  yield "\n" + " " * level + "}"
+
+
+class _JSONStream(object):
+  """Minimal pull parser over a file object, which yields binary (UTF-8) or
+  text chunks of a JSON document. """
+
+  def __init__(self, fileobj, chunk_size=CHUNK_SIZE):
+    self._fileobj = fileobj
+    self._chunk_size = chunk_size
+    self._text_decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    self._json_decoder = json.JSONDecoder()
+    self._buffer = ""
+    self._pos = 0
+    self._eof = False
+
+
+  def _fill(self, size=None):
+    """Appends the next chunk of the file to the buffer and discards the
+    already parsed part of the buffer. Returns False at the end of the file.
+    """
+    if self._eof:
+      return False
+
+    chunk = self._fileobj.read(size or self._chunk_size)
+    if not chunk:
+      self._eof = True
+
+    if isinstance(chunk, bytes):
+      chunk = self._text_decoder.decode(chunk, final=self._eof)
+
+    self._buffer = self._buffer[self._pos:] + chunk
+    self._pos = 0
+    return not self._eof
+
+
+  def peek(self):
+    """Skips whitespace and returns the next character without consuming it,
+    or an empty string at the end of the file. """
+    while True:
+      self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+      if self._pos < len(self._buffer):
+        return self._buffer[self._pos]
+
+      if not self._fill():
+        return ""
+
+
+  def expect(self, char):
+    """Consumes the next character, which must be the passed character. """
+    found = self.peek()
+    if found != char:
+      raise ValueError("Expecting '{}' but found '{}'".format(char,
+          found or "end of file"))
+    self._pos += 1
+
+
+  def read_value(self):
+    """Parses and consumes the next JSON value as a whole. """
+    self.peek()
+    size = self._chunk_size
+    while True:
+      try:
+        value, end = self._json_decoder.raw_decode(self._buffer, self._pos)
+
+      except ValueError:
+        # The value might just be incomplete. Read more, doubling the read
+        # size to re-parse large values only a few times.
+        if not self._fill(size):
+          raise
+        size *= 2
+        continue
+
+      # A number or literal at the end of the buffer might not be complete
+      if end == len(self._buffer) and self._fill(size):
+        continue
+
+      self._pos = end
+      return value
+
+
+  def iter_object(self):
+    """Consumes the opening brace of a JSON object and yields its keys. The
+    caller must consume each key's value before resuming the iteration. """
+    self.expect("{")
+    if self.peek() == "}":
+      self._pos += 1
+      return
+
+    while True:
+      key = self.read_value()
+      if not isinstance(key, str):
+        raise ValueError("Expecting object key, found {!r}".format(key))
+      self.expect(":")
+
+      yield key
+
+      if self.peek() == "}":
+        self._pos += 1
+        return
+      self.expect(",")
+
+
+  def expect_end(self):
+    """Makes sure there is nothing but whitespace left in the file. """
+    if self.peek():
+      raise ValueError("Extra data after JSON document")
+
+
+def _read_artifacts(stream, pool):
+  """Parses a materials or products map entry by entry into a table. """
+  if stream.peek() != "{":
+    raise securesystemslib.exceptions.FormatError(
+        "Invalid Link: artifacts must be of type dict")
+
+  artifacts = ArtifactTable(pool)
+  for path in stream.iter_object():
+    artifacts.add(path, stream.read_value())
+  return artifacts
+
+
+def _read_link_object(stream, pool):
+  """Parses a link object, streaming its materials and products. If the
+  object wraps a "signed" link itself, the wrapped link is returned. """
+  if stream.peek() != "{":
+    raise ValueError("Wrong metadata format")
+
+  fields = {}
+  wrapped_link = None
+  for key in stream.iter_object():
+    if key in ("materials", "products"):
+      fields[key] = _read_artifacts(stream, pool)
+
+    elif key == "signed":
+      wrapped_link = _read_link_object(stream, pool)
+
+    else:
+      fields[key] = stream.read_value()
+
+  # FIXME: There is a bug in in_toto_mock that causes the returned link
+  # be wrapped twice in a Metablock (c.f. wizard.ajax_upload_link)
+  if wrapped_link is not None:
+    return wrapped_link
+
+  if fields.get("_type") != "link":
+    raise securesystemslib.exceptions.FormatError(
+        "Invalid Link: field `_type` must be set to 'link', got: {}".format(
+        fields.get("_type")))
+
+  for key, expected_type in _LINK_FIELD_TYPES.items():
+    if key in fields and not isinstance(fields[key], expected_type):
+      raise securesystemslib.exceptions.FormatError(
+          "Invalid Link: field `{}` must be of type {}, got: {}".format(key,
+          expected_type.__name__, type(fields[key])))
+
+  return StreamedLink(name=fields.get("name"), command=fields.get("command"),
+      materials=fields.get("materials", ArtifactTable(pool)),
+      products=fields.get("products", ArtifactTable(pool)),
+      byproducts=fields.get("byproducts"),
+      environment=fields.get("environment"))
+
+
+def read_link(fileobj, chunk_size=CHUNK_SIZE, pool=None):
+  """Reads a link, i.e. the dictionary representation of an in-toto Link
+  (c.f. `Link.read`), from passed file object.
+
+  Args:
+    fileobj: a file object opened in binary (UTF-8) or text mode
+    chunk_size: (optional) number of bytes or characters read at a time
+    pool: (optional) the PathPool to intern the artifact paths in, a new
+        pool is used if not passed
+
+  Raises:
+    ValueError: the file does not contain valid JSON
+    securesystemslib.exceptions.FormatError: the JSON is not a valid link
+
+  Returns:
+    a StreamedLink
+  """
+  stream = _JSONStream(fileobj, chunk_size)
+  link = _read_link_object(stream, pool if pool is not None else PathPool())
+  stream.expect_end()
+  return link
+
+
+def read_link_metadata(fileobj, chunk_size=CHUNK_SIZE, pool=None):
+  """Reads link metadata, i.e. a link wrapped in a Metablock, as created by
+  `in-toto-run`, from passed file object.
+
+  Args:
+    fileobj: a file object opened in binary (UTF-8) or text mode
+    chunk_size: (optional) number of bytes or characters read at a time
+    pool: (optional) the PathPool to intern the artifact paths in, a new
+        pool is used if not passed
+
+  Raises:
+    ValueError: the file does not contain valid JSON or is not a Metablock
+    securesystemslib.exceptions.FormatError: the JSON is not a valid link
+
+  Returns:
+    a StreamedLink
+  """
+  stream = _JSONStream(fileobj, chunk_size)
+  if stream.peek() != "{":
+    raise ValueError("Wrong metadata format")
+
+  if pool is None:
+    pool = PathPool()
+
+  link = None
+  for key in stream.iter_object():
+    if key == "signed":
+      link = _read_link_object(stream, pool)
+    else:
+      stream.read_value()
+  stream.expect_end()
+
+  if link is None:
+    raise ValueError("Wrong metadata format")
+
+  return link
+
+
+def _iter_link_object_artifacts(stream):
+  """Yields ("materials" or "products", path, hash dict) tuples of a link
+  object, or of the link it wraps (c.f. `_read_link_object`), as they are
+  parsed. """
+  if stream.peek() != "{":
+    raise ValueError("Wrong metadata format")
+
+  for key in stream.iter_object():
+    if key in ("materials", "products"):
+      if stream.peek() != "{":
+        raise securesystemslib.exceptions.FormatError(
+            "Invalid Link: artifacts must be of type dict")
+      for path in stream.iter_object():
+        yield key, path, stream.read_value()
+
+    elif key == "signed":
+      for item in _iter_link_object_artifacts(stream):
+        yield item
+
+    else:
+      stream.read_value()
+
+
+def iter_link_artifacts(fileobj, chunk_size=CHUNK_SIZE):
+  """Yields the artifacts of a link or of link metadata (c.f. `read_link`
+  and `read_link_metadata`) from passed file object as they are parsed, i.e.
+  without keeping them in memory.
+
+  Args:
+    fileobj: a file object opened in binary (UTF-8) or text mode
+    chunk_size: (optional) number of bytes or characters read at a time
+
+  Raises:
+    ValueError: the file does not contain valid JSON
+    securesystemslib.exceptions.FormatError: the artifacts are not maps
+
+  Yields:
+    ("materials" or "products", path, hash dict) tuples in file order
+  """
+  stream = _JSONStream(fileobj, chunk_size)
+  for item in _iter_link_object_artifacts(stream):
+    yield item
+  stream.expect_end()
+
+
+def canonicalize_link_metadata(fileobj, chunk_size=CHUNK_SIZE):
+  """Reads link metadata from passed file object (c.f. `read_link_metadata`)
+  and writes the canonical representation of the link, i.e. `repr(link)`, as
+  UTF-8 to a temporary file, in chunks of about `chunk_size` characters
+  (c.f. `StreamedLink.iter_json`) that are hashed as they are written, i.e.
+  without holding the link JSON in memory.
+
+  The returned values are small and picklable, i.e. this function can be run
+  in a worker process (c.f. `canonicalize_link_data`).
+
+  Returns:
+    a (link name, temporary file path, link digest) tuple, where the link
+    digest is the SHA-256 hex digest of the canonical link JSON. The caller
+    removes the temporary file.
+  """
+  link = read_link_metadata(fileobj, chunk_size)
+  link_hash = hashlib.sha256()
+  fd, link_path = tempfile.mkstemp(prefix="link-", suffix=".json")
+  try:
+    with os.fdopen(fd, "wb") as link_file:
+      def _write(chunks):
+        data = "".join(chunks).encode("utf-8")
+        link_hash.update(data)
+        link_file.write(data)
+
+      chunks = []
+      size = 0
+      for chunk in link.iter_json():
+        chunks.append(chunk)
+        size += len(chunk)
+        if size >= chunk_size:
+          _write(chunks)
+          chunks = []
+          size = 0
+      _write(chunks)
+
+  except BaseException:
+    os.remove(link_path)
+    raise
+
+  return link.name, link_path, link_hash.hexdigest()
+
+
+def canonicalize_link_data(data, chunk_size=CHUNK_SIZE):
+  """Same as `canonicalize_link_metadata` for link metadata passed as bytes,
+  e.g. to parse links in a `concurrent.futures.ProcessPoolExecutor`. """
+  return canonicalize_link_metadata(io.BytesIO(data), chunk_size)
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python
+"""
+<Program Name>
+  preflight.py
+
+<Started>
+  October 16, 2026
+
+<Copyright>
+  See LICENSE for licensing information.
+
+<Purpose>
+  Checks whether a set of links passes the artifact rules of a layout,
+  without signing the layout and running `in-toto-verify`.
+
+  The rules are applied to the materials and products of each step as in
+  `in_toto.verifylib.verify_item_rules`, i.e. all artifacts are put into a
+  queue and the rules consume them one after another, until a DISALLOW or
+  REQUIRE rule fails. Unlike in-toto, which filters the whole queue with
+  `fnmatch` for every rule, each rule pattern is compiled once and split into
+  a literal prefix and a remainder (c.f. `_compile_pattern`):
+
+    - literal patterns (e.g. "src/foo.py"), as created per artifact by
+      `create_layout`, are looked up in the queue directly,
+    - the candidates of other patterns (e.g. "src/*" or "*.py") are the range
+      of the sorted artifact paths that start with the literal prefix, which
+      is found by binary search, and only the remainder of the pattern, if
+      any, is matched with a precompiled regular expression.
+
+  Hence the generated layout of a link with 100k artifacts is checked in
+  about linear time.
+
+  The report lists per step whether its material and product rules pass,
+  the artifacts each rule consumed, and the first error, if any. Signatures,
+  thresholds, expected commands and inspections are not checked.
+
+  <Usage>
+
+    ```
+    report = preflight_layout(layout, {link.name: link for link in links})
+    print(report["passed"])
+
+    ```
+
+"""
+import os
+import re
+import bisect
+import fnmatch
+import functools
+
+import securesystemslib.exceptions
+import in_toto.rulelib
+
+# Characters that have a special meaning in artifact rule patterns (c.f.
+# fnmatch)
+_PATTERN_CHARS = re.compile(r"[*?\[]")
+
+
+class _Pattern(object):
+  """A rule pattern, split into a literal prefix, and a compiled regular
+  expression for the whole pattern, which is None if the pattern is the
+  literal prefix itself (`literal`) or followed by a single "*". """
+  __slots__ = ("prefix", "literal", "regex")
+
+  def __init__(self, pattern):
+    special = _PATTERN_CHARS.search(pattern)
+    self.literal = special is None
+    self.prefix = pattern if self.literal else pattern[:special.start()]
+    self.regex = None
+    if not self.literal and pattern[special.start():] != "*":
+      self.regex = re.compile(fnmatch.translate(pattern))
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile_pattern(pattern):
+  """Returns the (memoized) compiled pattern. Layouts created per artifact
+  have mostly literal patterns, which are cheap to compile. """
+  return _Pattern(pattern)
+
+
+class _ArtifactQueue(object):
+  """The artifacts of a step that were not yet consumed by a rule, indexed by
+  their sorted paths. """
+  __slots__ = ("_paths", "_queue")
+
+  def __init__(self, artifacts):
+    self._paths = sorted(artifacts)
+    self._queue = set(self._paths)
+
+
+  def filter(self, pattern, source_prefix=""):
+    """Returns the sorted queued paths that start with passed source prefix
+    and match the pattern after the prefix (c.f. `verify_match_rule`). """
+    compiled = _compile_pattern(pattern)
+    if compiled.literal:
+      path = source_prefix + pattern
+      return [path] if path in self._queue else []
+
+    start = source_prefix + compiled.prefix
+    if start:
+      index = bisect.bisect_left(self._paths, start)
+      candidates = []
+      while (index < len(self._paths) and
+          self._paths[index].startswith(start)):
+        if self._paths[index] in self._queue:
+          candidates.append(self._paths[index])
+        index += 1
+
+    else:
+      candidates = sorted(self._queue)
+
+    if compiled.regex is None:
+      return candidates
+
+    offset = len(source_prefix)
+    return [path for path in candidates
+        if compiled.regex.match(path, offset)]
+
+
+  def consume(self, paths):
+    self._queue.difference_update(paths)
+
+
+  def __contains__(self, path):
+    return path in self._queue
+
+
+  def remaining(self):
+    return sorted(self._queue)
+
+
+def _normalize_prefix(prefix):
+  """Returns the path prefix with a trailing slash (c.f. in-toto). """
+  return os.path.join(prefix, "").replace("\\", "/")
+
+
+def _consumed_by_rule(rule_data, queue, source_artifacts, materials,
+    products, links):
+  """Returns the sorted paths of the queued artifacts, which passed unpacked
+  rule consumes. """
+  rule_type = rule_data["rule_type"]
+  pattern = rule_data["pattern"]
+
+  if rule_type == "match":
+    dest_link = links.get(rule_data["dest_name"])
+    if not dest_link:
+      return []
+    dest_artifacts = getattr(dest_link, rule_data["dest_type"])
+
+    source_prefix = ""
+    if rule_data["source_prefix"]:
+      source_prefix = _normalize_prefix(rule_data["source_prefix"])
+    dest_prefix = ""
+    if rule_data["dest_prefix"]:
+      dest_prefix = _normalize_prefix(rule_data["dest_prefix"])
+
+    consumed = []
+    for path in queue.filter(pattern, source_prefix):
+      dest_path = dest_prefix + path[len(source_prefix):]
+      if (dest_path in dest_artifacts and
+          source_artifacts[path] == dest_artifacts[dest_path]):
+        consumed.append(path)
+    return consumed
+
+  filtered = queue.filter(pattern)
+  if rule_type == "allow":
+    return filtered
+
+  if rule_type == "create":
+    return [path for path in filtered
+        if path in products and path not in materials]
+
+  if rule_type == "delete":
+    return [path for path in filtered
+        if path in materials and path not in products]
+
+  if rule_type == "modify":
+    return [path for path in filtered if path in materials and
+        path in products and materials[path] != products[path]]
+
+  return []
+
+
+def preflight_item_rules(source_name, source_type, rules, links):
+  """Applies the material or product rules of a step to the artifacts of its
+  link, like `in_toto.verifylib.verify_item_rules`.
+
+  Args:
+    source_name: the name of the step
+    source_type: "materials" or "products"
+    rules: the expected materials or products of the step
+    links: a dictionary of step names and links, which must contain the link
+        of the step, and the links referred to by MATCH rules
+
+  Returns:
+    a dictionary with the fields
+      passed: True if no rule failed
+      error: the error of the failed rule or None
+      rules: a list of the applied rules and the artifacts each rule
+          consumed, i.e. [{"rule": <rule>, "consumed": [<path>, ...]}, ...]
+      unconsumed: the artifacts no rule consumed
+  """
+  link = links[source_name]
+  source_artifacts = getattr(link, source_type)
+  queue = _ArtifactQueue(source_artifacts)
+
+  report = {"passed": True, "error": None, "rules": []}
+  for rule in rules:
+    try:
+      rule_data = in_toto.rulelib.unpack_rule(rule)
+    except securesystemslib.exceptions.FormatError as e:
+      report["passed"] = False
+      report["error"] = "Invalid rule {}: {}".format(rule, e)
+      break
+
+    rule_type = rule_data["rule_type"]
+    pattern = rule_data["pattern"]
+    consumed = _consumed_by_rule(rule_data, queue, source_artifacts,
+        link.materials, link.products, links)
+    queue.consume(consumed)
+    report["rules"].append({"rule": rule, "consumed": consumed})
+
+    if rule_type == "disallow":
+      disallowed = queue.filter(pattern)
+      if disallowed:
+        report["passed"] = False
+        report["error"] = "'DISALLOW {}' matched the following artifacts:" \
+            " {}".format(pattern, disallowed)
+        break
+
+    elif rule_type == "require" and pattern not in queue:
+      report["passed"] = False
+      report["error"] = "'REQUIRE {0}' did not find {0}".format(pattern)
+      break
+
+  report["unconsumed"] = queue.remaining()
+  return report
+
+
+def preflight_layout(layout, links):
+  """Applies the material and product rules of all steps of passed layout to
+  passed links.
+
+  Args:
+    layout: an in-toto Layout
+    links: a dictionary of step names and links, e.g. in-toto Links or
+        links read with `link_stream`
+
+  Returns:
+    a dictionary with the fields
+      passed: True if the rules of all steps pass
+      steps: a list with one dictionary per step with the fields
+        name: the name of the step
+        passed: True if the material and product rules of the step pass
+        error: an error if there is no link for the step, or else None
+        materials, products: c.f. `preflight_item_rules`
+  """
+  steps = []
+  for step in layout.steps:
+    step_report = {"name": step.name, "passed": False, "error": None}
+    if step.name not in links:
+      step_report["error"] = "No link for step '{}'".format(step.name)
+
+    else:
+      for source_type, rules in [("materials", step.expected_materials),
+          ("products", step.expected_products)]:
+        step_report[source_type] = preflight_item_rules(step.name,
+            source_type, rules, links)
+
+      step_report["passed"] = (step_report["materials"]["passed"] and
+          step_report["products"]["passed"])
+
+    steps.append(step_report)
+
+  return {
+    "passed": all(step_report["passed"] for step_report in steps),
+    "steps": steps,
+  }
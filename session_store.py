@@ -0,0 +1,639 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python
+"""
+<Program Name>
+  session_store.py
+
+<Started>
+  October 16, 2026
+
+<Copyright>
+  See LICENSE for licensing information.
+
+<Purpose>
+  Stores for the session documents of the wizard, i.e. the data a user posts
+  on the wizard pages (c.f. the NoSQL Helpers in wizard.py).
+
+  A session document is a dict of subdocuments (e.g. vcs, ssc,
+  functionaries...) identified by the session id, and has a "version" field,
+  which is incremented with each update of the document, and "created" and
+  "last_activity" timestamps. The last activity is set with each update, and
+  with `touch`, e.g. when the session is used without update. Fields are
+  addressed by dotted paths, e.g. "chaining.comment", where a path into an
+  array addresses the field in each item of the array, e.g.
+  "chaining.items.file_name".
+
+  There are three stores with the same interface:
+    MongoSessionStore: stores session documents in a MongoDB collection
+    MemorySessionStore: keeps the session documents of the most recently
+        used sessions in memory, e.g. for development or tests, i.e. without
+        a running `mongod`
+    SQLiteSessionStore: stores session documents as JSON in an SQLite
+        database in WAL mode, e.g. for single host deployments
+
+  <Usage>
+
+    ```
+    store = SQLiteSessionStore("/var/lib/wizard/sessions.db")
+    store.set_fields(session_id, {"vcs": {"items": [], "comment": ""}})
+    store.push_items(session_id, "chaining.items", [link_db_item])
+
+    store.find(session_id, ["vcs", "chaining.items.file_name"])
+
+    # Remove the sessions without activity in the last 30 days, and keep a
+    # compacted copy of them (c.f. `SessionArchive`)
+    with SessionArchive("/var/lib/wizard/archive") as archive:
+      store.expire(time.time() - 30 * 24 * 3600, archive=archive)
+
+    ```
+
+"""
+import os
+import copy
+import json
+import gzip
+import time
+import sqlite3
+import hashlib
+import tempfile
+import threading
+import collections
+
+
+def _projection_tree(fields):
+  """Returns a tree of nested dicts for passed dotted field paths, where the
+  leaves are True, e.g. {"chaining": {"comment": True, "items": {"file_name":
+  True}}}. A field that is part of another passed field is left out. """
+  tree = {}
+  for field in sorted(fields, key=lambda field: field.count(".")):
+    node = tree
+    parts = field.split(".")
+    for part in parts[:-1]:
+      node = node.setdefault(part, {})
+      if node is True:
+        break
+
+    else:
+      node[parts[-1]] = True
+
+  return tree
+
+
+def _project(value, tree):
+  """Returns a copy of the passed value with only the fields in passed
+  projection tree (c.f. `_projection_tree`), or None if the value has none of
+  the fields. Like MongoDB, a tree is applied to each document in an array,
+  and other array items are left out. """
+  if tree is True:
+    return copy.deepcopy(value)
+
+  if isinstance(value, list):
+    return [_project(item, tree) for item in value if isinstance(item, dict)]
+
+  if isinstance(value, dict):
+    projected = {}
+    for name, subtree in tree.items():
+      if name in value:
+        projected_value = _project(value[name], subtree)
+        if projected_value is not None:
+          projected[name] = projected_value
+    return projected
+
+  return None
+
+
+def _parent(document, path, create):
+  """Returns the (dict, key) tuple of the field with passed dotted path in
+  passed document, creating missing parent subdocuments if `create` is True,
+  or (None, key) if there is a missing parent. Raises ValueError if a parent
+  is not a subdocument. """
+  parts = path.split(".")
+  for part in parts[:-1]:
+    if part not in document:
+      if not create:
+        return None, parts[-1]
+      document[part] = {}
+
+    document = document[part]
+    if not isinstance(document, dict):
+      raise ValueError("Can't set '{}', '{}' is not a subdocument".format(
+          path, part))
+
+  return document, parts[-1]
+
+
+def _matches(item, match):
+  """Returns whether passed array item has all the fields of passed match
+  dict with equal values. """
+  return (isinstance(item, dict) and
+      all(item.get(name) == value for name, value in match.items()))
+
+
+def compact_session(document):
+  """Returns a copy of the passed session document for the archive, where
+  links stored in the session document (before there was a link store) are
+  replaced by their digest (c.f. `wizard._link_digest`). """
+  document = copy.deepcopy(document)
+  for link_data in document.get("chaining", {}).get("items", []):
+    link_str = link_data.pop("link_str", None)
+    if link_str is not None and not link_data.get("link_digest"):
+      link_data["link_digest"] = hashlib.sha256(
+          link_str.encode("utf-8")).hexdigest()
+
+  return document
+
+
+class SessionArchive(object):
+  """Writes compacted session documents (c.f. `compact_session`) as
+  gzip-compressed JSON lines to a new file in a directory, e.g. to keep
+  expired sessions for usage analysis. The file is named after the time the
+  archive is opened, and only appears in the directory when the archive is
+  closed, if any session was added. """
+  __slots__ = ("directory", "path", "count", "_tmp_path", "_file")
+
+  def __init__(self, directory):
+    self.directory = directory
+    self.path = os.path.join(directory, time.strftime(
+        "sessions-%Y%m%dT%H%M%S.jsonl.gz", time.gmtime()))
+    self.count = 0
+
+    os.makedirs(directory, exist_ok=True)
+    fd, self._tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    os.close(fd)
+    self._file = gzip.open(self._tmp_path, "wt", encoding="utf-8")
+
+
+  def add(self, document):
+    """Writes passed session document to the archive. Values that are not
+    JSON serializable, e.g. the session id, are written as strings. """
+    self._file.write(json.dumps(compact_session(document), default=str,
+        sort_keys=True))
+    self._file.write("\n")
+    self.count += 1
+
+
+  def close(self):
+    """Closes the archive, i.e. moves the file into place, or removes it if
+    no session was added. """
+    if self._file.closed:
+      return
+
+    self._file.close()
+    if self.count:
+      os.replace(self._tmp_path, self.path)
+    else:
+      os.remove(self._tmp_path)
+
+
+  def __enter__(self):
+    return self
+
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+
+class MongoSessionStore(object):
+  """Stores session documents in a MongoDB collection, with the session id as
+  document id. """
+  __slots__ = ("_collection",)
+
+  def __init__(self, collection):
+    """
+    Args:
+      collection: a pymongo Collection, e.g. `mongo.db.session_collection`
+    """
+    self._collection = collection
+
+
+  def _update_one(self, query, update, upsert=False):
+    """Updates one session document with passed update document, which also
+    increments the version and sets the timestamps. """
+    now = time.time()
+    update = dict(update, **{"$inc": {"version": 1},
+        "$max": {"last_activity": now}})
+    if upsert:
+      update["$setOnInsert"] = {"created": now}
+
+    return self._collection.update_one(query, update, upsert=upsert)
+
+
+  def find(self, session_id, fields):
+    """Returns a dict with the passed dotted field paths of the session
+    document with passed id, fetched with a projection. Fields that are not
+    found are left out. Returns an empty dict if there is no such document.
+    """
+    result = self._collection.find_one({"_id": session_id},
+        {field: True for field in fields}) or {}
+    result.pop("_id", None)
+    return result
+
+
+  def set_fields(self, session_id, fields):
+    """Sets passed fields, i.e. a dict of dotted field paths and values, in
+    the session document with passed id, which is inserted if it does not
+    exist. """
+    self._update_one({"_id": session_id}, {"$set": fields}, upsert=True)
+
+
+  def push_items(self, session_id, path, items):
+    """Appends passed items to the array with passed dotted path in the
+    session document with passed id, which is inserted if it does not exist.
+    """
+    self._update_one({"_id": session_id}, {"$push": {path: {"$each": items}}},
+        upsert=True)
+
+
+  def pull_items(self, session_id, path, match):
+    """Removes the items that have all the fields of passed match dict with
+    equal values from the array with passed dotted path in the session
+    document with passed id. """
+    self._update_one({"_id": session_id}, {"$pull": {path: match}})
+
+
+  def put_item(self, session_id, path, key, item):
+    """Replaces the item that has the same value in the field with passed key
+    as passed item in the array with passed dotted path in the session
+    document with passed id, or appends passed item if there is no such item.
+    Returns whether an item was replaced. """
+    # NOTE: Unfortunately we can't "upsert" on arrays but must first try to
+    # update and if that does not work insert.
+    # https://docs.mongodb.com/manual/reference/operator/update/positional/#upsert
+    # https://stackoverflow.com/questions/23470658/mongodb-upsert-sub-document
+    result = self._update_one(
+        {"_id": session_id, path + "." + key: item[key]},
+        {"$set": {path + ".$": item}})
+    if result.matched_count:
+      return True
+
+    self._update_one(
+        # This query part should deal with concurrent requests
+        {"_id": session_id, path + "." + key: {"$ne": item[key]}},
+        {"$push": {path: item}}, upsert=True)
+    return False
+
+
+  def touch(self, session_id):
+    """Sets the last activity of the session document with passed id to now,
+    without changing its version. """
+    self._collection.update_one({"_id": session_id},
+        {"$max": {"last_activity": time.time()}})
+
+
+  def expire(self, before, archive=None, batch_size=500):
+    """Removes the session documents whose last activity is before passed
+    timestamp, after adding them to passed archive (c.f. `SessionArchive`).
+    Documents without last activity, i.e. stored before it was tracked, get
+    the current time as last activity, so that they expire later. Returns
+    the number of removed documents. """
+    self._collection.create_index("last_activity")
+    self._collection.create_index("created")
+    self._collection.update_many({"last_activity": {"$exists": False}},
+        {"$set": {"last_activity": time.time()}})
+
+    expired_query = {"last_activity": {"$lt": before}}
+    projection = None if archive is not None else {"_id": True}
+    removed = 0
+    while True:
+      documents = list(self._collection.find(expired_query, projection,
+          limit=batch_size))
+      if not documents:
+        return removed
+
+      if archive is not None:
+        for document in documents:
+          archive.add(document)
+
+      # Documents that were used since they were found are not removed
+      result = self._collection.delete_many(dict(expired_query,
+          _id={"$in": [document["_id"] for document in documents]}))
+      removed += result.deleted_count
+      if result.deleted_count < len(documents):
+        # Don't find the documents that were used again
+        expired_query["_id"] = {"$nin": [document["_id"]
+            for document in documents]}
+
+
+  def stats(self, since):
+    """Returns a dict with the number of session documents ("sessions"),
+    their total (uncompressed) size in bytes ("bytes"), and the number of
+    session documents created since passed timestamp ("created"). """
+    coll_stats = self._collection.database.command("collStats",
+        self._collection.name)
+    return {
+      "sessions": coll_stats.get("count", 0),
+      "bytes": coll_stats.get("size", 0),
+      "created": self._collection.count_documents(
+          {"created": {"$gte": since}}),
+    }
+
+
+def _stamp(document, created, increment):
+  """Sets the last activity of passed session document to now, and the
+  creation time if the document was `created`, and increments the version
+  if `increment` is True. """
+  now = time.time()
+  if created:
+    document["created"] = now
+  if increment:
+    document["version"] = document.get("version", 0) + 1
+  document["last_activity"] = max(document.get("last_activity", 0), now)
+
+
+class _DocumentSessionStore(object):
+  """Implements the session store interface on session documents that are
+  loaded and updated as a whole, with `_load` and `_update`. """
+  __slots__ = ()
+
+  def _load(self, session_id):
+    """Returns the session document with passed id or None. The document
+    must not be modified. """
+    raise NotImplementedError
+
+
+  def _update(self, session_id, update, insert, increment=True):
+    """Calls passed update function with the session document with passed
+    id, which is created if it does not exist and `insert` is True, and
+    stores the updated document, stamped with `_stamp`. Returns the result of
+    the update function, or None if there is no document. """
+    raise NotImplementedError
+
+
+  def touch(self, session_id):
+    """Sets the last activity of the session document with passed id to now,
+    without changing its version. """
+    self._update(session_id, lambda document: None, insert=False,
+        increment=False)
+
+
+  def find(self, session_id, fields):
+    """Returns a dict with the passed dotted field paths of the session
+    document with passed id. Fields that are not found are left out. Returns
+    an empty dict if there is no such document. """
+    document = self._load(session_id)
+    if document is None:
+      return {}
+    return _project(document, _projection_tree(fields))
+
+
+  def set_fields(self, session_id, fields):
+    """Sets passed fields, i.e. a dict of dotted field paths and values, in
+    the session document with passed id, which is inserted if it does not
+    exist. """
+    def _set_fields(document):
+      for path, value in fields.items():
+        parent, name = _parent(document, path, create=True)
+        parent[name] = copy.deepcopy(value)
+
+    self._update(session_id, _set_fields, insert=True)
+
+
+  def push_items(self, session_id, path, items):
+    """Appends passed items to the array with passed dotted path in the
+    session document with passed id, which is inserted if it does not exist.
+    """
+    def _push_items(document):
+      parent, name = _parent(document, path, create=True)
+      parent.setdefault(name, []).extend(copy.deepcopy(items))
+
+    self._update(session_id, _push_items, insert=True)
+
+
+  def pull_items(self, session_id, path, match):
+    """Removes the items that have all the fields of passed match dict with
+    equal values from the array with passed dotted path in the session
+    document with passed id. """
+    def _pull_items(document):
+      parent, name = _parent(document, path, create=False)
+      if parent is not None and name in parent:
+        parent[name] = [item for item in parent[name]
+            if not _matches(item, match)]
+
+    self._update(session_id, _pull_items, insert=False)
+
+
+  def put_item(self, session_id, path, key, item):
+    """Replaces the item that has the same value in the field with passed key
+    as passed item in the array with passed dotted path in the session
+    document with passed id, or appends passed item if there is no such item.
+    Returns whether an item was replaced. """
+    def _put_item(document):
+      parent, name = _parent(document, path, create=True)
+      items = parent.setdefault(name, [])
+      for idx, stored_item in enumerate(items):
+        if _matches(stored_item, {key: item[key]}):
+          items[idx] = copy.deepcopy(item)
+          return True
+
+      items.append(copy.deepcopy(item))
+      return False
+
+    return self._update(session_id, _put_item, insert=True)
+
+
+class MemorySessionStore(_DocumentSessionStore):
+  """Keeps session documents in memory, of at most `max_sessions` sessions.
+  The least recently used sessions are dropped, i.e. this store is not
+  shared between processes, and does not survive a restart. """
+  __slots__ = ("_documents", "_lock", "_max_sessions")
+
+  def __init__(self, max_sessions=10000):
+    self._documents = collections.OrderedDict()
+    self._lock = threading.Lock()
+    self._max_sessions = max_sessions
+
+
+  def _load(self, session_id):
+    with self._lock:
+      document = self._documents.get(session_id)
+      if document is not None:
+        self._documents.move_to_end(session_id)
+
+    return document
+
+
+  def _update(self, session_id, update, insert, increment=True):
+    with self._lock:
+      stored_document = self._documents.get(session_id)
+      if stored_document is None and not insert:
+        return None
+
+      # Update a copy, so that documents returned by `_load` don't change
+      document = copy.deepcopy(stored_document or {})
+      result = update(document)
+      _stamp(document, stored_document is None, increment)
+
+      self._documents[session_id] = document
+      self._documents.move_to_end(session_id)
+      while len(self._documents) > self._max_sessions:
+        self._documents.popitem(last=False)
+
+    return result
+
+
+  def expire(self, before, archive=None):
+    """Removes the session documents whose last activity is before passed
+    timestamp, after adding them to passed archive (c.f. `SessionArchive`).
+    Returns the number of removed documents. """
+    with self._lock:
+      expired = [(session_id, document)
+          for session_id, document in self._documents.items()
+          if document.get("last_activity", 0) < before]
+      for session_id, _ in expired:
+        del self._documents[session_id]
+
+    if archive is not None:
+      for session_id, document in expired:
+        archive.add(dict(document, _id=session_id))
+
+    return len(expired)
+
+
+  def stats(self, since):
+    """Returns a dict with the number of session documents ("sessions"),
+    their total size in bytes as JSON ("bytes"), and the number of session
+    documents created since passed timestamp ("created"). """
+    with self._lock:
+      documents = list(self._documents.values())
+
+    return {
+      "sessions": len(documents),
+      "bytes": sum(len(json.dumps(document, default=str))
+          for document in documents),
+      "created": sum(1 for document in documents
+          if document.get("created", 0) >= since),
+    }
+
+
+  def __len__(self):
+    return len(self._documents)
+
+
+class SQLiteSessionStore(_DocumentSessionStore):
+  """Stores session documents as JSON in an SQLite database, with the session
+  id (as string) as primary key, and the timestamps in indexed columns. The
+  database is used in WAL mode, so that reads don't wait for writes, and each
+  thread has its own connection. """
+  __slots__ = ("_path", "_local")
+
+  def __init__(self, path):
+    """
+    Args:
+      path: the path of the database file, which is created if it does not
+          exist
+    """
+    self._path = path
+    self._local = threading.local()
+
+    connection = self._connection()
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("CREATE TABLE IF NOT EXISTS sessions ("
+        "id TEXT PRIMARY KEY, document TEXT NOT NULL)")
+
+    # Add the timestamp columns to databases created before they existed
+    columns = [row[1] for row in connection.execute(
+        "PRAGMA table_info(sessions)")]
+    for column in ["last_activity", "created"]:
+      if column not in columns:
+        connection.execute(
+            "ALTER TABLE sessions ADD COLUMN {} REAL".format(column))
+      connection.execute("CREATE INDEX IF NOT EXISTS sessions_{0} "
+          "ON sessions ({0})".format(column))
+
+
+  def _connection(self):
+    """Returns the database connection of the current thread. """
+    connection = getattr(self._local, "connection", None)
+    if connection is None:
+      # Transactions are started explicitly (c.f. `_update`)
+      connection = sqlite3.connect(self._path, isolation_level=None,
+          timeout=30)
+      connection.execute("PRAGMA synchronous=NORMAL")
+      self._local.connection = connection
+
+    return connection
+
+
+  def _load(self, session_id):
+    row = self._connection().execute(
+        "SELECT document FROM sessions WHERE id = ?",
+        (str(session_id),)).fetchone()
+    if row is None:
+      return None
+    return json.loads(row[0])
+
+
+  def _update(self, session_id, update, insert, increment=True):
+    connection = self._connection()
+    # Lock the database for writing before reading the document, so that
+    # concurrent updates of the same document are not lost
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+      row = connection.execute("SELECT document FROM sessions WHERE id = ?",
+          (str(session_id),)).fetchone()
+      if row is None and not insert:
+        connection.execute("ROLLBACK")
+        return None
+
+      document = json.loads(row[0]) if row is not None else {}
+      result = update(document)
+      _stamp(document, row is None, increment)
+      connection.execute("INSERT OR REPLACE INTO sessions (id, document, "
+          "last_activity, created) VALUES (?, ?, ?, ?)", (str(session_id),
+          json.dumps(document), document["last_activity"],
+          document.get("created")))
+
+    except BaseException:
+      connection.execute("ROLLBACK")
+      raise
+
+    connection.execute("COMMIT")
+    return result
+
+
+  def expire(self, before, archive=None, batch_size=500):
+    """Removes the session documents whose last activity is before passed
+    timestamp, after adding them to passed archive (c.f. `SessionArchive`).
+    Documents without last activity, i.e. stored before it was tracked, get
+    the current time as last activity, so that they expire later. Returns
+    the number of removed documents. """
+    connection = self._connection()
+    connection.execute("UPDATE sessions SET last_activity = ? "
+        "WHERE last_activity IS NULL", (time.time(),))
+
+    removed = 0
+    while True:
+      connection.execute("BEGIN IMMEDIATE")
+      try:
+        rows = connection.execute("SELECT id, document FROM sessions "
+            "WHERE last_activity < ? LIMIT ?", (before, batch_size)).fetchall()
+        if archive is not None:
+          for session_id, document in rows:
+            archive.add(dict(json.loads(document), _id=session_id))
+
+        connection.executemany("DELETE FROM sessions WHERE id = ?",
+            [(session_id,) for session_id, _ in rows])
+
+      except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+
+      connection.execute("COMMIT")
+      removed += len(rows)
+      if len(rows) < batch_size:
+        return removed
+
+
+  def stats(self, since):
+    """Returns a dict with the number of session documents ("sessions"),
+    their total size in bytes as JSON ("bytes"), and the number of session
+    documents created since passed timestamp ("created"). """
+    sessions, size, created = self._connection().execute(
+        "SELECT COUNT(*), SUM(LENGTH(document)), "
+        "SUM(created >= ?) FROM sessions", (since,)).fetchone()
+    return {"sessions": sessions, "bytes": size or 0, "created": created or 0}
+
+
+  def __len__(self):
+    return self._connection().execute(
+        "SELECT COUNT(*) FROM sessions").fetchone()[0]
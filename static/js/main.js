@@ -37,11 +37,19 @@
  * Below function gets executed when the DOM is fully loaded
  ****************************************************************/
 $(function() {
+  /*
+   * Load the tools of each option grid from the server (c.f.
+   * `load_tool_options`)
+   */
+  $(".opt-row[data-tools-url]").each(function() {
+    load_tool_options($(this));
+  });
+
   /*
    * Register click listener to toggle the display of forms attached to
-   * options of the option grid.
+   * options of the option grid, including options that are loaded later.
    */
-  $(".opt-content").on("click", function(evt) {
+  $(document).on("click", ".opt-content", function(evt) {
     // Find the form that belongs to the clicked option
     var $opt_form_cont = $(this).parent(".opt-cell").find(".opt-form-cont");
 
@@ -407,6 +415,31 @@ function show_messages(messages) {
 }
 
 
+/*
+ * Search the tools whose URL (including the category parameter) is stored in
+ * `data-tools-url` of the passed option grid row, one page at a time, and add
+ * an option for each tool, by cloning the hidden `.tool-option` template cell
+ * of the row and filling in the tool name and command.
+ */
+function load_tool_options($row, offset) {
+  offset = offset || 0;
+  $.getJSON($row.data("tools-url"), {"offset": offset}, function(response) {
+    var $template = $row.find(".template.tool-option");
+    response.tools.forEach(function(tool) {
+      var $option = $template.clone();
+      $option.find(".opt-text").text(tool.name);
+      $option.find("input[name$='cmd[]']").val(tool.cmd);
+      $option.removeClass("template").appendTo($row);
+    });
+
+    // Load the next page, if any
+    var next_offset = response.offset + response.tools.length;
+    if (response.tools.length && next_offset < response.total) {
+      load_tool_options($row, next_offset);
+    }
+  });
+}
+
 /*
  * Initialize a functionary public key file upload dropzone on a
  * passed JQuery element and return the Dropzone object
@@ -0,0 +1,135 @@
+import pickle
+import unittest
+
+import securesystemslib.exceptions
+
+import create_layout
+from artifact_table import ArtifactTable, PathPool
+
+class Test_ArtifactTable(unittest.TestCase):
+
+  '''Check whether artifact tables behave like the artifact dicts of a
+    link. '''
+
+  before = {
+    'one.tgz': {'sha256': '1234567890abcdef'},
+    'foo/two.tgz': {'sha256': '0000001111112222'},
+    'three.txt': {'sha256': '1111222233334444'},
+    'bar/bat/four.tgz': {'sha256': '6677889900112233'},
+    'seven.txt': {'sha256': 'ABCDEF'},
+  }
+  after = {
+    'five.txt': {'sha256': '5555555555555555', 'sha512': 'abcdef'},
+    'one.tgz': {'sha256': '1234567890abcdef'},
+    'foo/two.tgz': {'sha256': 'ffffffffffffffff'},
+    'bar/bat/four.tgz': {'md5': '6677889900112233'},
+    'baz/six.tgz': {'sha256': '6666666666666666'},
+    'seven.txt': {'sha256': 'ABCDEF'},
+  }
+
+  def _table(self, artifacts, pool=None):
+    table = ArtifactTable(pool)
+    for path, hash_dict in artifacts.items():
+      table.add(path, hash_dict)
+    return table
+
+  def test_mapping(self):
+    for artifacts in [self.before, self.after, {}]:
+      table = self._table(artifacts)
+      self.assertEqual(dict(table), artifacts)
+      self.assertEqual(len(table), len(artifacts))
+      self.assertEqual([path for path, _ in table.sorted_items()],
+          sorted(artifacts))
+      self.assertEqual(dict(table.iter_items()), artifacts)
+      self.assertNotIn('missing.txt', table)
+      with self.assertRaises(KeyError):
+        table['missing.txt']
+
+  def test_irregular_first_artifact(self):
+    table = ArtifactTable()
+    table.add('a', {'sha256': 'ABC'})
+    table.add('b', {'sha256': 'abcd'})
+    self.assertEqual(dict(table),
+        {'a': {'sha256': 'ABC'}, 'b': {'sha256': 'abcd'}})
+
+  def test_duplicate_paths(self):
+    table = ArtifactTable()
+    table.add('b', {'sha256': 'abcd'})
+    table.add('a', {'sha256': '0000'})
+    table.add('b', {'sha256': 'ABC'})
+    table.add('b', {'sha256': 'ffff'})
+    self.assertEqual(dict(table),
+        {'a': {'sha256': '0000'}, 'b': {'sha256': 'ffff'}})
+
+  def test_invalid_artifacts(self):
+    for path, hash_dict in [(1, {'sha256': 'abcd'}), ('a', 'abcd'),
+        ('a', {'sha256': 'not hex'}), ('a', {'sha256': 1})]:
+      with self.assertRaises(securesystemslib.exceptions.FormatError):
+        ArtifactTable().add(path, hash_dict)
+
+  def test_diff(self):
+    pool = PathPool()
+    before = self._table(self.before, pool)
+    after = self._table(self.after, pool)
+
+    changes = tuple({pool.path(path_id) for path_id in path_ids}
+        for path_ids in before.diff(after))
+    self.assertEqual(changes, create_layout.changes_between_snapshots(
+        self.before, self.after))
+    self.assertEqual(create_layout.changes_between_snapshots(before, after),
+        changes)
+
+    with self.assertRaises(ValueError):
+      before.diff(self._table(self.after))
+
+  def test_digest_key(self):
+    # Regular and irregular artifacts with the same digest have the same key
+    table = ArtifactTable()
+    table.add('a', {'sha256': 'abcd'})
+    table.add('b', {'sha256': 'abcd', 'md5': '00'})
+    other_table = ArtifactTable()
+    other_table.add('b', {'md5': '00', 'sha256': 'abcd'})
+    other_table.add('a', {'sha256': 'abcd'})
+    for path in ['a', 'b']:
+      self.assertEqual(table.digest_key(path), other_table.digest_key(path))
+
+  def test_pickle(self):
+    pool = PathPool()
+    self._table(self.before, pool)
+    table = self._table(self.after, pool)
+    unpickled = pickle.loads(pickle.dumps(table))
+    self.assertIsNot(unpickled.pool, pool)
+    self.assertEqual(dict(unpickled), self.after)
+
+    # Tables that share a pool are unpickled with one shared pool
+    before, after = pickle.loads(pickle.dumps((self._table(self.before, pool),
+        table)))
+    self.assertIs(before.pool, after.pool)
+    self.assertEqual(dict(before), self.before)
+    self.assertEqual(before.diff(after), self._table(self.before,
+        pool).diff(table))
+
+  def test_pickle_path_pool(self):
+    pool = PathPool()
+    paths = ['dir/file{}'.format(idx) for idx in range(3000)]
+    for path in paths:
+      pool.intern(path)
+    unpickled = pickle.loads(pickle.dumps(pool))
+    self.assertEqual([unpickled.lookup(path) for path in paths],
+        list(range(len(paths))))
+    self.assertEqual(unpickled.intern('new'), len(paths))
+
+  def test_path_pool(self):
+    pool = PathPool()
+    paths = ['dir{}/file{}'.format(idx % 7, idx) for idx in range(5000)]
+    paths.append('café/\udcff')
+    ids = [pool.intern(path) for path in paths]
+    self.assertEqual(ids, list(range(len(paths))))
+    self.assertEqual([pool.intern(path) for path in paths], ids)
+    self.assertEqual([pool.path(path_id) for path_id in ids], paths)
+    self.assertEqual(pool.lookup(paths[42]), 42)
+    self.assertIsNone(pool.lookup('missing'))
+    self.assertEqual(len(pool), len(paths))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -1,6 +1,20 @@
+import os
+import io
+import pickle
+import fnmatch
+import tarfile
+import tempfile
 import unittest
+import warnings
+import concurrent.futures
+from unittest import mock
 import create_layout
+import link_stream
 import in_toto.models.link
+import in_toto.models.layout
+import in_toto.models.metadata
+import in_toto.verifylib
+from artifact_table import PathPool
 
 class Test_CreateLayout(unittest.TestCase):
 
@@ -195,6 +209,305 @@ class Test_CreateLayout(unittest.TestCase):
     self.assertTrue(expected_products,
         create_layout.create_product_rules(second_link))
 
+  def test_shared_snapshot_diff(self):
+    # Rules created with a shared diff must equal rules created without
+    first_link = in_toto.models.link.Link.read(self.first_step_link_str)
+    second_link = in_toto.models.link.Link.read(self.second_step_link_str)
+    diff = create_layout.SnapshotDiff.from_link(second_link)
+
+    self.assertSetEqual(diff.unchanged, {'one.tgz', 'bar/bat/four.tgz'})
+    self.assertListEqual(diff.sorted('added'), ['baz/six.tgz', 'five.txt'])
+    self.assertIs(diff.sorted('added'), diff.sorted('added'))
+
+    self.assertEqual(
+        create_layout.create_material_rules(first_link, second_link, diff),
+        create_layout.create_material_rules(first_link, second_link))
+    self.assertEqual(
+        create_layout.create_product_rules(second_link, diff),
+        create_layout.create_product_rules(second_link))
+
+  def _assert_same_consuming_rules(self, rules, compressed_rules):
+    # Each artifact must have the same sequence of kinds of rules before and
+    # after compression
+    for rule in rules[:-1]:
+      artifact = rule[1]
+      self.assertEqual(
+          [r[:1] + r[2:] for r in rules if r[1] in (artifact, '*')],
+          [r[:1] + r[2:] for r in compressed_rules
+          if fnmatch.fnmatch(artifact, r[1])])
+
+  def test_compress_rules(self):
+    rules = [
+      ['MATCH', 'src/a/x.py', 'WITH', 'PRODUCTS', 'FROM', 'clone'],
+      ['MATCH', 'src/a/y.py', 'WITH', 'PRODUCTS', 'FROM', 'clone'],
+      ['MATCH', 'src/b/z.py', 'WITH', 'PRODUCTS', 'FROM', 'fetch'],
+      ['MATCH', 'src/c/z.py', 'WITH', 'PRODUCTS', 'FROM', 'clone'],
+      ['DELETE', 'src/a/x.py'],
+      ['DELETE', 'tmp/a/1'],
+      ['DELETE', 'tmp/b/2'],
+      ['ALLOW', 'doc/[draft]/1.md'],
+      ['ALLOW', 'doc/[draft]/2.md'],
+      ['ALLOW', 'README.md'],
+      ['ALLOW', 'LICENSE'],
+      ['DISALLOW', '*']
+    ]
+    # src/a/x.py is also deleted, i.e. src/a is not collapsed
+    expected_rules = [
+      ['MATCH', 'src/a/x.py', 'WITH', 'PRODUCTS', 'FROM', 'clone'],
+      ['MATCH', 'src/a/y.py', 'WITH', 'PRODUCTS', 'FROM', 'clone'],
+      ['MATCH', 'src/c/z.py', 'WITH', 'PRODUCTS', 'FROM', 'clone'],
+      ['MATCH', 'src/b/z.py', 'WITH', 'PRODUCTS', 'FROM', 'fetch'],
+      ['DELETE', 'src/a/x.py'],
+      ['DELETE', 'tmp/*'],
+      ['ALLOW', 'LICENSE'],
+      ['ALLOW', 'README.md'],
+      ['ALLOW', 'doc/*'],
+      ['DISALLOW', '*']
+    ]
+    compressed_rules = create_layout.compress_rules(rules)
+    self.assertEqual(compressed_rules, expected_rules)
+    self._assert_same_consuming_rules(rules, compressed_rules)
+
+  def test_compressed_rules_verify(self):
+    # A material that was produced with a different digest is not consumed
+    # by its MATCH rule but by its DELETE rule
+    prev_link = in_toto.models.link.Link(name='prev', products={
+        'd/a': {'sha256': 'aaaa'}, 'd/b': {'sha256': 'bbbb'}})
+    link = in_toto.models.link.Link(name='cur', materials={
+        'd/a': {'sha256': 'ffff'}, 'd/b': {'sha256': 'bbbb'}}, products={
+        'd/b': {'sha256': 'bbbb'}})
+    links = {'prev': prev_link, 'cur': link}
+
+    with warnings.catch_warnings():
+      warnings.simplefilter('ignore')
+      rules = create_layout.create_material_rules(prev_link, link)
+      compressed_rules = create_layout.create_material_rules(prev_link, link,
+          compress=True)
+
+    self.assertEqual(compressed_rules, rules)
+    for material_rules in [rules, compressed_rules]:
+      in_toto.verifylib.verify_item_rules('cur', 'materials', material_rules,
+          links)
+
+    # Directories whose artifacts all have the same rules are collapsed
+    link = in_toto.models.link.Link(name='cur', materials={
+        'd/a': {'sha256': 'ffff'}, 'd/b': {'sha256': 'bbbb'}})
+    links['cur'] = link
+    with warnings.catch_warnings():
+      warnings.simplefilter('ignore')
+      compressed_rules = create_layout.create_material_rules(prev_link, link,
+          compress=True)
+    self.assertEqual(compressed_rules, [
+        ['MATCH', 'd/*', 'WITH', 'PRODUCTS', 'FROM', 'prev'],
+        ['DELETE', 'd/*'], ['DISALLOW', '*']])
+    in_toto.verifylib.verify_item_rules('cur', 'materials', compressed_rules,
+        links)
+
+  def test_compress_rules_keeps_pattern_directories(self):
+    rules = [
+      ['ALLOW', 'doc/[draft]/1.md'],
+      ['ALLOW', 'doc/[draft]/2.md'],
+      ['CREATE', 'doc/index.md'],
+      ['DISALLOW', '*']
+    ]
+    self.assertEqual(create_layout.compress_rules(rules), rules)
+
+  def test_create_compressed_product_rules(self):
+    # No directory of the second step has more than one product
+    second_link = in_toto.models.link.Link.read(self.second_step_link_str)
+    self.assertEqual(
+        create_layout.create_product_rules(second_link, compress=True),
+        create_layout.create_product_rules(second_link))
+
+    products = dict(self.second_step_link_str['products'])
+    products['baz/seven.tgz'] = {'sha256': '7777777777777777'}
+    link = in_toto.models.link.Link.read(
+        dict(self.second_step_link_str, products=products))
+    rules = create_layout.create_product_rules(link)
+    compressed_rules = create_layout.create_product_rules(link, compress=True)
+    self.assertEqual(len(rules) - 1, len(compressed_rules))
+    self.assertIn(['CREATE', 'baz/*'], compressed_rules)
+    self._assert_same_consuming_rules(rules, compressed_rules)
+
+  def test_create_layout_with_executor(self):
+    # Steps created on an executor must equal steps created in order
+    links = [
+      in_toto.models.link.Link.read(self.first_step_link_str),
+      in_toto.models.link.Link.read(self.second_step_link_str),
+      in_toto.models.link.Link.read(dict(self.first_step_link_str,
+          name='third_step', materials=self.second_step_link_str['products'])),
+      in_toto.models.link.Link.read(dict(self.second_step_link_str,
+          name='fourth_step')),
+    ]
+    with warnings.catch_warnings():
+      warnings.simplefilter('ignore')
+      layout = create_layout.create_layout_from_ordered_links(links)
+
+      with mock.patch.object(create_layout, 'MIN_ARTIFACTS_PER_TASK', 0), \
+          concurrent.futures.ProcessPoolExecutor(2) as executor:
+        parallel_layout = create_layout.create_layout_from_ordered_links(
+            links, executor=executor)
+
+    self.assertEqual(
+        [step.name for step in parallel_layout.steps],
+        ['first_step', 'second_step', 'third_step', 'fourth_step'])
+    self.assertEqual(repr(parallel_layout.steps), repr(layout.steps))
+
+  def test_create_layout_with_executor_streamed_links(self):
+    # Links read with link_stream are sent to workers with one shared pool
+    # per task, i.e. materials and products are diffed by path id
+    link_dicts = [self.first_step_link_str, self.second_step_link_str,
+        dict(self.first_step_link_str, name='third_step',
+        materials=self.second_step_link_str['products'])]
+    pool = PathPool()
+    links = [link_stream.read_link(io.StringIO(repr(
+        in_toto.models.link.Link.read(link_dict))), pool=pool)
+        for link_dict in link_dicts]
+
+    with mock.patch.object(create_layout, 'MIN_ARTIFACTS_PER_TASK', 0):
+      tasks = create_layout._split_steps(links, 2)
+    _, step_links, _ = pickle.loads(pickle.dumps(tasks[-1]))
+    for step_link in step_links:
+      self.assertIs(step_link.materials.pool, step_link.products.pool)
+
+    with warnings.catch_warnings():
+      warnings.simplefilter('ignore')
+      layout = create_layout.create_layout_from_ordered_links(links)
+
+      with mock.patch.object(create_layout, 'MIN_ARTIFACTS_PER_TASK', 0), \
+          concurrent.futures.ProcessPoolExecutor(2) as executor:
+        parallel_layout = create_layout.create_layout_from_ordered_links(
+            links, executor=executor)
+
+    self.assertEqual(repr(parallel_layout.steps), repr(layout.steps))
+
+  def test_command_line(self):
+    # Create one layout per link directory and link archive
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      link_dir = os.path.join(tmp_dir, 'project-a')
+      os.mkdir(link_dir)
+      archive_path = os.path.join(tmp_dir, 'project-b.tar.gz')
+      with tarfile.open(archive_path, 'w:gz') as link_archive:
+        for link_dict in [self.first_step_link_str, self.second_step_link_str]:
+          link = in_toto.models.link.Link.read(link_dict)
+          file_name = link.name + '.12345678.link'
+          in_toto.models.metadata.Metablock(signed=link).dump(
+              os.path.join(link_dir, file_name))
+          link_archive.add(os.path.join(link_dir, file_name), file_name)
+
+      with warnings.catch_warnings(), \
+          mock.patch('sys.stdout', new_callable=io.StringIO) as stdout:
+        warnings.simplefilter('ignore')
+        exit_code = create_layout.main(['--jobs', '1',
+            '--steps', 'second_step,first_step', '--output-dir', tmp_dir,
+            link_dir, archive_path])
+
+      self.assertEqual(exit_code, 0)
+      self.assertIn('project-a: 2 steps, 13 artifacts', stdout.getvalue())
+      for name in ['project-a', 'project-b']:
+        layout = in_toto.models.metadata.Metablock.load(
+            os.path.join(tmp_dir, name + '.layout')).signed
+        self.assertEqual([step.name for step in layout.steps],
+            ['second_step', 'first_step'])
+
+  def test_create_layout_incrementally(self):
+    links = {
+      'a': in_toto.models.link.Link.read(self.first_step_link_str),
+      'b': in_toto.models.link.Link.read(self.second_step_link_str),
+      'c': in_toto.models.link.Link.read(dict(self.second_step_link_str,
+          name='third_step')),
+      'c2': in_toto.models.link.Link.read(dict(self.first_step_link_str,
+          name='third_step')),
+      'd': in_toto.models.link.Link.read(dict(self.second_step_link_str,
+          name='fourth_step')),
+      'e': in_toto.models.link.Link.read(dict(self.first_step_link_str,
+          name='fifth_step', materials={'seven.txt': {'sha256': '77'}})),
+    }
+    loaded_keys = []
+    def _load_link(key):
+      loaded_keys.append(key)
+      return links[key]
+
+    progress = []
+    create_layout.create_layout_incrementally(['a', 'b'], _load_link, {},
+        progress=lambda *args: progress.append(args))
+    self.assertEqual(progress, [(1, 2), (2, 2)])
+
+    step_cache = {}
+    for keys, expected_loaded_keys in [
+        (['a', 'b', 'c', 'd', 'e'], ['a', 'b', 'c', 'd', 'e']),
+        (['a', 'b', 'c', 'd', 'e'], []),
+        # Replacing a link recreates its step and the steps that MATCH
+        # materials with it, without loading the unchanged links
+        (['a', 'b', 'c2', 'd', 'e'], ['c2', 'd']),
+        (['a', 'b', 'c2', 'd', 'e'], []),
+        # Removing a link does not recreate steps that don't depend on it
+        (['a', 'b', 'c2', 'e'], []),
+        (['a', 'b', 'c2'], [])]:
+      del loaded_keys[:]
+      with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        layout = create_layout.create_layout_incrementally(keys, _load_link,
+            step_cache)
+        expected_layout = create_layout.create_layout_from_ordered_links(
+            [links[key] for key in keys])
+
+      self.assertEqual(loaded_keys, expected_loaded_keys)
+      self.assertEqual(repr(layout.steps), repr(expected_layout.steps))
+      # The rules of each step, the index of each link and the path pool of
+      # the indexes
+      self.assertEqual(len(step_cache), 2 * len(keys) + 1)
+
+  def test_order_link_items(self):
+    items = [
+      {'step_name': 'build', 'file_name': 'build.a.link'},
+      {'step_name': 'unknown', 'file_name': 'unknown.link'},
+      {'step_name': 'clone', 'file_name': 'clone.link'},
+      {'step_name': 'build', 'file_name': 'build.b.link'},
+    ]
+    self.assertEqual([item['file_name'] for item in
+        create_layout.order_link_items(['clone', 'build', 'package'], items)],
+        ['clone.link', 'build.a.link', 'build.b.link'])
+    self.assertEqual(create_layout.order_link_items([], items), [])
+
+  def test_match_materials_with_producer(self):
+    links = [
+      in_toto.models.link.Link(name='checkout', products={
+        'src/a.py': {'sha256': 'aaaa'},
+        'src/b.py': {'sha256': 'bbbb'}}),
+      in_toto.models.link.Link(name='build', materials={
+        'src/a.py': {'sha256': 'aaaa'}}, products={
+        'src/a.py': {'sha256': 'aaaa'},
+        'src/b.py': {'sha256': 'cccc'},
+        'a.bin': {'sha256': 'dddd'}}),
+      in_toto.models.link.Link(name='package', materials={
+        'src/a.py': {'sha256': 'aaaa'},
+        'src/b.py': {'sha256': 'bbbb'},
+        'a.bin': {'sha256': 'eeee'}}),
+    ]
+    expected_materials = [
+      # No producer with the same digest, matched by path with previous step
+      ['MATCH', 'a.bin', 'WITH', 'PRODUCTS', 'FROM', 'build'],
+      # Last producer with the same digest
+      ['MATCH', 'src/a.py', 'WITH', 'PRODUCTS', 'FROM', 'build'],
+      ['MATCH', 'src/b.py', 'WITH', 'PRODUCTS', 'FROM', 'checkout'],
+      ['DELETE', 'a.bin'],
+      ['DELETE', 'src/a.py'],
+      ['DELETE', 'src/b.py'],
+      ['DISALLOW', '*'],
+    ]
+
+    pool = PathPool()
+    with warnings.catch_warnings():
+      warnings.simplefilter('ignore')
+      layout = create_layout.create_layout_from_ordered_links(links)
+      streamed_layout = create_layout.create_layout_from_ordered_links([
+          link_stream.read_link(io.StringIO(repr(link)), pool=pool)
+          for link in links])
+    self.assertEqual(layout.steps[2].expected_materials, expected_materials)
+    self.assertEqual(streamed_layout.steps[2].expected_materials,
+        expected_materials)
+
   # TODO: missing test for create_layout_from_ordered_links
 
   if __name__ == '__main__':
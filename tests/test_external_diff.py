@@ -0,0 +1,78 @@
+import io
+import os
+import tempfile
+import unittest
+
+import in_toto.models.link
+import in_toto.models.metadata
+
+import create_layout
+import external_diff
+import link_stream
+
+class Test_ExternalDiff(unittest.TestCase):
+
+  '''Check whether snapshot diffs on disk are equal to diffs in memory. '''
+
+  before = {
+    'one.tgz': {'sha256': '1234567890abcdef'},
+    'foo/two.tgz': {'sha256': '0000001111112222'},
+    'three.txt': {'sha256': '1111222233334444'},
+    'bar/bat/four.tgz': {'sha256': '6677889900112233'},
+    'café/ü.txt': {'sha256': 'ABCDEF'},
+    'upper.txt': {'sha256': 'ABCDEF'},
+    'multi.txt': {'sha256': 'abcd', 'md5': '00'},
+  }
+  after = {
+    'five.txt': {'sha256': '5555555555555555', 'sha512': 'abcdef'},
+    'one.tgz': {'sha256': '1234567890abcdef'},
+    'foo/two.tgz': {'sha256': 'ffffffffffffffff'},
+    'bar/bat/four.tgz': {'md5': '6677889900112233'},
+    'baz/six.tgz': {'sha256': '6666666666666666'},
+    'café/ü.txt': {'sha256': 'ABCDEF'},
+    'upper.txt': {'sha256': 'abcdef'},
+    'multi.txt': {'md5': '00', 'sha256': 'abcd'},
+  }
+
+  def _assert_same_changes(self, before, after, **kwargs):
+    expected = create_layout.changes_between_snapshots(before, after)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      with external_diff.ExternalSnapshotDiff(before, after, tmp_dir,
+          **kwargs) as diff:
+        for kind, paths in zip(external_diff.KINDS, expected):
+          self.assertEqual(list(diff.sorted(kind)), sorted(paths), kind)
+          self.assertEqual(diff.count(kind), len(paths))
+
+      # Spill files are removed
+      self.assertEqual(os.listdir(tmp_dir), [])
+
+  def test_diff(self):
+    # Paths are sorted by their encoding, including lone surrogates
+    after = dict(self.after, **{'z\udcff': {'sha256': '00'},
+        'z\ud7ff': {'sha256': '00'}, 'z\ue000': {'sha256': '00'}})
+    for run_size in [1, 2, 1000]:
+      self._assert_same_changes(self.before, after, run_size=run_size)
+      self._assert_same_changes(after, self.before, run_size=run_size)
+    self._assert_same_changes({}, self.after)
+    self._assert_same_changes(self.before, {})
+    self._assert_same_changes({}, {})
+
+  def test_diff_artifact_tables(self):
+    link = link_stream.read_link(io.StringIO(repr(in_toto.models.link.Link(
+        name='step', materials=self.before, products=self.after))))
+    self._assert_same_changes(link.materials, link.products, run_size=3)
+
+  def test_diff_link_file(self):
+    link = in_toto.models.link.Link(name='step', materials=self.before,
+        products=self.after)
+    expected = create_layout.changes_between_snapshots(self.before, self.after)
+    for link_str in [repr(link), repr(in_toto.models.metadata.Metablock(
+        signed=link))]:
+      with tempfile.TemporaryDirectory() as tmp_dir, \
+          external_diff.ExternalSnapshotDiff.from_link_file(io.BytesIO(
+          link_str.encode('utf-8')), tmp_dir, run_size=2) as diff:
+        for kind, paths in zip(external_diff.KINDS, expected):
+          self.assertEqual(list(diff.sorted(kind)), sorted(paths), kind)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+import warnings
+
+import in_toto.models.link
+import in_toto.models.layout
+import in_toto.models.metadata
+
+import create_layout
+import layout_stream
+
+class Test_LayoutStream(unittest.TestCase):
+
+  '''Check whether metadata written in chunks is equal to the representation
+    of in-toto Metablocks. '''
+
+  def _layout(self):
+    links = [
+      in_toto.models.link.Link(name='clone', products={
+        'src/a.py': {'sha256': 'aaaa'}, 'café "quoted".txt':
+        {'sha256': 'bbbb'}}),
+      in_toto.models.link.Link(name='build', command=['make', '-j', '4'],
+        materials={'src/a.py': {'sha256': 'aaaa'}},
+        products={'a.bin': {'sha256': 'cccc'}}),
+    ]
+    with warnings.catch_warnings():
+      warnings.simplefilter('ignore')
+      layout = create_layout.create_layout_from_ordered_links(links)
+
+    layout.keys['123abc'] = {'keyid': '123abc', 'keytype': 'rsa',
+        'scheme': 'rsassa-pss-sha256', 'keyval': {'public': 'PEM\nPEM'}}
+    layout.steps[0].pubkeys.append('123abc')
+    layout.steps[0].threshold = 2
+    layout.readme = 'line one\nline two'
+    inspection = in_toto.models.layout.Inspection(name='untar',
+        expected_materials=[['MATCH', '*', 'WITH', 'PRODUCTS', 'FROM',
+        'build']])
+    inspection.set_run_from_string('tar xf a.bin')
+    layout.inspect.append(inspection)
+    return layout
+
+  def test_iter_metablock_json(self):
+    for layout in [self._layout(), in_toto.models.layout.Layout()]:
+      metablock = in_toto.models.metadata.Metablock(signed=layout)
+      metablock.signatures.append({'keyid': '123abc', 'sig': 'abcd'})
+      for compact in [False, True]:
+        metablock.compact_json = compact
+        for chunk_size in [1, 100, layout_stream.CHUNK_SIZE]:
+          chunks = list(layout_stream.iter_metablock_json(metablock,
+              chunk_size=chunk_size))
+          self.assertEqual(''.join(chunks), repr(metablock))
+          self.assertTrue(all(len(chunk) >= chunk_size
+              for chunk in chunks[:-1]))
+
+  def test_dump_metablock(self):
+    metablock = in_toto.models.metadata.Metablock(signed=self._layout())
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      streamed_path = os.path.join(tmp_dir, 'streamed.layout')
+      path = os.path.join(tmp_dir, 'dumped.layout')
+      layout_stream.dump_metablock(metablock, streamed_path)
+      metablock.dump(path)
+
+      with open(streamed_path, 'rb') as streamed_file, \
+          open(path, 'rb') as dumped_file:
+        self.assertEqual(streamed_file.read(), dumped_file.read())
+
+if __name__ == '__main__':
+  unittest.main()
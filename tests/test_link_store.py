@@ -0,0 +1,50 @@
+import hashlib
+import io
+import os
+import tempfile
+import unittest
+
+import link_store
+
+class Test_FileLinkStore(unittest.TestCase):
+
+  '''Check whether links are stored once per digest. '''
+
+  link_bytes = b'{"_type": "link"}'
+  digest = hashlib.sha256(link_bytes).hexdigest()
+
+  def test_put_and_open(self):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      store = link_store.FileLinkStore(tmp_dir)
+      self.assertNotIn(self.digest, store)
+      with self.assertRaises(KeyError):
+        store.open(self.digest)
+
+      self.assertTrue(store.put(self.digest, self.link_bytes))
+      self.assertFalse(store.put(self.digest, self.link_bytes))
+      self.assertIn(self.digest, store)
+      with store.open(self.digest) as link_file:
+        self.assertEqual(link_file.read(), self.link_bytes)
+
+      # Links are copied from file objects as well
+      other_bytes = b'{"_type": "link", "name": "other"}'
+      other_digest = hashlib.sha256(other_bytes).hexdigest()
+      self.assertTrue(store.put_file(other_digest, io.BytesIO(other_bytes)))
+      with store.open(other_digest) as link_file:
+        self.assertEqual(link_file.read(), other_bytes)
+
+      # One file, without leftover temporary files
+      self.assertEqual(os.listdir(os.path.join(tmp_dir, self.digest[:2])),
+          [self.digest])
+
+  def test_invalid_digest(self):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      store = link_store.FileLinkStore(tmp_dir)
+      for digest in ['../../etc/passwd', self.digest.upper(), '']:
+        with self.assertRaises(ValueError):
+          store.put(digest, self.link_bytes)
+        with self.assertRaises(ValueError):
+          store.open(digest)
+
+if __name__ == '__main__':
+  unittest.main()
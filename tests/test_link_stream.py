@@ -0,0 +1,144 @@
+import concurrent.futures
+import hashlib
+import io
+import json
+import os
+import unittest
+
+import securesystemslib.exceptions
+import in_toto.models.link
+import in_toto.models.metadata
+
+import create_layout
+import link_stream
+
+class Test_LinkStream(unittest.TestCase):
+
+  '''Check whether links read incrementally are equal to links read with
+    in-toto. '''
+
+  link_dict = {
+    '_type': 'link',
+    'name': 'second_step',
+    'byproducts': {'stdout': 'café {"not": "a key"}', 'return-value': 0},
+    'environment': {},
+    'materials': {
+      'one.tgz': {'sha256': '1234567890abcdef'},
+      'foo/two.tgz': {'sha256': '0000001111112222'},
+      'three.txt': {'sha256': '1111222233334444'},
+      'bar/bat/four.tgz': {'sha256': '6677889900112233'}
+    },
+    'command': ['make', 'dist'],
+    'products': {
+      'five.txt': {'sha256': '5555555555555555', 'sha512': 'abcdef'},
+      'one.tgz': {'sha256': '1234567890abcdef'},
+      'foo/two.tgz': {'sha256': 'ffffffffffffffff'},
+      'bar/bat/four.tgz': {'md5': '6677889900112233'},
+      'baz/six.tgz': {'sha256': '6666666666666666'}
+    }
+  }
+
+  def _metadata_bytes(self):
+    link = in_toto.models.link.Link.read(self.link_dict)
+    return repr(in_toto.models.metadata.Metablock(signed=link)).encode(
+        'utf-8')
+
+  def _assert_link_equal(self, streamed_link):
+    link = in_toto.models.link.Link.read(self.link_dict)
+    self.assertEqual(streamed_link.name, link.name)
+    self.assertEqual(streamed_link.command, link.command)
+    self.assertEqual(streamed_link.byproducts, link.byproducts)
+    self.assertEqual(dict(streamed_link.materials), link.materials)
+    self.assertEqual(dict(streamed_link.products), link.products)
+    self.assertEqual(repr(streamed_link), repr(link))
+
+  def test_read_link_metadata(self):
+    # Use tiny chunks to split keys, digests and literals across chunks
+    for chunk_size in [1, 3, 7, 64, 1024 * 1024]:
+      streamed_link = link_stream.read_link_metadata(
+          io.BytesIO(self._metadata_bytes()), chunk_size=chunk_size)
+      self._assert_link_equal(streamed_link)
+
+  def test_read_link_metadata_text(self):
+    streamed_link = link_stream.read_link_metadata(
+        io.StringIO(self._metadata_bytes().decode('utf-8')), chunk_size=5)
+    self._assert_link_equal(streamed_link)
+
+  def test_read_double_wrapped_link_metadata(self):
+    metadata = {
+      'signatures': [],
+      'signed': {'signatures': [], 'signed': self.link_dict}
+    }
+    streamed_link = link_stream.read_link_metadata(
+        io.BytesIO(json.dumps(metadata).encode('utf-8')), chunk_size=16)
+    self._assert_link_equal(streamed_link)
+
+  def test_read_link(self):
+    link = in_toto.models.link.Link.read(self.link_dict)
+    streamed_link = link_stream.read_link(io.StringIO(repr(link)))
+    self._assert_link_equal(streamed_link)
+
+  def test_read_empty_link(self):
+    streamed_link = link_stream.read_link(io.StringIO('{"_type": "link"}'))
+    self.assertEqual(len(streamed_link.materials), 0)
+    self.assertEqual(repr(streamed_link),
+        repr(in_toto.models.link.Link(name=None)))
+
+  def test_read_invalid_link_metadata(self):
+    for data in [b'', b'[]', b'{"signed": []}', b'{"signatures": []}',
+        b'{"signed": {"_type": "link"}} trailing', b'{"signed": {"_type": "l']:
+      with self.assertRaises(ValueError):
+        link_stream.read_link_metadata(io.BytesIO(data))
+
+    for signed in [
+        {'_type': 'layout'},
+        {'_type': 'link', 'materials': []},
+        {'_type': 'link', 'products': {'foo': {'sha256': 'not hex'}}},
+        {'_type': 'link', 'products': {'foo': 'abcdef'}},
+        {'_type': 'link', 'command': 'make'}]:
+      data = json.dumps({'signed': signed}).encode('utf-8')
+      with self.assertRaises(securesystemslib.exceptions.FormatError):
+        link_stream.read_link_metadata(io.BytesIO(data))
+
+  def test_canonicalize_link_data(self):
+    link = in_toto.models.link.Link.read(self.link_dict)
+    link_bytes = repr(link).encode('utf-8')
+
+    # Results and errors are passed back from worker processes, the link JSON
+    # is written to a temporary file in chunks
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+      name, link_path, digest = executor.submit(
+          link_stream.canonicalize_link_data, self._metadata_bytes(),
+          chunk_size=16).result()
+      try:
+        with open(link_path, 'rb') as link_file:
+          self.assertEqual(link_file.read(), link_bytes)
+      finally:
+        os.remove(link_path)
+      self.assertEqual((name, digest),
+          (link.name, hashlib.sha256(link_bytes).hexdigest()))
+      with self.assertRaises(securesystemslib.exceptions.FormatError):
+        executor.submit(link_stream.canonicalize_link_data,
+            b'{"signed": {"_type": "link", "command": "make"}}').result()
+
+  def test_create_layout_from_streamed_links(self):
+    first_link_dict = {
+      '_type': 'link',
+      'name': 'first_step',
+      'products': self.link_dict['materials']
+    }
+    links = [
+      in_toto.models.link.Link.read(first_link_dict),
+      in_toto.models.link.Link.read(self.link_dict)
+    ]
+    streamed_links = [
+      link_stream.read_link(io.StringIO(repr(link))) for link in links
+    ]
+
+    layout = create_layout.create_layout_from_ordered_links(links)
+    streamed_layout = create_layout.create_layout_from_ordered_links(
+        streamed_links)
+    self.assertEqual(repr(streamed_layout.steps), repr(layout.steps))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,141 @@
+import io
+import unittest
+import warnings
+
+import in_toto.verifylib
+import in_toto.models.link
+from in_toto.exceptions import RuleVerificationError
+
+import create_layout
+import link_stream
+import preflight
+
+class Test_Preflight(unittest.TestCase):
+
+  '''Check whether preflight applies artifact rules like in-toto. '''
+
+  links = {
+    'clone': in_toto.models.link.Link(name='clone', products={
+      'src/a.py': {'sha256': 'aaaa'},
+      'src/b.py': {'sha256': 'bbbb'},
+      'src/lib/c.py': {'sha256': 'cccc'},
+      'README.md': {'sha256': 'dddd'},
+      'a[1].txt': {'sha256': 'eeee'},
+    }),
+    'build': in_toto.models.link.Link(name='build', materials={
+      'src/a.py': {'sha256': 'aaaa'},
+      'src/b.py': {'sha256': 'bbbb'},
+      'src/lib/c.py': {'sha256': 'cccc'},
+      'README.md': {'sha256': 'dddd'},
+      'a[1].txt': {'sha256': 'eeee'},
+    }, products={
+      'src/a.py': {'sha256': 'aaaa'},
+      'src/b.py': {'sha256': '0000'},
+      'src/lib/c.py': {'sha256': 'cccc'},
+      'dist/pkg.tar.gz': {'sha256': '1111'},
+      'a[1].txt': {'sha256': 'eeee'},
+    }),
+  }
+
+  rule_sets = [
+    [['MATCH', '*', 'WITH', 'PRODUCTS', 'FROM', 'clone'],
+        ['DISALLOW', '*']],
+    [['MATCH', 'src/*', 'WITH', 'PRODUCTS', 'FROM', 'clone'],
+        ['ALLOW', '*.md'], ['DISALLOW', '*']],
+    [['MATCH', '*.py', 'IN', 'src', 'WITH', 'PRODUCTS', 'IN', 'src',
+        'FROM', 'clone'], ['DISALLOW', 'src/*']],
+    [['MATCH', 'a.py', 'IN', 'src/', 'WITH', 'PRODUCTS', 'IN', 'src',
+        'FROM', 'clone'], ['MATCH', '*', 'WITH', 'PRODUCTS', 'FROM', 'nope'],
+        ['REQUIRE', 'src/a.py']],
+    [['CREATE', 'dist/*'], ['MODIFY', 'src/?.py'], ['DELETE', '*'],
+        ['ALLOW', 'a[1].txt'], ['REQUIRE', 'src/lib/c.py'],
+        ['DISALLOW', '*[!c].py'], ['ALLOW', 'src/lib/*'], ['DISALLOW', '*']],
+    [['ALLOW', 'a[[]1].txt'], ['REQUIRE', 'a[1].txt'], ['ALLOW', '*'],
+        ['DISALLOW', '*']],
+  ]
+
+  def _verify_with_in_toto(self, source_type, rules):
+    '''Returns whether in-toto passes the rules of the build step, and the
+    artifacts consumed by each applied rule, except for a failed rule. '''
+    passed = True
+    try:
+      in_toto.verifylib.verify_item_rules('build', source_type, rules,
+          self.links)
+    except RuleVerificationError:
+      passed = False
+
+    consumed = []
+    queue = set(getattr(self.links['build'], source_type))
+    for trace in in_toto.verifylib.RULE_TRACE['trace']:
+      consumed.append(sorted(queue.difference(trace['queue'])))
+      queue = set(trace['queue'])
+    return passed, consumed
+
+  def test_preflight_item_rules(self):
+    for rules in self.rule_sets:
+      for source_type in ['materials', 'products']:
+        passed, consumed = self._verify_with_in_toto(source_type, rules)
+        report = preflight.preflight_item_rules('build', source_type, rules,
+            self.links)
+
+        self.assertEqual(report['passed'], passed, (rules, source_type))
+        self.assertEqual(report['error'] is None, passed)
+
+        # The failed rule is reported too, and consumes nothing
+        if not passed:
+          consumed.append([])
+        self.assertEqual([rule['consumed'] for rule in report['rules']],
+            consumed, (rules, source_type))
+
+  def test_invalid_rule(self):
+    report = preflight.preflight_item_rules('build', 'materials',
+        [['ALLOW', '*'], ['FORBID', '*']], self.links)
+    self.assertFalse(report['passed'])
+    self.assertEqual(len(report['rules']), 1)
+
+  def test_preflight_layout(self):
+    # NOTE: Generated rules for paths with pattern characters, e.g.
+    # 'a[1].txt', don't match the path itself (neither in in-toto)
+    links = {}
+    for name, link in self.links.items():
+      links[name] = in_toto.models.link.Link(name=name,
+          materials={path: hash_dict
+              for path, hash_dict in link.materials.items() if '[' not in path},
+          products={path: hash_dict
+              for path, hash_dict in link.products.items() if '[' not in path})
+
+    with warnings.catch_warnings():
+      warnings.simplefilter('ignore')
+      for compress in [False, True]:
+        layout = create_layout.create_layout_from_ordered_links(
+            [links['clone'], links['build']], compress=compress)
+        report = preflight.preflight_layout(layout, links)
+        self.assertTrue(report['passed'])
+        self.assertEqual([step['name'] for step in report['steps']],
+            ['clone', 'build'])
+        self.assertEqual(report['steps'][1]['materials']['unconsumed'], [])
+
+    # Streamed links have the same result
+    streamed_links = {name: link_stream.read_link(io.StringIO(repr(link)))
+        for name, link in links.items()}
+    self.assertEqual(preflight.preflight_layout(layout, streamed_links),
+        report)
+
+    # A changed artifact is not matched with the producing step
+    build = links['build']
+    changed_links = dict(links, clone=in_toto.models.link.Link(
+        name='clone', products=dict(build.materials,
+        **{'src/a.py': {'sha256': '9999'}})))
+    report = preflight.preflight_layout(layout, changed_links)
+    self.assertFalse(report['passed'])
+    self.assertTrue(report['steps'][0]['passed'])
+    self.assertFalse(report['steps'][1]['materials']['passed'])
+    self.assertEqual(report['steps'][1]['materials']['unconsumed'],
+        ['src/a.py'])
+
+    report = preflight.preflight_layout(layout, {'clone': build})
+    self.assertFalse(report['passed'])
+    self.assertIsNotNone(report['steps'][1]['error'])
+
+if __name__ == '__main__':
+  unittest.main()
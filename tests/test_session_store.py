@@ -0,0 +1,204 @@
+import gzip
+import json
+import os
+import tempfile
+import threading
+import unittest
+import uuid
+from unittest import mock
+
+import session_store
+
+class _SessionStoreTests(object):
+
+  '''Check whether session stores read and update session documents like
+    the MongoDB session store. '''
+
+  def create_store(self):
+    raise NotImplementedError
+
+  def setUp(self):
+    self.store = self.create_store()
+    self.session_id = uuid.uuid4()
+
+  def test_set_and_find(self):
+    self.assertEqual(self.store.find(self.session_id, ['vcs']), {})
+
+    self.store.set_fields(self.session_id, {'vcs': {'items': [{'cmd': 'git'}],
+        'comment': 'c'}})
+    self.store.set_fields(self.session_id, {'chaining.comment': 'd',
+        'authorizing.items': []})
+
+    self.assertEqual(self.store.find(self.session_id,
+        ['vcs', 'chaining', 'authorizing', 'ssc', 'version']), {
+        'vcs': {'items': [{'cmd': 'git'}], 'comment': 'c'},
+        'chaining': {'comment': 'd'}, 'authorizing': {'items': []},
+        'version': 2})
+
+  def test_find_fields(self):
+    self.store.set_fields(self.session_id, {'chaining': {'comment': 'c',
+        'items': [{'file_name': 'a.link', 'link_digest': '1'}, 'x',
+        {'link_digest': '2'}]}})
+
+    self.assertEqual(self.store.find(self.session_id,
+        ['chaining.items.file_name', 'chaining.comment']),
+        {'chaining': {'comment': 'c', 'items': [{'file_name': 'a.link'}, {}]}})
+    self.assertEqual(self.store.find(self.session_id, ['chaining.missing']),
+        {'chaining': {}})
+
+    # A field that is part of another passed field
+    self.assertEqual(self.store.find(self.session_id,
+        ['chaining.comment', 'chaining'])['chaining']['items'][2],
+        {'link_digest': '2'})
+
+  def test_find_copies(self):
+    self.store.set_fields(self.session_id, {'vcs': {'items': []}})
+    self.store.find(self.session_id, ['vcs'])['vcs']['items'].append(1)
+    self.assertEqual(self.store.find(self.session_id, ['vcs']),
+        {'vcs': {'items': []}})
+
+  def test_push_and_pull(self):
+    self.store.push_items(self.session_id, 'chaining.items',
+        [{'file_name': 'a'}, {'file_name': 'b'}])
+    self.store.push_items(self.session_id, 'chaining.items',
+        [{'file_name': 'a'}])
+    self.store.pull_items(self.session_id, 'chaining.items',
+        {'file_name': 'a'})
+    self.store.pull_items(self.session_id, 'functionaries.items',
+        {'functionary_name': 'a'})
+
+    self.assertEqual(self.store.find(self.session_id, ['chaining', 'version']),
+        {'chaining': {'items': [{'file_name': 'b'}]}, 'version': 4})
+
+    # Pulling from a missing document does not insert one
+    session_id = uuid.uuid4()
+    self.store.pull_items(session_id, 'chaining.items', {'file_name': 'a'})
+    self.assertEqual(self.store.find(session_id, ['chaining']), {})
+
+  def test_put_item(self):
+    path = 'functionaries.items'
+    self.assertFalse(self.store.put_item(self.session_id, path,
+        'functionary_name', {'functionary_name': 'a', 'file_name': '1'}))
+    self.assertFalse(self.store.put_item(self.session_id, path,
+        'functionary_name', {'functionary_name': 'b', 'file_name': '2'}))
+    self.assertTrue(self.store.put_item(self.session_id, path,
+        'functionary_name', {'functionary_name': 'a', 'file_name': '3'}))
+
+    self.assertEqual(self.store.find(self.session_id, [path]),
+        {'functionaries': {'items': [
+        {'functionary_name': 'a', 'file_name': '3'},
+        {'functionary_name': 'b', 'file_name': '2'}]}})
+
+  def test_set_in_value(self):
+    self.store.set_fields(self.session_id, {'vcs': 'x'})
+    with self.assertRaises(ValueError):
+      self.store.set_fields(self.session_id, {'vcs.comment': 'c'})
+    self.assertEqual(self.store.find(self.session_id, ['vcs', 'version']),
+        {'vcs': 'x', 'version': 1})
+
+  def test_concurrent_updates(self):
+    def _push(idx):
+      for item_idx in range(20):
+        self.store.push_items(self.session_id, 'chaining.items',
+            [(idx, item_idx)])
+
+    threads = [threading.Thread(target=_push, args=(idx,)) for idx in range(4)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+    self.assertEqual(self.store.find(self.session_id, ['version'])['version'],
+        80)
+
+  def test_touch(self):
+    with mock.patch('time.time', return_value=100):
+      self.store.set_fields(self.session_id, {'vcs': {}})
+    with mock.patch('time.time', return_value=200):
+      self.store.touch(self.session_id)
+      self.store.touch(uuid.uuid4())
+
+    self.assertEqual(self.store.find(self.session_id,
+        ['version', 'created', 'last_activity']),
+        {'version': 1, 'created': 100, 'last_activity': 200})
+    self.assertEqual(self.store.stats(0)['sessions'], 1)
+
+  def test_expire(self):
+    session_ids = [uuid.uuid4() for _ in range(3)]
+    for idx, session_id in enumerate(session_ids):
+      with mock.patch('time.time', return_value=100 * (idx + 1)):
+        self.store.push_items(session_id, 'chaining.items', [
+            {'file_name': 'a.link', 'link_str': '{}'}])
+
+    self.assertEqual(self.store.stats(200)['created'], 2)
+
+    with tempfile.TemporaryDirectory() as archive_dir:
+      with session_store.SessionArchive(archive_dir) as archive:
+        self.assertEqual(self.store.expire(250, archive=archive), 2)
+      self.assertEqual(archive.count, 2)
+      self.assertEqual(os.listdir(archive_dir),
+          [os.path.basename(archive.path)])
+
+      with gzip.open(archive.path, 'rt') as archive_file:
+        archived = [json.loads(line) for line in archive_file]
+      self.assertEqual(sorted(document['_id'] for document in archived),
+          sorted(str(session_id) for session_id in session_ids[:2]))
+      # Links in the session document are compacted to their digest
+      self.assertEqual(archived[0]['chaining']['items'], [
+          {'file_name': 'a.link', 'link_digest': '44136fa355b3678a1146ad16f7e8'
+          '649e94fb4fc21fe77e8310c060f61caaff8a'}])
+
+      # Empty archives are removed
+      with session_store.SessionArchive(archive_dir) as archive:
+        self.assertEqual(self.store.expire(250, archive=archive), 0)
+      self.assertEqual(len(os.listdir(archive_dir)), 1)
+
+    self.assertEqual(self.store.find(session_ids[0], ['chaining']), {})
+    stats = self.store.stats(0)
+    self.assertEqual((stats['sessions'], stats['created']), (1, 1))
+    self.assertGreater(stats['bytes'], 0)
+
+class Test_MemorySessionStore(_SessionStoreTests, unittest.TestCase):
+
+  def create_store(self):
+    return session_store.MemorySessionStore()
+
+  def test_max_sessions(self):
+    store = session_store.MemorySessionStore(max_sessions=2)
+    session_ids = [uuid.uuid4() for _ in range(3)]
+    for session_id in session_ids:
+      store.set_fields(session_id, {'vcs': {}})
+      # Use the first session, so that the second one is dropped
+      store.find(session_ids[0], ['vcs'])
+
+    self.assertEqual(len(store), 2)
+    self.assertEqual(store.find(session_ids[1], ['vcs']), {})
+    self.assertEqual(store.find(session_ids[0], ['vcs']), {'vcs': {}})
+
+class Test_SQLiteSessionStore(_SessionStoreTests, unittest.TestCase):
+
+  def create_store(self):
+    self.tmp_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tmp_dir.cleanup)
+    return session_store.SQLiteSessionStore(os.path.join(self.tmp_dir.name,
+        'sessions.db'))
+
+  def test_expire_untracked(self):
+    # Documents stored before the last activity was tracked expire later
+    self.store._connection().execute("INSERT INTO sessions (id, document) "
+        "VALUES ('old', '{}')")
+    with mock.patch('time.time', return_value=100):
+      self.assertEqual(self.store.expire(50), 0)
+    self.assertEqual(self.store.expire(150), 1)
+    self.assertEqual(len(self.store), 0)
+
+  def test_reopen(self):
+    self.store.set_fields(self.session_id, {'vcs': {'comment': 'c'}})
+    store = session_store.SQLiteSessionStore(os.path.join(self.tmp_dir.name,
+        'sessions.db'))
+    self.assertEqual(store.find(self.session_id, ['vcs']),
+        {'vcs': {'comment': 'c'}})
+    self.assertEqual(len(store), 1)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+
+import tooldb
+
+class Test_ToolIndex(unittest.TestCase):
+
+  '''Check whether indexed tool searches are equal to scanning the
+    collection. '''
+
+  def _scan(self, query='', category=None, **filters):
+    filters['category'] = category
+    tools = []
+    for tool_category, category_tools in tooldb.COLLECTION.items():
+      for tool in category_tools:
+        tool = dict(tool, category=tool_category)
+        text = '{}\n{}'.format(tool['name'], tool['cmd']).lower()
+        if query.lower() not in text:
+          continue
+        if any(value and tool[field].lower() != value.lower()
+            for field, value in filters.items()):
+          continue
+        tools.append(tool)
+    return tools
+
+  def test_search(self):
+    for query in ['', 'g', 'py', 'MAKE', 'lint', 'clone <repo>', 'e\nm',
+        'nothing like this']:
+      for filters in [{}, {'category': 'qa'}, {'category': 'QA',
+          'prog_lang': 'python'}, {'type': 'Unit Testing'},
+          {'category': 'vcs', 'prog_lang': '', 'type': ''},
+          {'category': 'unknown'}]:
+        expected = self._scan(query, **filters)
+        result = tooldb.INDEX.search(query, **filters)
+        self.assertEqual(result['tools'], expected, (query, filters))
+        self.assertEqual(result['total'], len(expected))
+
+  def test_paging(self):
+    tools = self._scan()
+    pages = []
+    for offset in range(0, len(tools), 7):
+      result = tooldb.INDEX.search(offset=offset, limit=7)
+      self.assertEqual(result['total'], len(tools))
+      pages.extend(result['tools'])
+    self.assertEqual(pages, tools)
+
+    self.assertEqual(len(tooldb.INDEX.search(limit=1000)['tools']),
+        min(len(tools), tooldb.MAX_LIMIT))
+    self.assertEqual(tooldb.INDEX.search(offset=-1, limit=-1)['tools'], [])
+
+  def test_values(self):
+    self.assertEqual(tooldb.INDEX.values('category'),
+        sorted(tooldb.COLLECTION))
+    self.assertIn('python', tooldb.INDEX.values('prog_lang'))
+
+  def test_unknown_filter(self):
+    with self.assertRaises(ValueError):
+      tooldb.INDEX.search(logo='x')
+
+if __name__ == '__main__':
+  unittest.main()
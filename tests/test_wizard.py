@@ -0,0 +1,280 @@
+import io
+import os
+import json
+import time
+import tarfile
+import tempfile
+import unittest
+from unittest import mock
+
+import in_toto.models.link
+import in_toto.models.metadata
+
+os.environ.setdefault('WIZARD_CONFIG', os.path.join(os.path.dirname(
+    os.path.abspath(__file__)), 'wizard_config.py'))
+
+import wizard
+import link_store
+import session_store
+
+class Test_Wizard(unittest.TestCase):
+
+  '''Check whether the wizard views read and update the session document and
+    the uploaded links as expected, with the in-memory session store. '''
+
+  ssc_form = {
+    'step_name[]': ['clone', 'build'],
+    'step_cmd[]': ['git clone', 'make'],
+    'step_modifies[]': ['true', 'true'],
+    'inspection_name[]': [],
+    'inspection_cmd[]': [],
+    'inspection_step_name[]': [],
+    'comment': '',
+  }
+
+  authorizing_form = {
+    'step_name[]': ['clone', 'build'],
+    'threshold[]': ['1', '1'],
+    'functionary_name_clone[]': ['alice'],
+    'functionary_name_build[]': ['bob'],
+    'comment': '',
+  }
+
+  def setUp(self):
+    tmp_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp_dir.cleanup)
+
+    self.config = dict(WTF_CSRF_ENABLED=False, LAYOUT_JOB_DIR=tmp_dir.name)
+    for patcher in [
+        mock.patch.dict(wizard.app.config, self.config),
+        mock.patch.object(wizard, 'stored_sessions',
+            session_store.MemorySessionStore()),
+        mock.patch.object(wizard, 'stored_links',
+            link_store.FileLinkStore(tmp_dir.name)),
+        mock.patch.object(wizard, 'layout_caches',
+            wizard.collections.OrderedDict()),
+        mock.patch.object(wizard, 'layout_step_caches',
+            wizard.collections.OrderedDict()),
+        mock.patch.object(wizard, 'layout_step_cache_bytes', {}),
+        mock.patch.object(wizard, 'layout_jobs',
+            wizard.collections.OrderedDict())]:
+      patcher.start()
+      self.addCleanup(patcher.stop)
+
+    self.client = wizard.app.test_client()
+    self.client.get('/')
+    with self.client.session_transaction() as client_session:
+      self.session_id = client_session['id']
+
+  def _link_bytes(self, name, products=None):
+    return repr(in_toto.models.metadata.Metablock(
+        signed=in_toto.models.link.Link(name=name,
+        products=products or {}))).encode('utf-8')
+
+  def _upload(self, file_name, data):
+    return self.client.post('/chaining/upload',
+        data={'step_link': (io.BytesIO(data), file_name)},
+        headers={'X-Requested-With': 'XMLHttpRequest'})
+
+  def _archive(self, members):
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode='w:gz') as link_archive:
+      for name, data in members:
+        tar_info = tarfile.TarInfo(name)
+        tar_info.size = len(data)
+        link_archive.addfile(tar_info, io.BytesIO(data))
+    return archive.getvalue()
+
+  def _create_session(self, step_names=('clone', 'build')):
+    self.client.post('/software-supply-chain', data=self.ssc_form)
+    self.client.post('/authorizing', data=self.authorizing_form)
+    for step_name in step_names:
+      self._upload(step_name + '.link', self._link_bytes(step_name))
+
+  def _layout_step_names(self, response):
+    return [step['name'] for step in
+        json.loads(response.data)['signed']['steps']]
+
+  def _chaining_items(self):
+    return wizard.stored_sessions.find(self.session_id,
+        ['chaining'])['chaining']['items']
+
+  def test_session_round_trips(self):
+    # Pages that read several subdocuments fetch them in one round trip
+    self._create_session()
+    for page in ['/authorizing', '/chaining', '/wrap-up']:
+      response = self.client.get(page)
+      self.assertEqual(response.status_code, 200)
+      self.assertEqual(response.headers['X-Store-Round-Trips'], '1', page)
+
+  def test_upload_link_archive(self):
+    # The archive is read as a stream, a bad member does not stop the upload
+    # and messages are in the order of the members
+    response = self._upload('links.tar.gz', self._archive([
+        ('clone.link', self._link_bytes('clone')),
+        ('bad.link', b'{"signed": '),
+        ('build.link', self._link_bytes('build'))]))
+
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response.json['files'], ['clone.link', 'build.link'])
+    self.assertEqual([message[0] for message in response.json['messages']],
+        ['alert-success', 'alert-danger', 'alert-success'])
+    self.assertIn("'bad.link'", response.json['messages'][1][1])
+    self.assertEqual([(item['step_name'], item['file_name'])
+        for item in self._chaining_items()],
+        [('clone', 'clone.link'), ('build', 'build.link')])
+
+  def test_upload_link_batches(self):
+    links = [('step{}.link'.format(idx), self._link_bytes(
+        'step{}'.format(idx))) for idx in range(5)]
+    with mock.patch.dict(wizard.app.config, LINK_UPLOAD_BATCH_ITEMS=2), \
+        mock.patch.object(session_store.MemorySessionStore, 'push_items',
+        autospec=True,
+        side_effect=session_store.MemorySessionStore.push_items) as push_items:
+      response = self._upload('links.tar', self._archive(links))
+
+    # One update per batch of links
+    self.assertEqual(push_items.call_count, 3)
+    self.assertEqual(response.json['files'], [name for name, _ in links])
+    self.assertEqual([item['file_name'] for item in self._chaining_items()],
+        [name for name, _ in links])
+
+  def test_upload_link_process_pool(self):
+    links = [('step{}.link'.format(idx), self._link_bytes(
+        'step{}'.format(idx))) for idx in range(4)]
+    links.insert(2, ('bad.link', b'[]'))
+    with mock.patch.dict(wizard.app.config, LINK_PARSE_WORKERS=2), \
+        mock.patch.object(wizard, 'link_parse_executor', None):
+      try:
+        response = self._upload('links.tar', self._archive(links))
+      finally:
+        wizard.link_parse_executor.shutdown()
+
+    self.assertEqual(response.json['files'],
+        [name for name, _ in links if name != 'bad.link'])
+    self.assertEqual([message[0] for message in response.json['messages']],
+        ['alert-success'] * 2 + ['alert-danger'] + ['alert-success'] * 2)
+
+  def test_download_layout(self):
+    self._create_session()
+    response = self.client.get('/download-layout')
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(self._layout_step_names(response), ['clone', 'build'])
+    etag = response.headers['ETag']
+
+    # The cached layout is served with one store round trip, and not at all
+    # to clients with a matching ETag
+    response = self.client.get('/download-layout')
+    self.assertEqual(response.headers['ETag'], etag)
+    self.assertEqual(response.headers['X-Store-Round-Trips'], '1')
+    response = self.client.get('/download-layout',
+        headers={'If-None-Match': etag})
+    self.assertEqual(response.status_code, 304)
+    self.assertEqual(response.data, b'')
+
+    # Cached layouts expire, i.e. are created again
+    with mock.patch.object(wizard, '_create_session_layout',
+        wraps=wizard._create_session_layout) as create_session_layout:
+      self.client.get('/download-layout')
+      with mock.patch('time.time', return_value=time.time() +
+          wizard.app.config['LAYOUT_CACHE_MAX_AGE'] + 1):
+        response = self.client.get('/download-layout')
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(create_session_layout.call_count, 1)
+
+  def test_download_layout_after_upload(self):
+    self._create_session(['clone'])
+    response = self.client.get('/download-layout')
+    self.assertEqual(self._layout_step_names(response), ['clone'])
+    etag = response.headers['ETag']
+
+    # Uploading a link drops the cached layout, which is then created again
+    # with one store round trip
+    self._upload('build.link', self._link_bytes('build',
+        {'foo.py': {'sha256': 'a' * 64}}))
+    self.assertEqual(len(wizard.layout_caches), 0)
+    response = self.client.get('/download-layout',
+        headers={'If-None-Match': etag})
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response.headers['X-Store-Round-Trips'], '1')
+    self.assertEqual(self._layout_step_names(response), ['clone', 'build'])
+    self.assertEqual(json.loads(response.data)['signed']['steps'][1][
+        'expected_products'], [['CREATE', 'foo.py'], ['DISALLOW', '*']])
+
+  def test_layout_step_cache_bytes(self):
+    # Step rule caches of least recently used sessions are dropped to keep
+    # all caches within the byte budget
+    self._create_session()
+    self.client.get('/download-layout')
+    nbytes = wizard.layout_step_cache_bytes[self.session_id]
+    self.assertGreater(nbytes, 0)
+
+    wizard._get_layout_step_cache('other')
+    wizard.layout_step_cache_bytes['other'] = 1
+    with mock.patch.dict(wizard.app.config, LAYOUT_STEP_CACHE_BYTES=nbytes - 1):
+      wizard._update_layout_step_cache_bytes('other', {})
+    self.assertEqual(list(wizard.layout_step_caches), ['other'])
+    self.assertEqual(wizard.layout_step_cache_bytes, {'other': 0})
+
+  def test_layout_jobs(self):
+    self._create_session()
+    response = self.client.post('/layout-jobs')
+    self.assertEqual(response.status_code, 202)
+    job_id = response.json['job_id']
+
+    for _ in range(100):
+      response = self.client.get('/layout-jobs/' + job_id)
+      if response.json['status'] in ('done', 'failed'):
+        break
+      time.sleep(0.05)
+    self.assertEqual(response.json['status'], 'done')
+
+    response = self.client.get('/layout-jobs/{}/download'.format(job_id))
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(self._layout_step_names(response), ['clone', 'build'])
+    response.close()
+
+    # Jobs of other sessions are not found
+    with self.client.session_transaction() as client_session:
+      client_session.clear()
+    self.assertEqual(self.client.get('/layout-jobs/' + job_id).status_code,
+        404)
+
+  def test_layout_jobs_pending(self):
+    with mock.patch.dict(wizard.app.config,
+        LAYOUT_JOBS_PENDING_PER_SESSION=0):
+      response = self.client.post('/layout-jobs',
+          headers={'X-Requested-With': 'XMLHttpRequest'})
+    self.assertEqual(response.status_code, 429)
+    self.assertEqual(response.json['messages'][0][0], 'alert-warning')
+    self.assertEqual(len(wizard.layout_jobs), 0)
+
+  def test_search_tools(self):
+    response = self.client.get('/tools/search?q=git&limit=1')
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response.json['limit'], 1)
+    self.assertEqual(len(response.json['tools']), 1)
+    self.assertGreaterEqual(response.json['total'], 1)
+
+    # The pages load their tools from the search endpoint
+    for page, category in [('/vcs', 'vcs'), ('/building', 'building'),
+        ('/quality', 'qa'), ('/packaging', 'package')]:
+      response = self.client.get(page)
+      self.assertIn('data-tools-url="/tools/search?category={}"'.format(
+          category).encode('utf-8'), response.data)
+
+  def test_ajax_response(self):
+    # Flashed messages are part of the JSON body of ajax responses only
+    response = self.client.post('/chaining/upload',
+        headers={'X-Requested-With': 'XMLHttpRequest'})
+    self.assertEqual(response.json, {'messages': [['alert-danger',
+        'Something went wrong: No file uploaded']]})
+
+    response = self.client.post('/chaining/upload')
+    self.assertEqual(response.json, {})
+    with self.client.session_transaction() as client_session:
+      self.assertEqual(client_session['_flashes'], [('alert-danger',
+          'Something went wrong: No file uploaded')])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,7 @@
+"""
+  Configuration of the wizard for the tests in test_wizard.py (c.f.
+  WIZARD_CONFIG in wizard.py), i.e. without MongoDB.
+"""
+TESTING = True
+SECRET_KEY = 'test'
+SESSION_STORE = 'memory'
@@ -21,12 +21,27 @@
   The tools are presented to the user on the different pages of the web wizard
   as options to choose from to define a custom supply chain
 
+  The collection is indexed once on import (c.f. `ToolIndex` and `INDEX`), to
+  search and filter the tools, e.g. to load options on demand:
+
+    INDEX.search(query="py", category="qa", prog_lang="Python", limit=10)
+
   TODO:
   - Update! Some of the tools might be not used at all while other popular
     tools are missing
   - Clean up! Common commands, logo, ...
 
 """
+import collections
+
+# Maximum number of tools returned by one search (c.f. `ToolIndex.search`)
+MAX_LIMIT = 100
+
+# Tool fields that can be filtered by (besides the category)
+FILTER_FIELDS = ("prog_lang", "type")
+
+# Length of the n-grams the tool names and commands are indexed by
+_NGRAM_LENGTH = 3
 
 COLLECTION = {
   "vcs": [{
@@ -410,4 +425,129 @@ COLLECTION = {
     "name": "MSI",
     "cmd": ""
   }]
-}
\ No newline at end of file
+}
+
+
+def _ngrams(text, length):
+  """Returns the set of substrings of passed length of passed text. """
+  return {text[idx:idx + length] for idx in range(len(text) - length + 1)}
+
+
+class ToolIndex(object):
+  """Indexes of a tool collection, i.e. of the tools by category and by the
+  values of FILTER_FIELDS, and of the n-grams (n <= 3) of the lower case
+  tool names and commands, to search tools by intersecting the sets of tools
+  matched by each filter and by the query, smallest first, without scanning
+  the collection.
+
+  Tools are identified by their position in the collection (by category in
+  the collection's order), and search results are returned in that order.
+  """
+  __slots__ = ("_tools", "_by_field", "_ngrams", "_text")
+
+  def __init__(self, collection):
+    self._tools = []
+    self._text = []
+    # Tool ids by field name and (lower case) field value
+    self._by_field = collections.defaultdict(
+        lambda: collections.defaultdict(set))
+    # Tool ids by n-gram, for n-grams of length 1 to _NGRAM_LENGTH
+    self._ngrams = collections.defaultdict(set)
+
+    for category, tools in collection.items():
+      for tool in tools:
+        tool_id = len(self._tools)
+        self._tools.append(dict(tool, category=category))
+
+        self._by_field["category"][category.lower()].add(tool_id)
+        for field in FILTER_FIELDS:
+          self._by_field[field][tool.get(field, "").lower()].add(tool_id)
+
+        # Search name and command, separated so that no n-gram spans both
+        text = "{}\n{}".format(tool.get("name", ""),
+            tool.get("cmd", "")).lower()
+        self._text.append(text)
+        for length in range(1, _NGRAM_LENGTH + 1):
+          for ngram in _ngrams(text, length):
+            self._ngrams[ngram].add(tool_id)
+
+    self._by_field = {field: dict(values)
+        for field, values in self._by_field.items()}
+
+
+  def values(self, field):
+    """Returns the sorted (lower case) values of passed field, i.e. of
+    "category" or one of FILTER_FIELDS. """
+    return sorted(self._by_field.get(field, {}))
+
+
+  def _match_query(self, query):
+    """Returns the ids of the tools whose name or command contains passed
+    (lower case) query, or None for an empty query, i.e. all tools. """
+    if not query:
+      return None
+
+    if len(query) <= _NGRAM_LENGTH:
+      return self._ngrams.get(query, set())
+
+    # Candidates contain all n-grams of the query, but not necessarily the
+    # query itself
+    candidates = None
+    for ngram in sorted(_ngrams(query, _NGRAM_LENGTH),
+        key=lambda ngram: len(self._ngrams.get(ngram, ()))):
+      tool_ids = self._ngrams.get(ngram, set())
+      candidates = tool_ids if candidates is None else candidates & tool_ids
+      if not candidates:
+        return set()
+
+    return {tool_id for tool_id in candidates
+        if query in self._text[tool_id]}
+
+
+  def search(self, query="", category=None, offset=0, limit=MAX_LIMIT,
+      **filters):
+    """Returns the tools whose name or command contains passed query (case
+    insensitive), filtered by category and by the FILTER_FIELDS passed as
+    keyword arguments (case insensitive, empty values are ignored), in
+    collection order, one page at a time.
+
+    Returns:
+      A dictionary with the "total" number of matched tools, the "offset"
+      and "limit" of the page, at most MAX_LIMIT, and the tools of the page
+      ("tools"), i.e. tool dictionaries with their "category".
+
+    Raises:
+      ValueError: an unknown filter field was passed
+    """
+    unknown_fields = set(filters).difference(FILTER_FIELDS)
+    if unknown_fields:
+      raise ValueError("Unknown filter fields '{}'".format(
+          "', '".join(sorted(unknown_fields))))
+
+    filters["category"] = category
+    # The ids of the tools matched by each filter and by the query
+    id_sets = [self._by_field[field].get(value.lower(), set())
+        for field, value in filters.items() if value]
+    matched_ids = self._match_query((query or "").lower())
+    if matched_ids is not None:
+      id_sets.append(matched_ids)
+
+    if id_sets:
+      id_sets.sort(key=len)
+      tool_ids = sorted(id_sets[0].intersection(*id_sets[1:]))
+
+    else:
+      tool_ids = range(len(self._tools))
+
+    offset = max(offset, 0)
+    limit = min(max(limit, 0), MAX_LIMIT)
+    return {
+      "total": len(tool_ids),
+      "offset": offset,
+      "limit": limit,
+      "tools": [dict(self._tools[tool_id])
+          for tool_id in tool_ids[offset:offset + limit]],
+    }
+
+
+INDEX = ToolIndex(COLLECTION)
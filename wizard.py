@@ -22,14 +22,16 @@
       Mostly used to transform data
 
   NoSQL Helpers:
-      The app uses MongoDB to persist user posted data for auditing and to
-      improve the app. NoSQL Helpers are a couple of custom wrappers around
-      common queries.
+      The app persists user posted data for auditing and to improve the app,
+      in MongoDB or another session store (c.f. session_store.py). NoSQL
+      Helpers are a couple of custom wrappers around common queries.
 
   View Decorator & Hooks:
       Currently there is one view decorator for session handling (sessions are
-      used to isolate user posted data) and an after request hook to inject
-      messages from the Flask's message flash framework into ajax responses.
+      used to isolate user posted data), a helper to create ajax responses
+      that include messages from the Flask's message flash framework, an
+      after request hook to expire inactive sessions and one to report the
+      number of session store round trips per request.
 
   Views:
       Each view is an entry point for an HTTP request (c.f. paths in @app.route
@@ -50,11 +52,18 @@ import uuid
 import time
 import io
 import tarfile
+import hashlib
+import tempfile
+import threading
+import itertools
+import collections
+import concurrent.futures
 
 from functools import wraps
 from flask import (Flask, render_template, session, redirect, url_for, request,
-    flash, send_file, abort, json, jsonify, get_flashed_messages)
+    flash, Response, send_file, abort, json, jsonify, get_flashed_messages, g)
 from flask_pymongo import PyMongo
+import bson
 from flask_wtf.csrf import CSRFProtect
 
 import in_toto.models.link
@@ -64,6 +73,12 @@ import securesystemslib.keys
 
 import tooldb
 import create_layout
+import link_stream
+import link_store
+import session_store
+import artifact_table
+import preflight
+import layout_stream
 
 app = Flask(__name__, static_url_path="", instance_relative_config=True)
 csrf = CSRFProtect(app)
@@ -72,18 +87,131 @@ app.config.update(dict(
     DEBUG=True,
     MONGO_URI="mongodb://localhost:27017/wizard",
     SECRET_KEY="do not use the development key in production!!!",
+    # Number of sessions for which the step rules of the last downloaded
+    # layout are kept in memory, and maximum total size in bytes of these
+    # step rules and link indexes (c.f. `download_layout`)
+    LAYOUT_STEP_CACHE_SESSIONS=64,
+    LAYOUT_STEP_CACHE_BYTES=256 * 1024 * 1024,
+    # Maximum total size in bytes of the serialized layouts kept in memory,
+    # and maximum size of a single cached layout, larger layouts are streamed
+    # (c.f. `download_layout`)
+    LAYOUT_CACHE_BYTES=64 * 1024 * 1024,
+    LAYOUT_CACHE_MAX_LAYOUT_BYTES=8 * 1024 * 1024,
+    # Seconds a serialized layout is cached, i.e. the expiration date of a
+    # served layout is at most this much earlier than that of a new layout
+    # (c.f. `download_layout`)
+    LAYOUT_CACHE_MAX_AGE=3600,
+    # Directory to store uploaded links in, links are stored in GridFS if not
+    # set (c.f. link_store.py)
+    LINK_STORE_DIR=None,
+    # Maximum number of members, and maximum total size in bytes of the files,
+    # of an uploaded link archive (c.f. `_iter_uploaded_link_files`)
+    LINK_ARCHIVE_MAX_MEMBERS=10000,
+    LINK_ARCHIVE_MAX_BYTES=1024 * 1024 * 1024,
+    # Maximum number of link items, and maximum (BSON) size in bytes of the
+    # link items, written to the session document in one update (c.f.
+    # `ajax_upload_link`)
+    LINK_UPLOAD_BATCH_ITEMS=500,
+    LINK_UPLOAD_BATCH_BYTES=4 * 1024 * 1024,
+    # Number of worker processes that parse and validate the links of an
+    # uploaded archive concurrently, links are parsed in the request thread if
+    # 0 (c.f. `_iter_parsed_links`)
+    LINK_PARSE_WORKERS=0,
+    # Number of threads that create layouts in the background (c.f.
+    # `ajax_create_layout_job`), the number of finished layout jobs that are
+    # kept, and the directory to write their layouts to (the default temporary
+    # directory if not set)
+    LAYOUT_JOB_WORKERS=2,
+    LAYOUT_JOBS_KEPT=32,
+    LAYOUT_JOB_DIR=None,
+    # Maximum number of queued or running layout jobs per session and in
+    # total, further jobs are rejected with "429 Too Many Requests"
+    LAYOUT_JOBS_PENDING_PER_SESSION=2,
+    LAYOUT_JOBS_PENDING=32,
+    # Store for the session documents, one of "mongo", "memory" and "sqlite"
+    # (c.f. session_store.py), the number of sessions kept by the "memory"
+    # store, and the database file of the "sqlite" store ("sessions.db" in the
+    # instance folder if not set). Set LINK_STORE_DIR too, to run the app
+    # without MongoDB.
+    SESSION_STORE="mongo",
+    SESSION_STORE_MAX_SESSIONS=10000,
+    SESSION_STORE_PATH=None,
+    # Sessions without activity for SESSION_TTL seconds are removed (never if
+    # 0, the default, e.g. 30 * 24 * 3600 for 30 days), every
+    # SESSION_EXPIRE_INTERVAL seconds in a background thread, or with `flask
+    # expire-sessions` (e.g. from cron) if 0, and archived to
+    # SESSION_ARCHIVE_DIR if set (c.f. `expire_sessions`). The last activity
+    # of a session is updated at most every SESSION_TOUCH_INTERVAL seconds if
+    # it is only viewed.
+    SESSION_TTL=0,
+    SESSION_EXPIRE_INTERVAL=3600,
+    SESSION_ARCHIVE_DIR=None,
+    SESSION_TOUCH_INTERVAL=3600,
 ))
 
 
 # Supply a config file at "instance/config.py" that carries
-# e.g. your deployment secret key
-app.config.from_pyfile("config.py")
+# e.g. your deployment secret key, or at the path in WIZARD_CONFIG, e.g. for
+# tests
+app.config.from_pyfile(os.environ.get("WIZARD_CONFIG", "config.py"))
 
 mongo = PyMongo(app)
 
+# Content-addressed store of uploaded links, shared by all sessions
+if app.config["LINK_STORE_DIR"]:
+  stored_links = link_store.FileLinkStore(app.config["LINK_STORE_DIR"])
+else:
+  stored_links = link_store.GridFSLinkStore(mongo.db)
+
+# Store of the session documents (c.f. NoSQL Helpers)
+if app.config["SESSION_STORE"] == "memory":
+  stored_sessions = session_store.MemorySessionStore(
+      app.config["SESSION_STORE_MAX_SESSIONS"])
+elif app.config["SESSION_STORE"] == "sqlite":
+  stored_sessions = session_store.SQLiteSessionStore(
+      app.config["SESSION_STORE_PATH"] or
+      os.path.join(app.instance_path, "sessions.db"))
+else:
+  stored_sessions = session_store.MongoSessionStore(
+      mongo.db.session_collection)
+
 # Reload if a template has changed (only for development, i.e. in DEBUG mode)
 app.jinja_env.auto_reload = app.config["DEBUG"]
 
+# Step rules of the last downloaded layout per session, least recently used
+# first, and their approximate size in bytes per session (c.f.
+# `_get_layout_step_cache`)
+layout_step_caches = collections.OrderedDict()
+layout_step_cache_bytes = {}
+layout_step_caches_lock = threading.Lock()
+
+# (ETag, serialized layout, creation time) tuples by (session id, session
+# version, layout parameters), least recently used first (c.f.
+# `_get_cached_layout`)
+layout_caches = collections.OrderedDict()
+layout_caches_lock = threading.Lock()
+
+# The session subdocuments needed to create a layout, fetched in one query
+# (c.f. `_create_session_layout`)
+LAYOUT_SUBDOCUMENTS = ["ssc", "chaining", "functionaries", "authorizing"]
+
+# Layout jobs by job id, oldest first, and the threads that run them, created
+# on first use (c.f. `ajax_create_layout_job`)
+layout_jobs = collections.OrderedDict()
+layout_jobs_lock = threading.Lock()
+layout_job_executor = None
+
+# Start time of the last run of `expire_sessions` in this process, and the
+# thread of the last scheduled run (c.f. `schedule_session_expiry`)
+session_expiry_lock = threading.Lock()
+session_expiry_started = None
+session_expiry_thread = None
+
+# Worker processes to parse uploaded links, shared by all requests and
+# created on first use (c.f. `_get_link_parse_executor`)
+link_parse_executor = None
+link_parse_executor_lock = threading.Lock()
+
 
 # -----------------------------------------------------------------------------
 # Utils
@@ -270,6 +398,443 @@ def _auth_items_to_dict(auth_items):
   return auth_dict
 
 
+def _link_digest(link_data):
+  """Returns the digest that identifies the content of a link in the chaining
+  session subdocument, i.e. its key in the link store. Links stored before we
+  started to store the digest on upload are hashed on the fly. """
+  link_digest = link_data.get("link_digest")
+  if not link_digest:
+    link_digest = hashlib.sha256(
+        link_data["link_str"].encode("utf-8")).hexdigest()
+  return link_digest
+
+
+def _iter_uploaded_link_files(uploaded_file):
+  """Yields (file name, file object) tuples of the files in passed uploaded
+  tar archive, or of the uploaded file itself if it is not a tar archive.
+
+  The archive is read as a stream, i.e. each file must be consumed before
+  the next one is read, and only the current file is held in memory.
+  Directories and other non-file members are skipped.
+
+  Raises:
+    tarfile.TarError: the archive is corrupt
+    ValueError: the archive exceeds LINK_ARCHIVE_MAX_MEMBERS or
+        LINK_ARCHIVE_MAX_BYTES
+  """
+  try:
+    link_archive = tarfile.open(fileobj=uploaded_file, mode="r|*")
+
+  except tarfile.TarError:
+    # If that does not work we assume the uploaded file was a link
+    uploaded_file.seek(0)
+    yield uploaded_file.filename, uploaded_file
+    return
+
+  with link_archive:
+    member_count = 0
+    total_size = 0
+    while True:
+      tar_info = link_archive.next()
+      if tar_info is None:
+        break
+
+      # Don't keep the headers of all members (c.f. TarFile.members)
+      link_archive.members = []
+
+      member_count += 1
+      if member_count > app.config["LINK_ARCHIVE_MAX_MEMBERS"]:
+        raise ValueError("Archive has more than {} members".format(
+            app.config["LINK_ARCHIVE_MAX_MEMBERS"]))
+
+      if not tar_info.isfile():
+        continue
+
+      total_size += tar_info.size
+      if total_size > app.config["LINK_ARCHIVE_MAX_BYTES"]:
+        raise ValueError("Archive files are larger than {} bytes".format(
+            app.config["LINK_ARCHIVE_MAX_BYTES"]))
+
+      yield tar_info.name, link_archive.extractfile(tar_info)
+
+
+def _get_link_parse_executor():
+  """Returns the process pool to parse uploaded links with, or None if
+  LINK_PARSE_WORKERS is 0. """
+  global link_parse_executor
+  if not app.config["LINK_PARSE_WORKERS"]:
+    return None
+
+  with link_parse_executor_lock:
+    if link_parse_executor is None:
+      link_parse_executor = concurrent.futures.ProcessPoolExecutor(
+          max_workers=app.config["LINK_PARSE_WORKERS"])
+
+  return link_parse_executor
+
+
+def _iter_parsed_links(link_files):
+  """Yields (file name, future) tuples for passed (file name, file object)
+  tuples, in the same order, where the result of each future is the parsed
+  link metadata (c.f. `link_stream.canonicalize_link_metadata`), or the
+  parse error.
+
+  If there are LINK_PARSE_WORKERS, the files are read in the request thread
+  and parsed concurrently in worker processes. At most twice as many files
+  as there are workers are read ahead of the yielded ones. Otherwise each
+  file is parsed in the request thread when it is reached.
+  """
+  executor = _get_link_parse_executor()
+  if executor is None:
+    for link_filename, link_file in link_files:
+      future = concurrent.futures.Future()
+      try:
+        future.set_result(link_stream.canonicalize_link_metadata(link_file))
+
+      except Exception as e:
+        future.set_exception(e)
+
+      yield link_filename, future
+    return
+
+  pending = collections.deque()
+  try:
+    for link_filename, link_file in link_files:
+      pending.append((link_filename, executor.submit(
+          link_stream.canonicalize_link_data, link_file.read())))
+      if len(pending) >= 2 * app.config["LINK_PARSE_WORKERS"]:
+        yield pending.popleft()
+
+  except Exception:
+    # Yield the files read before e.g. the archive turned out to be corrupt
+    while pending:
+      yield pending.popleft()
+    raise
+
+  while pending:
+    yield pending.popleft()
+
+
+class _LayoutJob(object):
+  """A layout created in the background (c.f. `ajax_create_layout_job`). The
+  status is one of "queued", "running", "serializing", "done" and "failed".
+  """
+  __slots__ = ("job_id", "session_id", "status", "done", "total", "error",
+      "path")
+
+  def __init__(self, session_id):
+    self.job_id = str(uuid.uuid4())
+    self.session_id = session_id
+    self.status = "queued"
+    self.done = 0
+    self.total = None
+    self.error = None
+    self.path = None
+
+
+  def set_progress(self, done, total):
+    self.done, self.total = done, total
+
+
+  def to_dict(self):
+    return {
+      "job_id": self.job_id,
+      "status": self.status,
+      "done": self.done,
+      "total": self.total,
+      "error": self.error,
+    }
+
+
+def _get_layout_job_executor():
+  """Returns the thread pool to run layout jobs on. """
+  global layout_job_executor
+  with layout_jobs_lock:
+    if layout_job_executor is None:
+      layout_job_executor = concurrent.futures.ThreadPoolExecutor(
+          max_workers=app.config["LAYOUT_JOB_WORKERS"],
+          thread_name_prefix="layout-job")
+
+  return layout_job_executor
+
+
+def _add_layout_job(job):
+  """Registers passed layout job, unless there are already
+  LAYOUT_JOBS_PENDING_PER_SESSION pending, i.e. not finished, jobs of the
+  same session or LAYOUT_JOBS_PENDING pending jobs in total. Returns whether
+  the job was registered.
+
+  Finished jobs other than the LAYOUT_JOBS_KEPT most recent ones are dropped,
+  and their layouts removed. Layouts that are being served stay readable
+  until they are closed (c.f. `download_layout_job`). """
+  with layout_jobs_lock:
+    pending_jobs = [pending_job for pending_job in layout_jobs.values()
+        if pending_job.status not in ("done", "failed")]
+    if (len(pending_jobs) >= app.config["LAYOUT_JOBS_PENDING"] or
+        len([pending_job for pending_job in pending_jobs
+        if pending_job.session_id == job.session_id]) >=
+        app.config["LAYOUT_JOBS_PENDING_PER_SESSION"]):
+      return False
+
+    layout_jobs[job.job_id] = job
+    finished_jobs = [finished_job for finished_job in layout_jobs.values()
+        if finished_job.status in ("done", "failed")]
+    while len(finished_jobs) > app.config["LAYOUT_JOBS_KEPT"]:
+      finished_job = finished_jobs.pop(0)
+      del layout_jobs[finished_job.job_id]
+      if finished_job.path:
+        os.remove(finished_job.path)
+
+  return True
+
+
+def _get_layout_job(job_id):
+  """Returns the layout job with passed id of the current session or aborts
+  with 404. """
+  with layout_jobs_lock:
+    job = layout_jobs.get(job_id)
+
+  if job is None or job.session_id != session.get("id"):
+    abort(404)
+
+  return job
+
+
+def _run_layout_job(job, subdocuments, link_keys, load_link, compress):
+  """Creates the layout of passed job and writes it to a file, reporting the
+  progress on the job. Runs outside of the request. """
+  job.status = "running"
+  try:
+    layout = _create_session_layout(job.session_id, subdocuments, link_keys,
+        load_link, compress, progress=job.set_progress)
+
+    job.status = "serializing"
+    fd, path = tempfile.mkstemp(prefix="layout-", suffix=".layout",
+        dir=app.config["LAYOUT_JOB_DIR"])
+    os.close(fd)
+    try:
+      layout_stream.dump_metablock(
+          in_toto.models.metadata.Metablock(signed=layout), path)
+
+    except BaseException:
+      os.remove(path)
+      raise
+
+    job.path = path
+    job.status = "done"
+
+  except Exception as e:
+    app.logger.exception("Layout job '{}' failed".format(job.job_id))
+    job.error = str(e)
+    job.status = "failed"
+
+
+def _get_layout_step_cache(session_id):
+  """Returns a (lock, step rule cache) tuple of the passed session, where the
+  cache is to be used with `create_layout.create_layout_incrementally`, by
+  one thread at a time. Caches are kept for the LAYOUT_STEP_CACHE_SESSIONS
+  most recently used sessions (c.f. `_update_layout_step_cache_bytes`). """
+  with layout_step_caches_lock:
+    step_cache = layout_step_caches.pop(session_id, None)
+    if step_cache is None:
+      step_cache = (threading.Lock(), {})
+
+    layout_step_caches[session_id] = step_cache
+    while len(layout_step_caches) > app.config["LAYOUT_STEP_CACHE_SESSIONS"]:
+      evicted_id, _ = layout_step_caches.popitem(last=False)
+      layout_step_cache_bytes.pop(evicted_id, None)
+
+  return step_cache
+
+
+def _update_layout_step_cache_bytes(session_id, step_cache):
+  """Records the size of the passed step rule cache of the session with
+  passed id, after it was used (c.f. `_get_layout_step_cache`), and drops the
+  caches of the least recently used sessions to keep all caches within
+  LAYOUT_STEP_CACHE_BYTES. The cache of the passed session is dropped too, if
+  it alone exceeds LAYOUT_STEP_CACHE_BYTES. """
+  nbytes = create_layout.step_cache_nbytes(step_cache)
+  with layout_step_caches_lock:
+    if session_id not in layout_step_caches:
+      return
+
+    layout_step_cache_bytes[session_id] = nbytes
+    cached_bytes = sum(layout_step_cache_bytes.get(key, 0)
+        for key in layout_step_caches)
+    while cached_bytes > app.config["LAYOUT_STEP_CACHE_BYTES"]:
+      evicted_id, _ = layout_step_caches.popitem(last=False)
+      cached_bytes -= layout_step_cache_bytes.pop(evicted_id, 0)
+
+
+def _get_cached_layout(cache_key):
+  """Returns the (ETag, serialized layout, creation time) tuple cached with
+  passed key, i.e. (session id, session version, layout parameters), or None.
+  Layouts older than LAYOUT_CACHE_MAX_AGE are dropped. """
+  with layout_caches_lock:
+    cached_layout = layout_caches.pop(cache_key, None)
+    if (cached_layout is not None and
+        cached_layout[2] < time.time() - app.config["LAYOUT_CACHE_MAX_AGE"]):
+      cached_layout = None
+    if cached_layout is not None:
+      layout_caches[cache_key] = cached_layout
+
+  return cached_layout
+
+
+def _has_cached_layouts(session_id):
+  """Returns whether there are cached layouts of any version of the session
+  with passed id. """
+  with layout_caches_lock:
+    return any(key[0] == session_id for key in layout_caches)
+
+
+def _drop_cached_layouts(session_id):
+  """Drops the cached layouts of all versions of the session with passed id,
+  e.g. when the session is updated. """
+  with layout_caches_lock:
+    for key in list(layout_caches):
+      if key[0] == session_id:
+        del layout_caches[key]
+
+
+def _cache_layout(cache_key, cached_layout):
+  """Caches passed (ETag, serialized layout, creation time) tuple with passed
+  key (c.f. `_get_cached_layout`). Layouts of older versions of the same
+  session are dropped, and least recently used layouts are dropped to keep
+  the cache within LAYOUT_CACHE_BYTES. """
+  session_id, version = cache_key[:2]
+  with layout_caches_lock:
+    for key in list(layout_caches):
+      if key[0] == session_id and key[1] != version:
+        del layout_caches[key]
+
+    layout_caches[cache_key] = cached_layout
+    cached_bytes = sum(len(layout_bytes)
+        for _, layout_bytes, _ in layout_caches.values())
+    while cached_bytes > app.config["LAYOUT_CACHE_BYTES"]:
+      _, (_, layout_bytes, _) = layout_caches.popitem(last=False)
+      cached_bytes -= len(layout_bytes)
+
+
+def _session_links(subdocuments):
+  """Returns the digests of the links of the steps of the session with passed
+  subdocuments (c.f. LAYOUT_SUBDOCUMENTS), in the order of the steps, and a
+  function that loads the link with a given digest. Links are loaded at most
+  once, and share a path pool, i.e. each path is stored once. """
+  # Create an ordered list of digests of the links in the chaining session
+  # subdocument, in the order of the steps in the ssc session subdocument
+  step_names = [step["name"] for step in subdocuments["ssc"].get("steps", [])]
+  link_keys = []
+  link_items = {}
+  for link_data in create_layout.order_link_items(step_names,
+      subdocuments["chaining"].get("items", [])):
+    link_key = _link_digest(link_data)
+    link_items[link_key] = link_data
+    link_keys.append(link_key)
+
+  path_pool = artifact_table.PathPool()
+  loaded_links = {}
+  def _load_link(link_key):
+    """Parses a stored link, i.e. from the link store, or from the session
+    document for links uploaded before there was a link store. """
+    if link_key not in loaded_links:
+      link_str = link_items[link_key].get("link_str")
+      if link_str is not None:
+        link = link_stream.read_link(io.StringIO(link_str), pool=path_pool)
+
+      else:
+        with stored_links.open(link_key) as link_file:
+          link = link_stream.read_link(link_file, pool=path_pool)
+
+      loaded_links[link_key] = link
+    return loaded_links[link_key]
+
+  return link_keys, _load_link
+
+
+def _create_session_layout(session_id, subdocuments, link_keys, load_link,
+    compress, progress=None):
+  """Creates in-toto layout based on the passed session data, i.e. the
+  subdocuments listed in LAYOUT_SUBDOCUMENTS, and the links with passed
+  digests (c.f. `_session_links`). Does not access the request, i.e. can be
+  called outside of a request (c.f. `_run_layout_job`).
+
+  The rules of each step are kept in memory per session, so that only the
+  steps whose link or whose producer links changed since the last call are
+  recreated, and only the changed links are loaded (c.f.
+  create_layout.create_layout_incrementally).
+
+  If a `progress` function is passed, it is called with the number of
+  processed steps and inspections and the number of all steps and
+  inspections.
+
+  FIXME:
+    - Enhance layout creation
+    - Factor out layout creation functionality that's implemented here, e.g. to
+      create_layout.py
+  """
+  inspections = subdocuments["ssc"].get("inspections", [])
+  total = len(link_keys) + len(inspections)
+  step_progress = None
+  if progress is not None:
+    step_progress = lambda done, _: progress(done, total)
+
+  # Create basic layout with steps based on links and simple artifact rules,
+  # reusing the rules of unchanged steps from previous layouts
+  step_cache_lock, step_cache = _get_layout_step_cache(session_id)
+  with step_cache_lock:
+    layout = create_layout.create_layout_incrementally(link_keys, load_link,
+        step_cache, compress=compress, progress=step_progress)
+    _update_layout_step_cache_bytes(session_id, step_cache)
+
+  # Add pubkeys to layout
+  functionary_keyids = {}
+  for functionary in subdocuments["functionaries"].get("items", []):
+    key = functionary.get("key_dict")
+    functionary_name = functionary.get("functionary_name")
+
+    # Check the format of the uploaded public key
+    # TODO: Handle invalid key
+    securesystemslib.formats.PUBLIC_KEY_SCHEMA.check_match(key)
+
+    # Add keys to layout's key store
+    layout.keys[key["keyid"]] = key
+
+    # Add keys to functionary name-keyid map needed below
+    functionary_keyids[functionary_name] = key["keyid"]
+
+  auth_items = subdocuments["authorizing"].get("items", [])
+  auth_dict = _auth_items_to_dict(auth_items)
+
+  # Add authorized functionaries to steps and set functionary threshold
+  for idx in range(len(layout.steps)):
+    step_name = layout.steps[idx].name
+    auth_data = auth_dict.get(step_name)
+
+    for functionary_name in auth_data.get("authorized_functionaries", []):
+      keyid = functionary_keyids.get(functionary_name)
+      if keyid:
+        layout.steps[idx].pubkeys.append(keyid)
+
+    layout.steps[idx].threshold = auth_data.get("threshold")
+
+  # Add inspections to layout
+  for idx, inspection_data in enumerate(inspections):
+    inspection = in_toto.models.layout.Inspection(
+        name=inspection_data["name"],
+        expected_materials=[
+          ["MATCH", "*", "WITH", "PRODUCTS", "FROM", inspection_data["based_on"]]
+        ])
+    inspection.set_run_from_string(inspection_data["cmd"])
+
+    layout.inspect.append(inspection)
+    if progress is not None:
+      progress(len(link_keys) + idx + 1, total)
+
+  layout.validate()
+  return layout
+
+
 # -----------------------------------------------------------------------------
 # NoSQL Helpers
 # -----------------------------------------------------------------------------
@@ -277,18 +842,52 @@ def _auth_items_to_dict(auth_items):
 # no id in the session, all functions redirect to `404` (page not found).
 # This should never happen because all calling views should be decorated with
 # @with_session_id, which ensures that the current session does have an id.
-def _persist_session_subdocument(subdocument):
-  """Update a subdocument (e.g. vcs, ssc, functionaries...) in session document
-  identified by current session id. """
+#
+# Session documents are read and written through the configured session
+# store (c.f. `stored_sessions` and session_store.py). Subdocuments are
+# fetched with projections, i.e. only the requested subdocuments or fields of
+# subdocuments are transferred (c.f. `_get_session_subdocuments`), and cached
+# on `flask.g` for the rest of the request. All writes to the session
+# document go through `_update_session_document`, which drops the cached
+# subdocuments, so that subsequent reads in the same request see the update.
+def _count_store_round_trip():
+  """Increments the number of session store round trips of the current
+  request (c.f. `store_round_trips`). """
+  g.store_round_trips = g.get("store_round_trips", 0) + 1
+
+
+def store_round_trips():
+  """Returns the number of session store round trips of the current request.
+  """
+  return g.get("store_round_trips", 0)
+
+
+def _update_session_document(update, *args):
+  """Updates the session document identified by current session id with the
+  passed update method of the session store (e.g.
+  `stored_sessions.push_items`) and arguments, and invalidates the cached
+  subdocuments and the layouts cached for the session. Returns the result of
+  the update method. Every update increments the session version (c.f.
+  `_get_session_version`). """
   if not session.get("id"):
     abort(404)
 
+  try:
+    _count_store_round_trip()
+    return update(session["id"], *args)
+
+  finally:
+    g.pop("session_doc", None)
+    g.pop("session_fields", None)
+    _drop_cached_layouts(session["id"])
+
+
+def _persist_session_subdocument(subdocument):
+  """Update a subdocument (e.g. vcs, ssc, functionaries...) in session document
+  identified by current session id. """
   # Search session document by session ID in DB and update (replace)
   # subdocument. If the entire document does not exist it is inserted
-  mongo.db.session_collection.update_one(
-    {"_id": session["id"]},
-    {"$set": subdocument},
-    upsert=True)
+  _update_session_document(stored_sessions.set_fields, subdocument)
 
 
 def _persist_session_subdocument_ts(subdocument):
@@ -299,38 +898,122 @@ def _persist_session_subdocument_ts(subdocument):
   _persist_session_subdocument(subdocument)
 
 
-def _get_session_subdocument(key):
-  """Returns a subdocument (e.g. vcs, ssc, functionaries...) identified by
-  passed key from session document identified by current session id.
-  Returns an empty dict if document or subdocument are not found.  """
+def _is_fetched(field, fetched_fields):
+  """Returns whether passed dotted field path is or is part of one of the
+  passed fetched field paths. """
+  return any(field == fetched or field.startswith(fetched + ".")
+      for fetched in fetched_fields)
+
+
+def _get_session_subdocuments(keys):
+  """Returns a dict of the subdocuments (e.g. vcs, ssc, functionaries...)
+  identified by passed keys from session document identified by current
+  session id, fetched in one query. Subdocuments that are not found are
+  returned as empty dicts.
+
+  Keys may also be dotted paths of fields in a subdocument, e.g.
+  "chaining.items.file_name", in which case the returned subdocument (e.g.
+  "chaining") only contains the requested fields. Subdocuments and fields
+  already fetched in the current request are not fetched again.
+
+  NOTE: Don't persist subdocuments that were fetched partially, i.e. with
+  field paths, as this replaces the stored subdocument.
+  """
   if not session.get("id"):
     abort(404)
 
-    # Get session document (use short circuit for default empty dict)
-  session_doc = mongo.db.session_collection.find_one(
-      {"_id": session["id"]})
+  session_doc = g.setdefault("session_doc", {})
+  fetched_fields = g.setdefault("session_fields", set())
+
+  missing = {key for key in keys if not _is_fetched(key, fetched_fields)}
+  # Drop fields of subdocuments that are fetched as a whole, MongoDB does not
+  # allow overlapping paths in a projection
+  missing = {key for key in missing if not _is_fetched(key, missing - {key})}
+
+  if missing:
+    # Fields of subdocuments that were fetched partially before are fetched
+    # again, so that each subdocument is replaced as a whole
+    names = {key.split(".")[0] for key in missing}
+    projection = set(missing)
+    projection.update(field for field in fetched_fields
+        if field.split(".")[0] in names and not _is_fetched(field, missing))
+
+    _count_store_round_trip()
+    result = stored_sessions.find(session["id"], projection)
+    for name in names:
+      session_doc[name] = result.get(name, {})
+
+    fetched_fields.update(missing)
+
+  return {key.split(".")[0]: session_doc[key.split(".")[0]] for key in keys}
 
-  if not session_doc:
-    return {}
 
-  # Get vcs data from session document or empty dict
-  return session_doc.get(key, {})
+def _get_session_version():
+  """Returns the version of the session document identified by current
+  session id, which is incremented with each update, or 0 if there is no
+  session document. """
+  return _get_session_subdocuments(["version"])["version"] or 0
 
 
-def _get_session_document():
-  """Returns the entire session document.
+def _get_session_subdocument(key):
+  """Returns a subdocument (e.g. vcs, ssc, functionaries...) identified by
+  passed key from session document identified by current session id.
   Returns an empty dict if document or subdocument are not found.  """
+  return _get_session_subdocuments([key])[key]
 
-  if not session.get("id"):
-    abort(404)
 
-  session_doc = mongo.db.session_collection.find_one(
-    {"_id": session["id"]})
+def expire_sessions():
+  """Removes the session documents without activity in the last SESSION_TTL
+  seconds from the session store, after writing them to a new archive in
+  SESSION_ARCHIVE_DIR, if set (c.f. session_store.SessionArchive). Does not
+  access the request.
+
+  Returns and logs metrics of the session store, i.e. the number of
+  sessions and their size in bytes after expiry, the number of sessions
+  created since the previous run (or within SESSION_TTL for the first run in
+  this process), the number of expired and archived sessions, and the
+  duration of the run in seconds.
+  """
+  global session_expiry_started
+  ttl = app.config["SESSION_TTL"]
+  with session_expiry_lock:
+    started = time.time()
+    since = session_expiry_started or started - ttl
+    session_expiry_started = started
+
+  expired = archived = 0
+  if ttl and app.config["SESSION_ARCHIVE_DIR"]:
+    with session_store.SessionArchive(
+        app.config["SESSION_ARCHIVE_DIR"]) as archive:
+      expired = stored_sessions.expire(started - ttl, archive=archive)
+    archived = archive.count
+
+  elif ttl:
+    expired = stored_sessions.expire(started - ttl)
+
+  metrics = stored_sessions.stats(since)
+  metrics.update(expired=expired, archived=archived,
+      duration=round(time.time() - started, 3))
+  app.logger.info("Expired sessions: {}".format(json.dumps(metrics,
+      sort_keys=True)))
+
+  return metrics
+
+
+def _run_session_expiry():
+  """Runs `expire_sessions` outside of the request, e.g. in a background
+  thread, and logs errors. """
+  try:
+    expire_sessions()
+
+  except Exception:
+    app.logger.exception("Session expiry failed")
 
-  if not session_doc:
-    return {}
 
-  return session_doc
+@app.cli.command("expire-sessions")
+def expire_sessions_command():
+  """Remove (and archive) sessions without activity within SESSION_TTL. """
+  print(json.dumps(expire_sessions(), sort_keys=True))
 
 
 # -----------------------------------------------------------------------------
@@ -340,33 +1023,83 @@ def with_session_id(wrapped_func):
   """
   Generate new session id if it does not exist.
 
+  The last activity of an existing session is updated in the session store
+  if it was not updated in this session for SESSION_TOUCH_INTERVAL seconds,
+  so that sessions that are only viewed don't expire (c.f.
+  `expire_sessions`).
+
   For now, a user could start a new session on any page
   TODO: Should we redirect to the start page if the session is new?
   """
   @wraps(wrapped_func)
   def decorated_function(*args, **kwargs):
+    now = time.time()
     if not session.get("id"):
       # Security is not paramount, we don't store sensitive data, right?
       session["id"] = uuid.uuid4()
+      session["touched"] = now
       app.logger.info("New session ID '{}'".format(session["id"]))
 
+    elif now - session.get("touched", 0) > app.config[
+        "SESSION_TOUCH_INTERVAL"]:
+      _count_store_round_trip()
+      stored_sessions.touch(session["id"])
+      session["touched"] = now
+
     return wrapped_func(*args, **kwargs)
   return decorated_function
 
 
-@app.after_request
-def ajax_flash_messages(response):
-  """ This function intercepts JSON responses to ajax requests and injects
-  a "messages" field containing flashed messages.
-  To display them the JS callback that receives the response can call
-  show_messages(repsonse.messages).
+def ajax_response(payload=None, status=200):
+  """Returns a JSON response with the passed payload (dict) and status code.
+  For ajax requests a "messages" field containing flashed messages is added
+  to the payload before it is serialized, i.e. the payload is serialized
+  once. To display them the JS callback that receives the response can call
+  show_messages(response.messages).
+
+  Flashed messages are left for the next rendered page if the request is not
+  an ajax request.
   """
+  payload = dict(payload or {})
+  if request.headers.get("X-Requested-With") == "XMLHttpRequest":
+    payload["messages"] = get_flashed_messages(with_categories=True)
+
+  return jsonify(payload), status
 
-  if (request.headers.get("X-Requested-With") == "XMLHttpRequest"  and
-      response.headers.get("Content-Type") == "application/json"):
-    response_data = json.loads(response.get_data())
-    response_data["messages"] = get_flashed_messages(with_categories=True)
-    response.set_data(json.dumps(response_data))
+
+@app.after_request
+def schedule_session_expiry(response):
+  """Starts `expire_sessions` in a background thread, if it did not run in
+  this process for SESSION_EXPIRE_INTERVAL seconds and is not running. """
+  global session_expiry_thread
+  interval = app.config["SESSION_EXPIRE_INTERVAL"]
+  if not interval or not app.config["SESSION_TTL"]:
+    return response
+
+  with session_expiry_lock:
+    due = ((session_expiry_started is None or
+        time.time() - session_expiry_started > interval) and
+        (session_expiry_thread is None or
+        not session_expiry_thread.is_alive()))
+
+    if due:
+      session_expiry_thread = threading.Thread(target=_run_session_expiry,
+          name="session-expiry", daemon=True)
+      session_expiry_thread.start()
+
+  return response
+
+
+@app.after_request
+def log_store_round_trips(response):
+  """Logs the number of session store round trips of the request and, in
+  DEBUG mode, adds them to the response in an "X-Store-Round-Trips" header.
+  """
+  round_trips = store_round_trips()
+  app.logger.debug("{} {}: {} session store round trip(s)".format(
+      request.method, request.path, round_trips))
+  if app.config["DEBUG"]:
+    response.headers["X-Store-Round-Trips"] = str(round_trips)
 
   return response
 
@@ -387,8 +1120,6 @@ def start():
 def vcs():
   """Step 1.
   Enter information about version control system. """
-  options = tooldb.COLLECTION["vcs"]
-
   if request.method == "POST":
     # Grab the form posted vcs commands and persist
     # FIXME: Needs sanitizing
@@ -403,8 +1134,7 @@ def vcs():
     return redirect(url_for("building"))
 
   user_data = _get_session_subdocument("vcs")
-  return render_template("vcs.html", options=options,
-      user_data=user_data)
+  return render_template("vcs.html", user_data=user_data)
 
 
 @app.route("/building", methods=["GET", "POST"])
@@ -412,8 +1142,6 @@ def vcs():
 def building():
   """Step 2.
   Enter information about building. """
-  options = tooldb.COLLECTION["building"]
-
   if request.method == "POST":
     # Grab the form posted building commands and persist
     # FIXME: Needs sanitizing
@@ -428,7 +1156,7 @@ def building():
     return redirect(url_for("quality_management"))
 
   user_data = _get_session_subdocument("building")
-  return render_template("building.html", options=options, user_data=user_data)
+  return render_template("building.html", user_data=user_data)
 
 
 @app.route("/quality", methods=["GET", "POST"])
@@ -436,8 +1164,6 @@ def building():
 def quality_management():
   """Step 3.
   Enter information about quality management. """
-  options = tooldb.COLLECTION["qa"]
-
   if request.method == "POST":
     # Grab the form posted quality management data and persist
     # FIXME: Needs sanitizing
@@ -499,7 +1225,7 @@ def quality_management():
     return redirect(url_for("packaging"))
 
   user_data = _get_session_subdocument("qa")
-  return render_template("quality.html", options=options, user_data=user_data)
+  return render_template("quality.html", user_data=user_data)
 
 
 @app.route("/packaging", methods=["GET", "POST"])
@@ -507,8 +1233,6 @@ def quality_management():
 def packaging():
   """Step 4.
   Enter information about packaging. """
-  options = tooldb.COLLECTION["package"]
-
   if request.method == "POST":
     # Grab the form posted building commands and persist
     # FIXME: Needs sanitizing
@@ -523,7 +1247,7 @@ def packaging():
     return redirect(url_for("software_supply_chain"))
 
   user_data = _get_session_subdocument("package")
-  return render_template("packaging.html", options=options, user_data=user_data)
+  return render_template("packaging.html", user_data=user_data)
 
 
 @app.route("/software-supply-chain", methods=["GET", "POST"])
@@ -574,7 +1298,8 @@ def software_supply_chain():
 
 
   # Query all session data (posted on vcs, building, qa, ... pages)
-  session_data = _get_session_document()
+  session_data = _get_session_subdocuments(["ssc", "vcs", "building", "qa",
+      "package"])
 
   # Query any existing software supply chain data (posted on this page)
   ssc_data = session_data.get("ssc", {})
@@ -642,15 +1367,15 @@ def ajax_upload_key():
     flash("Something went wrong: We don't know which functionary,"
               " this key belongs to", "alert-danger")
 
-    return jsonify({"error": True})
+    return ajax_response({"error": True})
 
   if not functionary_key:
     flash("Something went wrong: No file uploaded", "alert-danger")
-    return jsonify({"error": True})
+    return ajax_response({"error": True})
 
   if functionary_key.filename == "":
     flash("Something went wrong: No file selected", "alert-danger")
-    return jsonify({"error": True})
+    return ajax_response({"error": True})
 
   try:
     # We try to load the public key to check the format
@@ -666,31 +1391,12 @@ def ajax_upload_key():
       "key_dict": key
     }
 
-    # Clumsy update or insert for functionary array embedded subdocument
-    # NOTE: Unfortunately we can't "upsert" on arrays but must first try to
-    # update and if that does not work insert.
-    # https://docs.mongodb.com/manual/reference/operator/update/positional/#upsert
-    # https://stackoverflow.com/questions/23470658/mongodb-upsert-sub-document
-    query_result = mongo.db.session_collection.update_one(
-        {
-          "_id": session["id"],
-          "functionaries.items.functionary_name": functionary_name
-        },
-        {
-          "$set": {"functionaries.items.$": functionary_db_item}
-        })
-
-    if not query_result.matched_count:
-      query_result = mongo.db.session_collection.update_one(
-          {
-            "_id": session["id"],
-            # This query part should deal with concurrent requests
-            "functionaries.items.functionary_name": {"$ne": functionary_name}
-          },
-          {
-            "$push": {"functionaries.items": functionary_db_item}
-          }, upsert=True)
+    # Update or insert the item of the functionary in the functionary array
+    # embedded subdocument
+    replaced = _update_session_document(stored_sessions.put_item,
+        "functionaries.items", "functionary_name", functionary_db_item)
 
+    if not replaced:
       flash("Added key '{fn}' for functionary '{functionary}'"
           .format(fn=file_name, functionary=functionary_name),
           "alert-success")
@@ -699,18 +1405,16 @@ def ajax_upload_key():
           .format(fn=file_name, functionary=functionary_name),
           "alert-success")
 
-    # TODO: Throw more rocks at query_result
-
   except UnicodeDecodeError:
     flash("Could not decode the key. The key contains non-ascii characters.")
-    return jsonify({"error": True})
+    return ajax_response({"error": True})
 
   except Exception as e:
     flash("Could not store uploaded file. Error: {}".format(e),
         "alert-danger")
-    return jsonify({"error": True})
+    return ajax_response({"error": True})
 
-  return jsonify({"error": False})
+  return ajax_response({"error": False})
 
 
 @app.route("/functionaries/remove", methods=["POST"])
@@ -723,21 +1427,18 @@ def ajax_remove_functionary():
   try:
     # Remove the link entry with posted file name in the session
     # document's functionaries.items list
-    query_result = mongo.db.session_collection.update_one(
-        {"_id": session["id"]},
-        {"$pull": {"functionaries.items":
-          {"functionary_name": functionary_name}}})
-    # TODO: Throw rocks at query_result
+    _update_session_document(stored_sessions.pull_items,
+        "functionaries.items", {"functionary_name": functionary_name})
 
   except Exception as e:
     flash("Could not remove functionary '{name}': {e}".format(
         name=functionary_name, e=e), "alert-danger")
-    return jsonify({"error": True})
+    return ajax_response({"error": True})
 
   else:
     flash("Removed functionary '{name}'.".format(
         name=functionary_name), "alert-success")
-    return jsonify({"error": False})
+    return ajax_response({"error": False})
 
 
 @app.route("/authorizing", methods=["GET", "POST"])
@@ -794,14 +1495,13 @@ def authorizing():
       flash("It's time to do a test run of your software supply chain",
           "alert-success")
 
-      query_result = mongo.db.session_collection.update_one(
-          { "_id": session["id"]},
-          {"$set": {"authorizing.items": auth_items,
-            "authorizing.comment": comment}})
+      _update_session_document(stored_sessions.set_fields,
+          {"authorizing.items": auth_items, "authorizing.comment": comment})
       return redirect(url_for("chaining"))
 
   else: # request not POST
-    authorizing = _get_session_subdocument("authorizing")
+    authorizing = _get_session_subdocuments(["authorizing", "functionaries",
+        "ssc.steps"])["authorizing"]
     auth_items = authorizing.get("items", [])
     comment = authorizing.get("comment", "")
 
@@ -809,8 +1509,9 @@ def authorizing():
   # mapping between auth items and steps
   auth_dict = _auth_items_to_dict(auth_items)
 
-  session_functionaries = _get_session_subdocument("functionaries")
-  session_steps = _get_session_subdocument("ssc").get("steps", [])
+  subdocuments = _get_session_subdocuments(["functionaries", "ssc.steps"])
+  session_functionaries = subdocuments["functionaries"]
+  session_steps = subdocuments["ssc"].get("steps", [])
   return render_template("authorizing_functionaries.html",
       functionaries=session_functionaries, steps=session_steps,
       auth_dict=auth_dict, comment=comment)
@@ -827,16 +1528,20 @@ def chaining():
   with ajax (ajax_upload_link).
   """
 
-  chaining = _get_session_subdocument("chaining")
-  steps = _get_session_subdocument("ssc").get("steps", [])
-
   if request.method == "POST":
-    chaining["comment"] = request.form.get("comment", "")
-    _persist_session_subdocument({"chaining": chaining})
+    # Only set the comment, i.e. don't replace the uploaded links
+    _persist_session_subdocument(
+        {"chaining.comment": request.form.get("comment", "")})
 
     flash("And that's basically it... :)", "alert-success")
     return redirect(url_for("wrap_up"))
 
+  # Fetch the names of the uploaded links but not the links
+  subdocuments = _get_session_subdocuments(["chaining.comment",
+      "chaining.items.file_name", "chaining.items.step_name", "ssc.steps"])
+  chaining = subdocuments["chaining"]
+  steps = subdocuments["ssc"].get("steps", [])
+
   return render_template("chaining.html", steps=steps, chaining=chaining)
 
 
@@ -850,77 +1555,120 @@ def ajax_upload_link():
 
   if not uploaded_file:
     flash("Something went wrong: No file uploaded", "alert-danger")
-    return jsonify()
+    return ajax_response()
 
   if uploaded_file.filename == "":
     flash("Something went wrong: No file selected", "alert-danger")
-    return jsonify()
-
-  # The uploaded file might be a tar archive so let's try to unpack it
-  link_file_tuples = []
-  try:
-    link_archive = tarfile.open(fileobj=uploaded_file)
-    for tar_info in link_archive.getmembers():
-      link_file = link_archive.extractfile(tar_info)
-      link_file_tuples.append((tar_info.name, link_file))
-
-  except tarfile.TarError as e:
-    # If that does not work we assume the uploaded file was a link
-    link_file_tuples.append((uploaded_file.filename, uploaded_file))
-
+    return ajax_response()
 
   added_files = []
   msg_type = "alert-success"
-  # Now iterate over all files we have, try to load them as link and
+
+  # Items of stored links, their step names and their messages, that are
+  # not yet added to the session document, and their size
+  link_batch = []
+  link_batch_bytes = 0
+  # [message, category] lists of the uploaded files in upload order, which
+  # are flashed once the links before them are added to the session document,
+  # the messages of batched links are set when the batch is pushed
+  messages = []
+
+  def _push_link_batch():
+    """Pushes the batched link items to the chaining.items array in the
+    session document in one update, and flashes the messages of all files
+    so far in upload order. """
+    nonlocal link_batch, link_batch_bytes, messages
+    if link_batch:
+      try:
+        _update_session_document(stored_sessions.push_items, "chaining.items",
+            [link_db_item for link_db_item, _, _ in link_batch])
+
+      except Exception as e:
+        for link_db_item, _, message in link_batch:
+          message[:] = ["Could not store link '{}': {}".format(
+              link_db_item["file_name"], e), "alert-danger"]
+
+      else:
+        for link_db_item, step_name, message in link_batch:
+          added_files.append(link_db_item["file_name"])
+          message[:] = ["Stored link '{file_name}' for step '{name}'!"
+              .format(file_name=link_db_item["file_name"], name=step_name),
+              "alert-success"]
+
+    for message, category in messages:
+      flash(message, category)
+
+    link_batch = []
+    link_batch_bytes = 0
+    messages = []
+
+  # Now iterate over all files we have, i.e. the uploaded file or the files in
+  # the uploaded tar archive as they are read, try to load them as link and
   # store them to database
-  for link_filename, link_file in link_file_tuples:
-    try:
-      link_metadata_dict = json.loads(link_file.read())
-      link_dict = link_metadata_dict.get("signed")
-      if not isinstance(link_dict, dict):
-        raise ValueError("Wrong metadata format")
-
-      # FIXME: There is a bug in in_toto_mock that causes the returned link
-      # be wrapped twice in a Metablock. The bug is fixed but not yet merged
-      # github.com/in-toto/in-toto/commit/4d34fd914d0a0dfac30eaa7af1590ff53161477e
-      # Let's work around this bug by unwrapping a second time. If it is not
-      # double wrapped we default to parsing a valid Link, as returned e.g. by
-      # in_toto_run
-      link_dict = link_dict.get("signed", link_dict)
-
-      # Instantiate a link object form the link dictionary
-      link = in_toto.models.link.Link.read(link_dict)
-
-      link_db_item = {
-        "step_name": link.name,
-        "file_name": link_filename,
+  try:
+    for link_filename, parsed_link in _iter_parsed_links(
+        _iter_uploaded_link_files(uploaded_file)):
+      try:
+        # Parse and validate the link metadata incrementally, i.e. without
+        # loading the entire file, the parsed JSON and a Link object into
+        # memory, possibly in a worker process
+        # NOTE: There is a bug in in_toto_mock that causes the returned link
+        # be wrapped twice in a Metablock. The bug is fixed but not yet merged
+        # github.com/in-toto/in-toto/commit/4d34fd914d0a0dfac30eaa7af1590ff53161477e
+        # The reader works around this bug by unwrapping a second time. If it
+        # is not double wrapped it defaults to parsing a valid Link, as
+        # returned e.g. by in_toto_run
         # NOTE: We can't store the dict representation of the link, because
-        # MongoDB does not allow dotted keys, e.g. "materials": {"foo.py": {...
-        # hence we store it as canonical json string dump (c.f. Link __repr__)
-        # NOTE: I wonder if we are prone to exceed the max document size
-        # (16 MB) if we store all the session info in one document? Unlikely.
-        "link_str": repr(link)
-      }
+        # MongoDB does not allow dotted keys, e.g. "materials": {"foo.py": ...
+        # hence we store it as canonical json string dump (c.f. Link
+        # __repr__, which is equal to the StreamedLink __repr__)
+        # The digest identifies the link content, i.e. in the link store,
+        # which keeps each distinct link once, and e.g. to reuse the rules
+        # created for an unchanged link (c.f. download_layout)
+        # The canonical link JSON is written to a temporary file while it is
+        # hashed, and copied to the link store from there
+        step_name, link_path, link_digest = parsed_link.result()
+        try:
+          with open(link_path, "rb") as link_file:
+            stored_links.put_file(link_digest, link_file)
+
+        finally:
+          os.remove(link_path)
+
+        # The session document only references the stored link
+        link_db_item = {
+          "step_name": step_name,
+          "file_name": link_filename,
+          "link_digest": link_digest,
+        }
+        link_db_item_bytes = len(bson.encode(link_db_item))
 
-      # Push link item to the chaining.items array in the session document
-      query_result = mongo.db.session_collection.update_one(
-          {"_id": session["id"]},
-          {"$push": {"chaining.items": link_db_item}},
-          upsert=True)
+      except Exception as e:
+        msg_type = "alert-danger"
+        messages.append(["Could not store link '{}': {}".format(
+            link_filename, e), "alert-danger"])
 
-      # TODO: Throw more rocks at query_result
+      else:
+        # Batch link items, to push them to the chaining.items array in the
+        # session document with one update per batch
+        if (link_batch_bytes + link_db_item_bytes >
+            app.config["LINK_UPLOAD_BATCH_BYTES"]):
+          _push_link_batch()
 
-    except Exception as e:
-      msg_type = "alert-danger"
-      flash("Could not store link '{}': {}".format(link_filename, e),
-          "alert-danger")
+        message = [None, None]
+        messages.append(message)
+        link_batch.append((link_db_item, step_name, message))
+        link_batch_bytes += link_db_item_bytes
+        if len(link_batch) >= app.config["LINK_UPLOAD_BATCH_ITEMS"]:
+          _push_link_batch()
 
-    else:
-      added_files.append(link_filename)
-      flash("Stored link '{file_name}' for step '{name}'!"
-          .format(file_name=link_filename, name=link.name), "alert-success")
+  except (tarfile.TarError, ValueError) as e:
+    messages.append(["Could not read link archive '{}': {}".format(
+        uploaded_file.filename, e), "alert-danger"])
+
+  _push_link_batch()
 
-  return jsonify({"files": added_files})
+  return ajax_response({"files": added_files})
 
 
 
@@ -934,21 +1682,19 @@ def ajax_remove_link():
   try:
     # Remove the link entry with posted file name in the session
     # document's chaining.items list
-    res = mongo.db.session_collection.update_one(
-        {"_id": session["id"]},
-        {"$pull": {"chaining.items": {"file_name": link_filename}}})
-    # TODO: Throw rocks at query_result
+    _update_session_document(stored_sessions.pull_items, "chaining.items",
+        {"file_name": link_filename})
 
   except Exception as e:
     flash("Could not remove link file '{link}': '{e}'".format(
           link=link_filename, e=e), "alert-danger")
-    return jsonify({"error": True})
+    return ajax_response({"error": True})
 
   else:
     flash("Removed link file '{link}'".format(
           link=link_filename), "alert-success")
 
-  return jsonify({"error": False})
+  return ajax_response({"error": False})
 
 
 @app.route("/wrap-up")
@@ -962,11 +1708,13 @@ def wrap_up():
    - Per functionary commands (in-toto-run snippet)
    - FIXME: More release instructions
   """
-  functionaries = _get_session_subdocument("functionaries")
-  auth_items = _get_session_subdocument("authorizing").get("items", [])
+  subdocuments = _get_session_subdocuments(["functionaries",
+      "authorizing.items", "ssc.steps"])
+  functionaries = subdocuments["functionaries"]
+  auth_items = subdocuments["authorizing"].get("items", [])
   auth_dict = _auth_items_to_dict(auth_items)
 
-  steps = _get_session_subdocument("ssc").get("steps", [])
+  steps = subdocuments["ssc"].get("steps", [])
   return render_template("wrap_up.html", steps=steps, auth_dict=auth_dict,
       functionaries=functionaries)
 
@@ -977,83 +1725,162 @@ def download_layout():
   """Creates in-toto layout based on session data and uploaded links and
   serves it as file download with a timestamped name.
 
+  Layouts are cached per session version, i.e. until the session is updated,
+  but at most for LAYOUT_CACHE_MAX_AGE seconds, as the layout expires a
+  month after it was created. Layouts are served with a strong ETag, so that
+  repeated downloads are served from the cache, or with "304 Not Modified"
+  to clients that send the ETag in "If-None-Match". Layouts larger than
+  LAYOUT_CACHE_MAX_LAYOUT_BYTES are not cached, but written into the
+  response while they are serialized, without ETag.
 
-  FIXME:
-    - Enhance layout creation
-    - Factor out layout creation functionality that's implemented here, e.g. to
-      create_layout.py
+  A cached layout costs one store round trip, to check the session version.
+  If no layout of the session is cached, the version is fetched together
+  with the subdocuments of the layout.
+
+  If the `compress` parameter is "true", per-artifact rules are collapsed
+  into directory rules where possible (c.f. create_layout.compress_rules).
   """
-  # Iterate over items in ssc session subdocument and create an ordered list
-  # of related link objects retrieved from the chaining session subdocument
-  session_ssc = _get_session_subdocument("ssc")
-  session_chaining = _get_session_subdocument("chaining")
-  links = []
-  for step in session_ssc.get("steps", []):
-    for link_data in session_chaining.get("items", []):
-      if link_data["step_name"] == step["name"]:
-        link_str = json.loads(link_data["link_str"])
-        link = in_toto.models.link.Link.read(link_str)
-
-        links.append(link)
-
-  # Create basic layout with steps based on links and simple artifact rules
-  layout = create_layout.create_layout_from_ordered_links(links)
+  compress = request.args.get("compress") == "true"
+  layout_name = "untitled-" + str(time.time()).replace(".", "") + ".layout"
+  headers = {
+    "Content-Disposition": "attachment; filename={}".format(layout_name)
+  }
 
-  # Add pubkeys to layout
-  functionary_keyids = {}
-  for functionary in _get_session_subdocument("functionaries").get("items", []):
-    key = functionary.get("key_dict")
-    functionary_name = functionary.get("functionary_name")
+  cached_layout = None
+  if _has_cached_layouts(session["id"]):
+    cached_layout = _get_cached_layout((session["id"],
+        _get_session_version(), compress))
+
+  if cached_layout is None:
+    subdocuments = _get_session_subdocuments(LAYOUT_SUBDOCUMENTS +
+        ["version"])
+    cache_key = (session["id"], subdocuments.pop("version") or 0, compress)
+    link_keys, load_link = _session_links(subdocuments)
+    layout = _create_session_layout(session["id"], subdocuments, link_keys,
+        load_link, compress)
+    layout_metadata = in_toto.models.metadata.Metablock(signed=layout)
+
+    # Serialize the layout, until it turns out too large to be cached
+    layout_chunks = (chunk.encode("utf-8") for chunk in
+        layout_stream.iter_metablock_json(layout_metadata))
+    serialized_chunks = []
+    serialized_bytes = 0
+    for chunk in layout_chunks:
+      serialized_chunks.append(chunk)
+      serialized_bytes += len(chunk)
+      if serialized_bytes > app.config["LAYOUT_CACHE_MAX_LAYOUT_BYTES"]:
+        # Stream layout to user as it is serialized (c.f. layout_stream.py)
+        return Response(itertools.chain(serialized_chunks, layout_chunks),
+            mimetype="application/json", headers=headers)
+
+    layout_bytes = b"".join(serialized_chunks)
+    cached_layout = (hashlib.sha256(layout_bytes).hexdigest(), layout_bytes,
+        time.time())
+    _cache_layout(cache_key, cached_layout)
+
+  etag, layout_bytes, _ = cached_layout
+  response = Response(layout_bytes, mimetype="application/json",
+      headers=headers)
+  response.set_etag(etag)
+  return response.make_conditional(request)
+
+
+@app.route("/preflight-layout")
+@with_session_id
+def preflight_layout():
+  """Creates the same layout as `download_layout` and checks whether the
+  uploaded links pass its artifact rules, without signatures (c.f.
+  preflight.preflight_layout). Returns a JSON report with pass/fail and the
+  artifacts consumed by each rule per step.
+  """
+  subdocuments = _get_session_subdocuments(LAYOUT_SUBDOCUMENTS)
+  link_keys, load_link = _session_links(subdocuments)
+  layout = _create_session_layout(session["id"], subdocuments, link_keys,
+      load_link, request.args.get("compress") == "true")
 
-    # Check the format of the uploaded public key
-    # TODO: Handle invalid key
-    securesystemslib.formats.PUBLIC_KEY_SCHEMA.check_match(key)
+  # The steps of the layout are in the order of the links
+  links = {}
+  for step, link_key in zip(layout.steps, link_keys):
+    links[step.name] = load_link(link_key)
 
-    # Add keys to layout's key store
-    layout.keys[key["keyid"]] = key
+  return ajax_response(preflight.preflight_layout(layout, links))
 
-    # Add keys to functionary name-keyid map needed below
-    functionary_keyids[functionary_name] = key["keyid"]
 
-  auth_items = _get_session_subdocument("authorizing").get("items", [])
-  auth_dict = _auth_items_to_dict(auth_items)
+@app.route("/layout-jobs", methods=["POST"])
+@with_session_id
+def ajax_create_layout_job():
+  """Queues the creation of the same layout as `download_layout` on a
+  background thread, e.g. for layouts that take too long to be created within
+  one request, and returns the job id and status at once (202 Accepted).
 
-  # Add authorized functionaries to steps and set functionary threshold
-  for idx in range(len(layout.steps)):
-    step_name = layout.steps[idx].name
-    auth_data = auth_dict.get(step_name)
+  The session data is read in this request, i.e. updates after the job was
+  created are not part of the layout. The progress is reported by
+  `layout_job_status` and the layout is served by `download_layout_job`.
 
-    for functionary_name in auth_data.get("authorized_functionaries", []):
-      keyid = functionary_keyids.get(functionary_name)
-      if keyid:
-        layout.steps[idx].pubkeys.append(keyid)
+  Returns "429 Too Many Requests" if there are too many pending jobs (c.f.
+  `_add_layout_job`).
+  """
+  compress = request.form.get("compress",
+      request.args.get("compress")) == "true"
 
-    layout.steps[idx].threshold = auth_data.get("threshold")
+  subdocuments = _get_session_subdocuments(LAYOUT_SUBDOCUMENTS)
+  link_keys, load_link = _session_links(subdocuments)
 
-  # Add inspections to layout
-  inspections = session_ssc.get("inspections", [])
-  for inspection_data in inspections:
-    inspection = in_toto.models.layout.Inspection(
-        name=inspection_data["name"],
-        expected_materials=[
-          ["MATCH", "*", "WITH", "PRODUCTS", "FROM", inspection_data["based_on"]]
-        ])
-    inspection.set_run_from_string(inspection_data["cmd"])
+  job = _LayoutJob(session["id"])
+  if not _add_layout_job(job):
+    flash("Too many layouts are being created, please try again when your"
+        " pending layouts are done", "alert-warning")
+    return ajax_response({"error": True}, 429)
 
-    layout.inspect.append(inspection)
+  _get_layout_job_executor().submit(_run_layout_job, job, subdocuments,
+      link_keys, load_link, compress)
+
+  return ajax_response(job.to_dict(), 202)
+
+
+@app.route("/layout-jobs/<job_id>")
+@with_session_id
+def layout_job_status(job_id):
+  """Returns the status and progress, i.e. the number of processed and of all
+  steps and inspections, of a layout job of the current session. """
+  return ajax_response(_get_layout_job(job_id).to_dict())
+
+
+@app.route("/layout-jobs/<job_id>/download")
+@with_session_id
+def download_layout_job(job_id):
+  """Serves the layout of a finished layout job of the current session as
+  file download with a timestamped name, or returns the job status with
+  "409 Conflict" if the job is not done. """
+  job = _get_layout_job(job_id)
+  if job.status != "done":
+    return ajax_response(job.to_dict(), 409)
+
+  # Open the layout while the job is registered, i.e. before it can be
+  # dropped. Dropping the job then only removes the name of the open file.
+  with layout_jobs_lock:
+    if job.job_id not in layout_jobs:
+      abort(404)
+    layout_file = open(job.path, "rb")
 
-  layout.validate()
   layout_name = "untitled-" + str(time.time()).replace(".", "") + ".layout"
+  return send_file(layout_file, mimetype="application/json",
+      as_attachment=True, download_name=layout_name)
 
-  layout_metadata = in_toto.models.metadata.Metablock(signed=layout)
 
-  # Dump layout to memory file and server to user
-  layout_fp = io.BytesIO()
-  layout_fp.write("{}".format(layout_metadata).encode("utf-8"))
-  layout_fp.seek(0)
-  return send_file(layout_fp,
-      mimetype="application/json", as_attachment=True,
-      attachment_filename=layout_name)
+@app.route("/tools/search")
+def ajax_search_tools():
+  """Searches the tool collection (c.f. tooldb.ToolIndex.search), e.g. to load
+  the options of the vcs, building, qa and package pages (c.f.
+  `load_tool_options` in main.js), by the `q`, `category`, `prog_lang` and
+  `type` parameters, one page at a time (`offset` and `limit` parameters).
+  """
+  return ajax_response(tooldb.INDEX.search(query=request.args.get("q", ""),
+      category=request.args.get("category"),
+      prog_lang=request.args.get("prog_lang"),
+      type=request.args.get("type"),
+      offset=request.args.get("offset", 0, type=int),
+      limit=request.args.get("limit", tooldb.MAX_LIMIT, type=int)))
 
 
 @app.route("/guarantees")